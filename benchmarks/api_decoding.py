@@ -0,0 +1,111 @@
+"""
+Compares the CPU time spent handling a playlistItems page before and after decoding changes in YoutubeObject.get:
+- before: the full response, decoded with response.json() once per use (5 times for a successful page)
+- after: the partial response requested with FIELDS, decoded once with the decoder used by http_client.decode
+
+Usage:
+    PYTHONPATH=. python benchmarks/api_decoding.py [--pages recorded_pages/*.json]
+
+Recorded pages should be full playlistItems responses, eg saved from
+https://www.googleapis.com/youtube/v3/playlistItems?part=snippet&maxResults=50&playlistId=<uploads id>&key=<key>
+Without recordings, synthetic pages of 50 items with 2000 character descriptions are used.
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("six_degrees_of_youtube_db_dsn", "sqlite://")
+# Nothing reaches the API, but the key is read on import
+os.environ.setdefault("YOUTUBE_API_KEYS", "unused")
+
+from src.controllers import http_client  # noqa
+from src.models.youtube_object import MAX_RESULTS  # noqa
+
+# Decodes in YoutubeObject.get before: debug log, 'items' check, len(items), items and nextPageToken
+DECODES_BEFORE = 5
+
+
+def synthetic_page(page: int) -> dict:
+    thumbnail_sizes = {'default': 120, 'medium': 320, 'high': 480, 'standard': 640, 'maxres': 1280}
+    return {
+        'kind': 'youtube#playlistItemListResponse',
+        'etag': 'etag',
+        'nextPageToken': f'token{page + 1}',
+        'pageInfo': {'totalResults': 5000, 'resultsPerPage': MAX_RESULTS},
+        'items': [{
+            'kind': 'youtube#playlistItem',
+            'etag': f'etag{page}_{i}',
+            'id': f'UExpZ{page:05}{i:05}',
+            'snippet': {
+                'publishedAt': '2021-03-04T17:00:11Z',
+                'channelId': 'UCo3AxjxePfj6DHn03aiIhww',
+                'title': f'Video {page}-{i} (@Violet Orlandi ft. @Halocene)',
+                'description': ('Listen on https://www.youtube.com/c/VioletOrlandi and https://youtu.be/53XW1xxmmuM \n' * 25)[:2000],
+                'thumbnails': {size: {'url': f'https://i.ytimg.com/vi/{page}{i}/{size}.jpg', 'width': width, 'height': width * 9 // 16}
+                               for size, width in thumbnail_sizes.items()},
+                'channelTitle': 'Violet Orlandi',
+                'playlistId': 'UUo3AxjxePfj6DHn03aiIhww',
+                'position': page * MAX_RESULTS + i,
+                'resourceId': {'kind': 'youtube#video', 'videoId': f'video{page:05}{i:05}'},
+                'videoOwnerChannelTitle': 'Violet Orlandi',
+                'videoOwnerChannelId': 'UCo3AxjxePfj6DHn03aiIhww',
+            }
+        } for i in range(MAX_RESULTS)]
+    }
+
+
+def partial(page: dict) -> dict:
+    """Reduce a full page to what the API returns for FIELDS['playlistItems']"""
+    keep = ('resourceId', 'channelId', 'title', 'description', 'publishedAt')
+    return {
+        'nextPageToken': page.get('nextPageToken'),
+        'items': [{'snippet': {**{k: item['snippet'][k] for k in keep},
+                               'thumbnails': {'medium': {'url': item['snippet']['thumbnails']['medium']['url']}}}}
+                  for item in page['items']]
+    }
+
+
+def cpu_time(func, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', nargs='*', help="Recorded playlistItems responses")
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, 'rb') as page_file:
+                pages.append(json.load(page_file))
+    else:
+        pages = [synthetic_page(i) for i in range(10)]
+    full_bodies = [json.dumps(page).encode() for page in pages]
+    partial_bodies = [json.dumps(partial(page)).encode() for page in pages]
+
+    def before():
+        for body in full_bodies:
+            for _ in range(DECODES_BEFORE):
+                json.loads(body)
+
+    def after():
+        for body in partial_bodies:
+            http_client.loads(body)
+
+    print(f"Decoder: {http_client.loads.__module__}")
+    print(f"Average page size: full {sum(map(len, full_bodies)) // len(pages)} bytes, "
+          f"partial {sum(map(len, partial_bodies)) // len(pages)} bytes")
+    before_ms = cpu_time(before, args.repeat) / len(pages)
+    after_ms = cpu_time(after, args.repeat) / len(pages)
+    print(f"CPU per page: before {before_ms:.3f}ms, after {after_ms:.3f}ms, saved {before_ms - after_ms:.3f}ms "
+          f"({before_ms / after_ms:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,17 @@ sudo amazon-linux-extras install docker -y
 sudo service docker start
 sudo usermod -a -G docker ec2-user
 
+# Runs the crawls queued by the app, detached so the app is started below
+docker run -d \
+  --restart=always \
+  --log-driver=awslogs \
+  --log-opt awslogs-region="${aws_region}" \
+  --log-opt awslogs-create-group=true \
+  --log-opt awslogs-group="six-degrees-of-youtube/${docker_tag}/ec2" \
+  --log-opt awslogs-stream="$(curl -s http://169.254.169.254/latest/meta-data/instance-id)-worker" \
+  cookiehook/six-degrees-of-youtube:${docker_tag} \
+  pipenv run python -m src.worker
+
 docker run \
   -p 5000:5000 \
   --restart=always \
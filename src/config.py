@@ -0,0 +1,54 @@
+import os
+
+# Number of threads used to fan out the guest discovery, uploads and collaboration phases of a crawl
+crawl_workers = int(os.getenv("CRAWL_WORKERS", 16))
+
+# Maximum number of rendered graphs kept in the graph cache before the least recently used are evicted
+graph_cache_size = int(os.getenv("GRAPH_CACHE_SIZE", 500))
+
+# Seconds to wait for a connection to, and then a response from, the Youtube API and website
+http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+http_read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+
+# Number of keep-alive connections held open per host. Should be at least crawl_workers, or connections are discarded after use
+http_pool_size = int(os.getenv("HTTP_POOL_SIZE", crawl_workers))
+
+# Retries for transient API and website failures (connection errors, timeouts, 429 and 5xx responses).
+# Delays double from http_backoff_base seconds on each retry, up to http_backoff_max, with random jitter.
+http_max_retries = int(os.getenv("HTTP_MAX_RETRIES", 4))
+http_backoff_base = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))
+http_backoff_max = float(os.getenv("HTTP_BACKOFF_MAX", 30))
+
+# Maximum retries across all requests made for a single crawl, so an outage doesn't stall a crawl for hours
+crawl_retry_budget = int(os.getenv("CRAWL_RETRY_BUDGET", 200))
+
+# Number of youtube.com pages fetched at once to resolve URLs from video descriptions, in total and per host
+url_resolver_workers = int(os.getenv("URL_RESOLVER_WORKERS", 8))
+url_resolver_host_limit = int(os.getenv("URL_RESOLVER_HOST_LIMIT", 4))
+
+# Hours that a URL, username, video ID or search term which found nothing is remembered, before it's looked up again.
+# Once negative_cache_size entries are stored, those closest to expiring are dropped first.
+negative_cache_ttl_hours = float(os.getenv("NEGATIVE_CACHE_TTL_HOURS", 24 * 7))
+negative_cache_size = int(os.getenv("NEGATIVE_CACHE_SIZE", 100000))
+
+# A crawled channel is served from the cache without refreshing for refresh_after_minutes. After that, it's served from
+# the cache while it's refreshed in the background, until it's serve_stale_hours old, when requests wait for a crawl instead.
+refresh_after_minutes = float(os.getenv("REFRESH_AFTER_MINUTES", 15))
+serve_stale_hours = float(os.getenv("SERVE_STALE_HOURS", 24 * 7))
+
+# Crawls requested from the web app are queued for a worker (python -m src.worker), which polls every crawl_job_poll_seconds.
+# Workers update their job every crawl_job_heartbeat_seconds. Running jobs not updated for crawl_job_timeout_minutes
+# are assumed to have lost their worker, and are resumed by another.
+crawl_job_poll_seconds = float(os.getenv("CRAWL_JOB_POLL_SECONDS", 1))
+crawl_job_heartbeat_seconds = float(os.getenv("CRAWL_JOB_HEARTBEAT_SECONDS", 30))
+crawl_job_timeout_minutes = float(os.getenv("CRAWL_JOB_TIMEOUT_MINUTES", 5))
+
+# Minutes before the in-memory index of cached channel titles is rebuilt, to pick up channels cached by other processes
+title_index_refresh_minutes = float(os.getenv("TITLE_INDEX_REFRESH_MINUTES", 10))
+
+# Trigram similarity, from 0 to 1, at which a cached channel's title is taken to be a misspelling of a requested name,
+# instead of searching the API. 0.3 is pg_trgm's default, which is too loose to trust without a person confirming the match.
+title_similarity_threshold = float(os.getenv("TITLE_SIMILARITY_THRESHOLD", 0.6))
+
+# Units of API quota each process reserves from a key at once, then counts against locally, to save a database update per call
+api_quota_block_units = int(os.getenv("API_QUOTA_BLOCK_UNITS", 50))
@@ -0,0 +1,44 @@
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from src import config
+
+logger = logging.getLogger()
+
+# Shared by all requests, so the number of concurrent crawl tasks (and DB connections) is bounded per process
+executor = ThreadPoolExecutor(max_workers=config.crawl_workers, thread_name_prefix="crawl")
+
+
+def get_chunks(data, n):
+    """
+    Split a list into at most n interleaved chunks, omitting any that would be empty.
+
+    :param data: list to split
+    :param n: maximum number of chunks
+    :return: list of lists
+    """
+    return [data[i::n] for i in range(n) if data[i::n]]
+
+
+def _run_in_app_context(app, func, args):
+    # Each worker thread needs its own app context, which gives it its own scoped DB session
+    with app.app_context():
+        return func(*args)
+
+
+def run_parallel(func, args_list) -> list:
+    """
+    Run func once for each set of arguments on the crawl executor, and wait for all results.
+    Results are returned in the same order as the arguments.
+    Each call runs in a copy of the caller's context, so context variables such as the crawl's retry budget carry over.
+
+    :param func: function to call
+    :param args_list: iterable of argument lists, one per call
+    :return: list of results
+    """
+    app = current_app._get_current_object()
+    futures = [executor.submit(contextvars.copy_context().run, _run_in_app_context, app, func, args) for args in args_list]
+    return [f.result() for f in futures]
@@ -1,28 +1,85 @@
+import contextvars
+import datetime
 import logging
-import multiprocessing as mp
 
-import requests
-from flask import url_for
 from flask_sqlalchemy_session import current_session
 from requests import HTTPError
+from sqlalchemy import inspect
 from sqlalchemy.exc import IntegrityError
 
-from src import gunicorn_conf
+from src import config
+from src.controllers import http_client, link_extractor, title_index
+from src.controllers.crawler import get_chunks, run_parallel
 from src.controllers.exceptions import ChannelNotFoundException, YoutubeAuthenticationException
 from src.models.channel import Channel
 from src.models.collaboration import Collaboration
+from src.models.collaboration_edge import CollaborationEdge
+from src.models.crawl_job import CrawlJob
+from src.models.data_version import DataVersion
 from src.models.history import History
+from src.models.negative_result import NegativeResult
 from src.models.search import SearchResult
 from src.models.video import Video
+from src.models.video_mention import VideoMention
 
 logger = logging.getLogger()
 
+# ID of the CrawlJob being run, set by the worker. Progress is only recorded for crawls run as jobs.
+current_job = contextvars.ContextVar('current_job', default=None)
 
-def get_chunks(data, n):
-    return [data[i::n] for i in range(n)]
+
+def get_cached_channel(channel_name: str) -> Channel:
+    """
+    Get a channel whose collaborations are ready to draw, if a recent crawl is cached.
+    Channels crawled within config.serve_stale_hours are returned straight from the cache. If the crawl is older
+    than config.refresh_after_minutes, the channel is also re-crawled in the background, for the next request.
+
+    :param channel_name: Name of channel, as shown on the Youtube webpage.
+    :return: Channel instance for the crawled channel, or None if it needs crawling first.
+    """
+    try:
+        cached = get_target_channel(channel_name, cache_only=True)
+    except ChannelNotFoundException:
+        return
+    if not cached or not cached.processed or not cached.refreshed_at:
+        return
+
+    age = datetime.datetime.utcnow() - cached.refreshed_at
+    if age >= datetime.timedelta(hours=config.serve_stale_hours):
+        return
+    if age >= datetime.timedelta(minutes=config.refresh_after_minutes):
+        refresh_in_background(cached, channel_name)
+    logger.info(f"Serving channel '{cached}' from cache, last crawled {age} ago")
+    History.add(cached)
+    return cached
+
+
+def get_previous_channel(channel_name: str) -> Channel:
+    """
+    Get the cached channel whose graph the user navigated from, matching its name as get_target_channel does.
+
+    :param channel_name: Name of channel, as passed in the previous_channel parameter
+    :return: Channel instance, or None if no cached channel matches
+    """
+    try:
+        return get_target_channel(channel_name, cache_only=True)
+    except ChannelNotFoundException:
+        return
 
 
-def get_collaborations_for_channel(channel_name: str, previous_channel_name: str) -> list:
+def refresh_in_background(channel: Channel, channel_name: str):
+    """
+    Queue a crawl of the channel for a worker, unless one is already queued or running.
+    The job is keyed on the channel's ID as well as its name, as the same channel may be requested by different names.
+
+    :param channel: Channel instance to refresh
+    :param channel_name: Name the channel was requested by, as shown on the Youtube webpage.
+    """
+    job = CrawlJob.enqueue(channel_name, channel_id=channel.id)
+    logger.info(f"Refreshing channel '{channel}' in the background, in crawl job '{job}'")
+
+
+def crawl_channel(channel_name: str, record_history: bool = True) -> Channel:
     """
     Identifies all collaborations that a particular channel has made by parsing tags and hyperlinks
     in all videos uploaded by that channel. A collaboration instance is created for each.
@@ -32,199 +89,353 @@ def get_collaborations_for_channel(channel_name: str, previous_channel_name: str
     Therefore one video may be referenced in several collaborations
 
     :param channel_name: Name of channel to parse, as shown on the Youtube webpage.
-    :return: list of Collaboration objects.
+    :param record_history: Default True. If False, the crawl doesn't count towards the channel's popularity.
+    :return: Channel instance for the crawled channel.
     """
-    target_channel = get_target_channel(channel_name)
-    logger.info(f"Found target channel '{target_channel}'")
-    try:
-        # Get list of collaborators present in target channel's uploads (including target channel)
-        host_videos = [v.id for v in Video.from_channel(target_channel)]
-
-        if host_videos:
-            pool = mp.get_context("spawn").Pool(gunicorn_conf.threads)  # Only instantiate pool if there's work to do, as it's expensive
-
-            logger.info(f"Retrieving guest channels for {target_channel}")
-            guest_channels = {target_channel.id}
-            host_videos_chunks = get_chunks(host_videos, gunicorn_conf.threads)
-            starmap_args = [[url_for('graph.get_collaborators_for_videos', _external=True, _scheme="https"), list]
-                            for list in host_videos_chunks]
-            for result in pool.starmap(request_guest_channels_for_video, starmap_args):
-                guest_channels.update(result)
-
-            # Get all videos uploaded by all collaborators (including target channel)
-            logger.info(f"Retrieving all videos for {target_channel}")
-            all_videos = []
-            starmap_args = [[url_for('graph.get_uploads_for_channel', _external=True, _scheme="https"), c]
-                            for c in guest_channels]
-            for result in pool.starmap(request_videos_for_channel, starmap_args):
-                all_videos.extend(result)
-
-            # Calculate all collaborations between collaborators (including target channel)
-            if all_videos:
-                logger.info(f"Calculating collaborations for {target_channel}")
-                all_videos_chunks = get_chunks(all_videos, gunicorn_conf.threads)
-                starmap_args = [[url_for('graph.process_collaborations', _external=True, _scheme="https"), target_channel.id, videos]
-                                for videos in all_videos_chunks]
-                pool.starmap(request_process_collaborations, starmap_args)
-            logger.info(f"Finished processing channel {target_channel}")
-            target_channel.processed = True
+    with http_client.crawl_retry_budget():
+        target_channel = get_target_channel(channel_name)
+        logger.info(f"Found target channel '{target_channel}'")
+        try:
+            # Get list of collaborators present in target channel's uploads (including target channel)
+            host_videos = Video.ids_from_channel(target_channel)
+            # A resumed job has already found the guests, and may have processed some of their videos since
+            job_id = current_job.get()
+            guest_channels = CrawlJob.saved_guests(job_id) if job_id else None
+            resumed = bool(guest_channels)
+
+            if host_videos or guest_channels:
+                if not guest_channels:
+                    logger.info(f"Retrieving guest channels for {target_channel}")
+                    start_phase(CrawlJob.GUEST_DISCOVERY, len(host_videos))
+                    guest_channels = {target_channel.id}
+                    host_videos_chunks = get_chunks(host_videos, config.crawl_workers)
+                    for result in run_parallel(get_guest_channels_for_videos, [[chunk] for chunk in host_videos_chunks]):
+                        guest_channels.update(result)
+                    if job_id:
+                        CrawlJob.save_guests(job_id, guest_channels)
+
+                # Get all videos uploaded by all collaborators (including target channel)
+                logger.info(f"Retrieving all videos for {target_channel}")
+                start_phase(CrawlJob.UPLOADS)
+                all_videos = []
+                for result in run_parallel(get_uploads_for_channel, [[c] for c in guest_channels]):
+                    all_videos.extend(result)
+
+                # Calculate all collaborations between collaborators (including target channel)
+                if all_videos:
+                    logger.info(f"Calculating collaborations for {target_channel}")
+                    start_phase(CrawlJob.COLLABORATIONS, len(all_videos))
+                    if resumed:
+                        # Each chunk's videos are marked processed in the same transaction as their collaborations,
+                        # so videos marked by an earlier run of the job are done, even if the channel isn't processed yet
+                        processed = Video.processed_ids(set(all_videos), target_channel)
+                        all_videos = [video_id for video_id in all_videos if video_id not in processed]
+                        add_progress(len(processed))
+                    all_videos_chunks = get_chunks(all_videos, config.crawl_workers)
+                    run_parallel(populate_collaborations, [[target_channel.id, chunk] for chunk in all_videos_chunks])
+                logger.info(f"Finished processing channel {target_channel}")
+                target_channel.processed = True
+            # Even with no new uploads, the crawl shows the cache is up to date
+            target_channel.refreshed_at = datetime.datetime.utcnow()
             current_session.commit()
-        History.add(target_channel)
-    except YoutubeAuthenticationException as e:
-        if len(Video.from_channel(target_channel, cache_only=True)) > 0:
-            logger.warning(f"Encountered authentication error whilst processing channel '{channel_name}' - {e}")
-            logger.warning("Some videos already present, returning collaborations from cache")
-        else:
-            raise
-
-    if previous_channel_name:
-        previous_channel = Channel.from_title(previous_channel_name)
-        return Collaboration.for_target_channel(target_channel) + Collaboration.for_target_channel(previous_channel)
-    else:
-        return Collaboration.for_target_channel(target_channel)
+            if record_history:
+                History.add(target_channel)
+        except YoutubeAuthenticationException as e:
+            if len(Video.from_channel(target_channel, cache_only=True)) > 0:
+                logger.warning(f"Encountered authentication error whilst processing channel '{channel_name}' - {e}")
+                logger.warning("Some videos already present, returning collaborations from cache")
+            else:
+                raise
+    return target_channel
+
+
+def start_phase(phase: str, videos_total: int = None):
+    """
+    Record the phase the current crawl is starting, if it's running as a job.
 
+    :param phase: Phase the crawl is starting, eg: CrawlJob.UPLOADS
+    :param videos_total: Default None. Number of videos the phase will process, if it's known up front.
+    """
+    if job_id := current_job.get():
+        CrawlJob.start_phase(job_id, phase, videos_total)
 
-def request_videos_for_channel(url, channel_id):
-    resp = requests.post(url, json={'channel': channel_id})
-    return resp.json()['videos']
 
+def add_progress(videos_done: int):
+    """
+    Count videos processed in the current phase of the current crawl, if it's running as a job.
 
-def request_guest_channels_for_video(url, videos):
-    resp = requests.post(url, json={'videos': videos})
-    return resp.json()['channels']
+    :param videos_done: Number of videos processed since the last update
+    """
+    if job_id := current_job.get():
+        CrawlJob.add_progress(job_id, videos_done)
 
 
-def request_process_collaborations(url, target_channel, videos):
-    requests.post(url, json={'videos': videos, 'target_channel': target_channel})
+def get_collaborations_for_channel(target_channel: Channel, previous_channel: Channel = None) -> list:
+    """
+    Retrieve the collaborations to draw for a channel that has been crawled, and the channel the user navigated from.
+
+    :param target_channel: Channel instance for the crawled channel
+    :param previous_channel: Channel instance for the channel whose graph the user navigated from, or None.
+    :return: list of CollaborationEdge objects, counting the collaborations between each pair of channels.
+    """
+    if previous_channel:
+        return CollaborationEdge.for_target_channel(target_channel) + CollaborationEdge.for_target_channel(previous_channel)
+    else:
+        return CollaborationEdge.for_target_channel(target_channel)
 
 
-def get_target_channel(channel_name: str) -> Channel:
+def get_target_channel(channel_name: str, cache_only: bool = False) -> Channel:
     """
     Get Channel object matching the given name.
+    Unless a cached search has an exact match, the name is first looked up in the title index. So other spellings
+    of a known channel's title, eg: 'violet orlandi', don't cost a search, if no other channel shares the spelling.
+    If a search finds no channel with the exact name, the closest known title is used instead, as the name may
+    be a typo. This is only done after searching, as a similar title may belong to a different channel.
 
     :param channel_name: Name of channel, as seen on Youtube webpage
-    :return: Channel instance for that channel
+    :param cache_only: Default False. If True, only search the cache.
+    :return: Channel instance for that channel, or None if cache_only and the channel isn't cached
     :raises: ChannelNotFoundException if the channel can't be found.
     """
+    index = title_index.get_index()
+    cached_searches = SearchResult.from_term(channel_name, cache_only=True) or []
+    if not any(s.title == channel_name for s in cached_searches) and (channel_id := index.normalised_match(channel_name)):
+        if channel := Channel.from_id(channel_id, cache_only=cache_only):
+            return channel
     try:
-        searches = SearchResult.from_term(channel_name)
-        match = [s for s in searches if s.title == channel_name]
-        if not match:
-            raise ChannelNotFoundException(channel_name)
+        searches = cached_searches or SearchResult.from_term(channel_name, cache_only=cache_only) or []
     except HTTPError:
         raise ChannelNotFoundException(channel_name)
-    return Channel.from_id(match[0].id)
+    if match := [s for s in searches if s.title == channel_name]:
+        return Channel.from_id(match[0].id, cache_only=cache_only)
+    if searches and (channel_id := index.closest(channel_name)) and (channel := Channel.from_id(channel_id, cache_only=cache_only)):
+        logger.info(f"No channel is titled '{channel_name}', using closest match '{channel}'")
+        return channel
+    raise ChannelNotFoundException(channel_name)
 
 
 def get_channels_from_description(video: Video, cache_only=False) -> set:
     """
     Retrieve set of Channel objects for all channels referenced in
     the given video description.
-    On occasion, 2 threads will identify the same channel, and raise an IntegrityError
-    Ignoring this isn't a problem as we're working with sets. The first write is all we need.
 
     :param video: Video to parse
     :param cache_only: Default False. If True, only search the cache.
     :return: set of Channel objects for referenced channels
     """
-    channels = set()
+    return get_channels_from_descriptions([video], cache_only=cache_only)[video.id]
 
-    for channel_id in video.get_channel_ids_from_description():
-        try:
-            if channel_by_id := Channel.from_id(channel_id, cache_only=cache_only):
-                channels.update([channel_by_id])
-        except HTTPError as err:
-            logger.error(f"Failed processing channel ID '{channel_id}' from video '{video}' - {err}")
-        except IntegrityError:
-            current_session.rollback()
-
-    for username in video.get_users_from_description():
-        try:
-            if channel_by_name := Channel.from_username(username, cache_only=cache_only):
-                channels.update([channel_by_name])
-        except HTTPError as err:
-            logger.error(f"Failed processing username '{username}' from video '{video}' - {err}")
-        except IntegrityError:
-            current_session.rollback()
-
-    for video_id in video.get_video_ids_from_description():
-        try:
-            if linked_video := Video.from_id(video_id, cache_only=cache_only):
-                if channel_by_vid := Channel.from_id(linked_video.channel_id, cache_only=cache_only):
-                    channels.update([channel_by_vid])
-        except HTTPError as err:
-            logger.error(f"Failed processing video ID '{video_id}' from video '{video}' - {err}")
-        except IntegrityError:
-            current_session.rollback()
-
-    for url in video.get_urls_from_description():
-        try:
-            if channel_by_url := Channel.from_url(url, cache_only=cache_only):
+
+def get_channels_from_descriptions(videos: list, cache_only=False) -> dict:
+    """
+    Retrieve the Channel objects for all channels referenced in each of the given video descriptions.
+    The links in each description are extracted once, when the video is cached, and loaded in bulk here.
+    Linked videos and channel IDs are resolved for the whole list at once, to make use of the API's multi-ID lookups.
+    Uncached URLs are also resolved together, visiting their pages concurrently.
+    On occasion, 2 threads will identify the same channel, and raise an IntegrityError
+    Ignoring this isn't a problem as we're working with sets. The first write is all we need.
+
+    :param videos: list of Videos to parse
+    :param cache_only: Default False. If True, only search the cache.
+    :return: dict of video ID to set of Channel objects for referenced channels
+    """
+    links = Video.links_for(videos)
+
+    def linked(video, kind):
+        return {link.value for link in links[video.id] if link.kind == kind}
+
+    linked_video_ids = {video.id: linked(video, link_extractor.VIDEO_ID) for video in videos}
+    linked_videos = Video.from_ids(set().union(*linked_video_ids.values()), cache_only=cache_only)
+
+    # Channels linked directly by ID, and the uploaders of any linked videos, are all resolved in one bulk lookup
+    linked_channel_ids = {}
+    for video in videos:
+        linked_channel_ids[video.id] = linked(video, link_extractor.CHANNEL_ID)
+        linked_channel_ids[video.id].update(linked_videos[v].channel_id for v in linked_video_ids[video.id] if v in linked_videos)
+    channels_by_id = Channel.from_ids(set().union(*linked_channel_ids.values()), cache_only=cache_only)
+
+    # Usernames and URLs are looked up in the cache in bulk. Only misses are fetched individually,
+    # skipping usernames which recently found nothing.
+    usernames = {video.id: linked(video, link_extractor.USERNAME) for video in videos}
+    urls = {video.id: linked(video, link_extractor.URL) for video in videos}
+    channels_by_username = Channel.from_usernames(set().union(*usernames.values()))
+    unknown_usernames = NegativeResult.known(NegativeResult.USERNAME, set().union(*usernames.values()) - channels_by_username.keys())
+    channels_by_url = Channel.from_urls(set().union(*urls.values()))
+    failed_urls = {}
+    if not cache_only:
+        resolved_urls, failed_urls = Channel.resolve_urls(set().union(*urls.values()) - channels_by_url.keys())
+        channels_by_url.update(resolved_urls)
+
+    all_channels = {}
+    for video in videos:
+        channels = all_channels.setdefault(video.id, set())
+        channels.update(channels_by_id[c] for c in linked_channel_ids[video.id] if c in channels_by_id)
+
+        for username in usernames[video.id]:
+            try:
+                if username not in channels_by_username and username not in unknown_usernames and not cache_only:
+                    channels_by_username[username] = Channel.from_username(username)
+                if channel_by_name := channels_by_username.get(username):
+                    channels.update([channel_by_name])
+            except HTTPError as err:
+                logger.error(f"Failed processing username '{username}' from video '{video}' - {err}")
+            except IntegrityError:
+                current_session.rollback()
+
+        for url in urls[video.id]:
+            if url in failed_urls:
+                logger.error(f"Failed processing url '{url}' from video '{video}' - {failed_urls[url]}")
+            elif channel_by_url := channels_by_url.get(url):
                 channels.update([channel_by_url])
-        except HTTPError as err:
-            logger.error(f"Failed processing url '{url}' from video '{video}' - {err}")
-        except IntegrityError:
-            current_session.rollback()
 
-    return channels
+    return all_channels
 
 
 def get_channels_from_title(video: Video, cache_only=False) -> set:
     """
     Retrieve set of Channel objects for all channels referenced in the given video title.
+
+    :param video: Video to parse
+    :param cache_only: Default False. If True, only search the cache.
+    :return: set of Channel objects for referenced channels
+    """
+    return get_channels_from_titles([video], cache_only=cache_only)[video.id]
+
+
+def get_possible_titles(title: str) -> list:
+    """
+    Build the list of channel titles a tag could refer to, in reverse size order
+    eg: "Halocene ft." becomes ["Halocene ft.", "Halocene"]
+
+    :param title: tag taken from a video title
+    :return: list of possible channel titles
+    """
+    title_words = title.split()
+    return [' '.join(title_words[:idx + 1]) for idx in reversed(range(len(title_words)))]
+
+
+def get_channels_from_titles(videos: list, cache_only=False) -> dict:
+    """
+    Retrieve the Channel objects for all channels referenced in each of the given video titles.
     There's no delimiter to show how many words after the @ in a video title are the actual channel title
     eg: Crocodile Rock (@Halocene ft. @Violet Orlandi @Lollia).
     "Violet Orlandi" is a channel name, but "Halocene ft." is not, the actual channel name is "Halocene"
     To accommodate this, we search for all possible combination of words that could make up
     the channel name. eg: "Halocene|Halocene ft." / "Violet|Violet Orlandi" / "Lollia"
     We assume the longest successful match is the correct one.
+    Tags are matched against the in-memory index of cached channel titles, without querying the database.
+    Only tags the index doesn't match are looked up in the cache, in one query, in case another process
+    cached their channel. Tags still unmatched are matched to known channels ignoring case and punctuation.
+    Search results are then looked up in the cache for all remaining tags at once.
+    Only searches that aren't cached are sent to the API individually.
 
-    :param video: Video to parse
+    :param videos: list of Videos to parse
     :param cache_only: Default False. If True, only search the cache.
-    :return: set of Channel objects for referenced channels
+    :return: dict of video ID to set of Channel objects for referenced channels
     """
 
     def find_channel_by_title(results, titles):
         # Separate method to allow return from nested loop
         for result in results:
-            try:
-                guest = Channel.from_id(result.id)
+            if guest := channels_by_id.get(result.id):
                 for title_fragment in titles:
                     if guest.title == title_fragment:
                         return guest
-            except IntegrityError:
-                current_session.rollback()
 
-    channels = set()
+    mentions = {video.id: {title: get_possible_titles(title) for title in video.get_collaborators_from_title()} for video in videos}
+    index = title_index.get_index()
+    all_tags = {tag: possible for video_mentions in mentions.values() for tag, possible in video_mentions.items()}
+    matched_ids = {tag: channel_id for tag in all_tags if (channel_id := index.longest_match(tag))}
+
+    unmatched = {tag: possible for tag, possible in all_tags.items() if tag not in matched_ids}
+    channels_by_title = Channel.from_titles({t for possible in unmatched.values() for t in possible})
+    index.add({title: channel.id for title, channel in channels_by_title.items()})
+    for tag, possible in unmatched.items():
+        if channel := next((channels_by_title[t] for t in possible if t in channels_by_title), None):
+            matched_ids[tag] = channel.id
+        # Otherwise, a case or punctuation variant of a known channel's title saves a search
+        elif channel_id := next(filter(None, map(index.normalised_match, possible)), None):
+            matched_ids[tag] = channel_id
+
+    # Tags that don't exactly match a cached channel title fall back to a search for all of their possible titles
+    search_terms = {"|".join(possible) for tag, possible in all_tags.items() if tag not in matched_ids}
+    search_results = SearchResult.from_terms(search_terms)
+    no_results = NegativeResult.known(NegativeResult.SEARCH, search_terms - search_results.keys())
+    # Matched channels are loaded alongside the channels for any cached search results
+    channels_by_id = Channel.from_ids(set(matched_ids.values()).union(*({r.id for r in results} for results in search_results.values())))
+
+    all_channels = {}
+    for video in videos:
+        channels = all_channels.setdefault(video.id, set())
+        for title, possible_titles in mentions[video.id].items():
+            guest = channels_by_id.get(matched_ids.get(title))
+
+            search_term = "|".join(possible_titles)
+            if not guest and search_term not in search_results and search_term not in no_results and not cache_only:
+                try:
+                    search_results[search_term] = SearchResult.from_term(search_term)
+                    channels_by_id.update(get_channels_for_search_results([search_results[search_term]]))
+                except HTTPError as err:
+                    logger.error(f"Processing search term '{possible_titles}' for video '{video}' - '{err}'")
+            if not guest and search_results.get(search_term):
+                if guest := find_channel_by_title(search_results[search_term], possible_titles):
+                    index.add({guest.title: guest.id})
+
+            if guest:
+                channels.update([guest])
+            elif not cache_only:
+                logger.error(f"Processing channel name '{title}' from title of '{video}' failed")
+
+    return all_channels
+
+
+def get_channels_for_search_results(result_lists) -> dict:
+    """
+    Retrieve the channels for lists of search results, in one bulk lookup.
+    As with searches, channels are fetched from the API if they aren't cached.
 
-    for title in video.get_collaborators_from_title():
-        guest = None
-        possible_titles = []
+    :param result_lists: iterable of lists of SearchResult objects
+    :return: dict of channel ID to Channel instance
+    """
+    return Channel.from_ids({result.id for results in result_lists for result in results})
 
-        # Build the list of titles in reverse size order
-        # eg: "Halocene ft." becomes ["Halocene ft.", "Halocene"]
-        title_words = title.split()
-        for idx, word in enumerate(title_words):
-            possible_titles.append(' '.join(title_words[:idx + 1]))
-        possible_titles.reverse()
 
-        for possible_title in possible_titles:
-            if guest := Channel.from_title(possible_title):
-                break
+def resolve_mentions(videos: list, cache_only=False) -> dict:
+    """
+    Resolve the channels mentioned in each video's description and title, and store them as VideoMentions,
+    so later crawls can find the videos' collaborations without resolving them again. Doesn't commit.
 
-        if not guest:
-            try:
-                if search_results := SearchResult.from_term("|".join(possible_titles), cache_only=cache_only):
-                    guest = find_channel_by_title(search_results, possible_titles)
-            except HTTPError as err:
-                logger.error(f"Processing search term '{possible_titles}' for video '{video}' - '{err}'")
+    :param videos: list of Videos to parse
+    :param cache_only: Default False. If True, only search the cache.
+    :return: dict of video ID to set of Channel objects for mentioned channels
+    """
+    description_channels = get_channels_from_descriptions(videos, cache_only=cache_only)
+    title_channels = get_channels_from_titles(videos, cache_only=cache_only)
+    cached = {v.id for v in videos if inspect(v).persistent}
+    VideoMention.add(VideoMention.DESCRIPTION, {v: {c.id for c in description_channels[v]} for v in cached})
+    VideoMention.add(VideoMention.TITLE, {v: {c.id for c in title_channels[v]} for v in cached})
+    return {v.id: description_channels[v.id] | title_channels[v.id] for v in videos}
 
-        if guest:
-            channels.update([guest])
-        elif not cache_only:
-            logger.error(f"Processing channel name '{title}' from title of '{video}' failed")
 
-    return channels
+def get_guest_channels_for_videos(video_ids: list) -> list:
+    """
+    Parse a chunk of host videos, and return the IDs of every channel they reference.
+    The mentions are resolved with the API, so they're stored as complete, and not resolved again
+    when the videos are processed for collaborations.
+    Videos whose mentions are already complete, eg: from a chunk finished before a crawl job was resumed,
+    are read from the stored mentions instead.
+
+    :param video_ids: list of video IDs to parse
+    :return: list of channel IDs
+    """
+    resolved = {video_id for video_id, done in Video.mentions_resolved_for(set(video_ids)).items() if done}
+    guests = VideoMention.channels_for(resolved)
+    videos = list(Video.from_ids(set(video_ids) - resolved).values())
+    mentions = resolve_mentions(videos)
+    Video.mark_mentions_resolved({v.id for v in videos if inspect(v).persistent})
+    current_session.commit()
+    add_progress(len(video_ids))
+    return list(guests.union(c.id for c in set().union(*mentions.values())))
 
 
 def get_uploads_for_channel(channel_id: str) -> list:
@@ -232,9 +443,10 @@ def get_uploads_for_channel(channel_id: str) -> list:
     channel = Channel.from_id(channel_id)
     logger.info(f"Getting uploads for channel '{channel}'")
     try:
-        videos.extend([v.id for v in Video.from_channel(channel)])
+        videos.extend(Video.ids_from_channel(channel))
     except HTTPError as e:
         logger.error(f"Processing uploads for channel '{channel}' - '{e}'")
+    add_progress(len(videos))
     return videos
 
 
@@ -242,25 +454,32 @@ def populate_collaborations(target_channel_id: str, videos: list):
     """
     Iterate through a list of video objects, and create a Collaboration object
     for each identified work. These aren't returned as a later stage extracts all
-    relevant collaborations from the database, populated by multiple gunicorn_conf.threads
+    relevant collaborations from the database, populated by multiple crawl threads
+
+    Channels mentioned in videos from guest discovery are already stored as VideoMentions. Only the remaining videos
+    are resolved, from the cache, and their mentions stored. Those are resolved again on later crawls, as channels
+    missing from the cache now may be cached by then. New collaborations for the whole chunk are then found
+    with one query joining the mentions to the videos' uploaders, and written in a single transaction.
+    So the number of database round trips doesn't grow with the chunk size.
 
     :param videos: list of videos to process
     :param target_channel_id: Channel id that relationships are being calculated for.
     """
     target_channel = Channel.from_id(target_channel_id)
-    for video_id in videos:
-        video = Video.from_id(video_id)
-        logger.debug(f"Populating collaborations for video '{video}'")
-        collaborators = set()
-        host = Channel.from_id(video.channel_id, cache_only=True)
-        collaborators.update(get_channels_from_description(video, cache_only=True))
-        collaborators.update(get_channels_from_title(video, cache_only=True))
-        for guest in collaborators:
-            existing_collabs = Collaboration.for_video(video)
-            if host.id == guest.id:
-                continue  # Happens when an artist references another of their videos in the description
-            if any({collab.channel_1_id, collab.channel_2_id} == {host.id, guest.id} for collab in existing_collabs):
-                continue  # Happens when we're re-processing this video in the context of another channel
-            current_session.add(Collaboration(host, guest, video))
-        video.processed_for += "|" + target_channel.id
-        current_session.commit()
+    mentions_resolved = Video.mentions_resolved_for(set(videos))
+    if unresolved := {video_id for video_id, resolved in mentions_resolved.items() if not resolved}:
+        resolve_mentions(list(Video.from_ids(unresolved, cache_only=True).values()), cache_only=True)
+
+    new_collaborations = VideoMention.new_collaborations(set(mentions_resolved))
+    new_pairs = {}
+    for collaboration in new_collaborations:
+        pair = (collaboration['channel_1_id'], collaboration['channel_2_id'])
+        new_pairs[pair] = new_pairs.get(pair, 0) + 1
+
+    if new_collaborations:
+        current_session.execute(Collaboration.__table__.insert(), new_collaborations)
+        CollaborationEdge.increment(new_pairs)
+        DataVersion.bump({target_channel.id}.union(*new_pairs))
+    Video.mark_processed(set(mentions_resolved), target_channel)
+    current_session.commit()
+    add_progress(len(mentions_resolved))
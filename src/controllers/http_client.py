@@ -0,0 +1,175 @@
+import contextlib
+import contextvars
+import datetime
+import email.utils
+import json
+import logging
+import math
+import random
+import threading
+import time
+
+import requests
+from requests import HTTPError
+from requests.adapters import HTTPAdapter
+
+from src import config
+
+try:
+    # Optional, decodes API responses several times faster than the standard library
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+logger = logging.getLogger()
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Responses which mean the thing looked up doesn't exist. A 200 is a page without the expected content, or an API response with no items
+NOT_FOUND_STATUSES = {200, 404, 410}
+
+# Shared by all threads, so connections to the API and website are kept alive and reused between calls,
+# instead of each call making a new TLS handshake
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.http_pool_size)
+session.mount('https://', adapter)
+session.mount('http://', adapter)
+
+
+class RetryBudget:
+    """Number of retries left for a crawl. Shared by every thread working on the crawl."""
+
+    def __init__(self, retries: int):
+        self.remaining = retries
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        """
+        :return: True if a retry was available, and has been used
+        """
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+# Budget for the current crawl, or None if requests aren't part of a crawl
+retry_budget = contextvars.ContextVar('retry_budget', default=None)
+
+
+@contextlib.contextmanager
+def crawl_retry_budget(retries: int = None):
+    """
+    Limit the total retries of all requests made inside the block, including from tasks copied from its context.
+
+    :param retries: Default config.crawl_retry_budget. Number of retries allowed.
+    :return: context manager yielding the RetryBudget
+    """
+    budget = RetryBudget(config.crawl_retry_budget if retries is None else retries)
+    token = retry_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        retry_budget.reset(token)
+
+
+def get_retry_delay(attempt: int, response: requests.Response = None) -> float:
+    """
+    Calculate how long to wait before the next attempt.
+    Uses the Retry-After header if the server sent a valid one, otherwise exponential backoff with full jitter.
+
+    :param attempt: Number of attempts made so far, starting at 1
+    :param response: Response from the failed attempt, or None if it raised an exception
+    :return: delay in seconds, no more than config.http_backoff_max
+    """
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            if not math.isnan(delay := float(retry_after)):
+                return min(max(delay, 0), config.http_backoff_max)
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            if retry_at.tzinfo is None:
+                # HTTP dates are always GMT, but parsing '-0000' gives a naive datetime
+                retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+            return min(max(retry_at.timestamp() - time.time(), 0), config.http_backoff_max)
+        except (TypeError, ValueError):
+            # Neither a number of seconds nor a date, so fall back to backoff
+            logger.warning(f"Ignoring malformed Retry-After header '{retry_after}'")
+    return random.uniform(0, min(config.http_backoff_base * 2 ** (attempt - 1), config.http_backoff_max))
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """
+    Make a GET request through the shared connection pool, with the configured timeouts.
+    Connection errors, timeouts, 429 and 5xx responses are retried with backoff, up to config.http_max_retries
+    times, while the crawl's retry budget lasts.
+
+    :param url: URL to request
+    :param kwargs: Any other arguments accepted by requests.get, eg: params, cookies
+    :return: requests.Response. If retries run out on a 429 or 5xx, the last response is returned.
+    :raises: HTTPError if retries run out on a connection error or timeout
+    """
+    kwargs.setdefault('timeout', (config.http_connect_timeout, config.http_read_timeout))
+    attempt = 0
+    while True:
+        attempt += 1
+        start = time.perf_counter()
+        response, error = None, None
+        try:
+            response = session.get(url, **kwargs)
+            outcome = response.status_code
+        except (requests.ConnectionError, requests.Timeout) as err:
+            error = outcome = err
+        logger.debug("HTTP attempt %s for '%s' - %s in %.3fs", attempt, url, outcome, time.perf_counter() - start)
+
+        if error is None and response.status_code not in RETRY_STATUSES:
+            return response
+        budget = retry_budget.get()
+        if attempt > config.http_max_retries or (budget and not budget.take()):
+            if error is not None:
+                raise HTTPError(f"Request to '{url}' failed after {attempt} attempts - {error}") from error
+            return response
+
+        delay = get_retry_delay(attempt, response)
+        if response is not None:
+            response.close()  # Releases the connection if the response was streamed
+        logger.warning(f"Request to '{url}' failed with '{outcome}' on attempt {attempt}, retrying in {delay:.2f}s")
+        time.sleep(delay)
+
+
+def is_not_found(error: HTTPError) -> bool:
+    """
+    Distinguish a lookup that found nothing from a failure which is worth trying again, like a timeout or 5xx.
+
+    :param error: HTTPError raised for a request
+    :return: True if the error was raised for a response in NOT_FOUND_STATUSES
+    """
+    return error.response is not None and error.response.status_code in NOT_FOUND_STATUSES
+
+
+def not_found(message: str) -> HTTPError:
+    """
+    Build the error for a lookup that succeeded, but found nothing, eg: an ID missing from a bulk API response.
+    It's given a 404 response, so is_not_found recognises it, and it's remembered in the negative cache.
+
+    :param message: Error message
+    :return: HTTPError
+    """
+    response = requests.Response()
+    response.status_code = 404
+    return HTTPError(message, response=response)
+
+
+def decode(response: requests.Response):
+    """
+    Decode a JSON response body, using orjson if it's installed.
+
+    :param response: requests.Response
+    :return: decoded JSON
+    :raises: ValueError if the body isn't valid JSON
+    """
+    return loads(response.content)
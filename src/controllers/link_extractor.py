@@ -0,0 +1,73 @@
+import re
+from typing import NamedTuple
+
+CHANNEL_ID = 'channel_id'
+USERNAME = 'username'
+URL = 'url'
+VIDEO_ID = 'video_id'
+
+# Paths on youtube.com which aren't channels, so aren't vanity URLs. eg: 'youtube.com/playlist?list=...'
+# Each vanity URL costs a page fetch and an API call to resolve, so common site pages are listed here too
+RESERVED_PATHS = ['c', 'user', 'channel', 'watch', 'playlist', 'results', 'feed', 'embed', 'shorts', 'live',
+                  'hashtag', 'redirect', 'attribution_link', 'premium', 'gaming', 'account', 'upload', 't',
+                  'subscription_center', 'about', 'yt', 'kids', 'music', 'creators', 'howyoutubeworks', 'signin',
+                  'logout', 'ads', 'trends', 'jobs', 'new', 'post', 'clip', 'playables', 'podcasts', 'movies',
+                  'channel_switcher', 'create_channel', 'paid_memberships', 'reporthistory', 'supported_browsers',
+                  'verify_age', 'oembed', 'iframe_api', 'get_video_info', 'view_play_list', 'audiolibrary', 'store']
+
+# Every kind of link is matched by one pattern, so a description is scanned once.
+# Channel names may contain any word characters (eg: 'marcellroncsák'), while IDs are ASCII.
+LINK = re.compile(r"""
+    youtube\.com/(?:
+        channel/(?P<channel_id>[a-zA-Z0-9_\-]+)
+      | user/(?P<username>[\w\-]+)
+      | c/(?P<custom_url>[\w\-]+)
+      | subscription_center\?(?:[^\s&#]*&)*?add_user=(?P<add_user>[\w\-]+)
+      | watch\?(?:[^\s&#]*&)*?v=(?P<watch_id>[a-zA-Z0-9_\-]+)
+      | (?!(?:""" + '|'.join(RESERVED_PATHS) + r""")(?![\w\-]))(?P<vanity_url>[\w\-]+)
+    )
+  | youtu\.be/(?P<short_id>[a-zA-Z0-9_\-]+)
+""", re.VERBOSE)
+
+# Kind of link found by each group in LINK
+GROUP_KINDS = {'channel_id': CHANNEL_ID, 'username': USERNAME, 'add_user': USERNAME, 'custom_url': URL, 'vanity_url': URL,
+               'watch_id': VIDEO_ID, 'short_id': VIDEO_ID}
+
+# Removed from video titles before splitting out tags, in this order. eg: '(Cover with @Halocene, @Lollia)'
+# Parentheses and commas aren't part of channel titles, and an @ followed by a space, as in 'Live @ Wembley', isn't a tag
+TITLE_PUNCTUATION = re.compile(r"[(),]")
+NOT_A_TAG = re.compile(r"@ ")
+
+
+class Link(NamedTuple):
+    """A link to a channel or video. Kind is one of CHANNEL_ID, USERNAME, URL or VIDEO_ID"""
+    kind: str
+    value: str
+
+
+def extract_links(text: str) -> set:
+    """
+    Find every link to a Youtube channel or video in some text, eg: a video description.
+    Links look like:
+    - https://www.youtube.com/channel/UCo3AxjxePfj6DHn03aiIhww (CHANNEL_ID)
+    - https://www.youtube.com/user/VioletaOrlandi or https://www.youtube.com/subscription_center?add_user=VioletaOrlandi (USERNAME)
+    - https://www.youtube.com/c/VioletOrlandi or https://www.youtube.com/VioletOrlandi (URL)
+    - https://www.youtube.com/watch?v=53XW1xxmmuM or https://youtu.be/53XW1xxmmuM (VIDEO_ID)
+
+    :param text: Text to search
+    :return: set of Link. eg: {Link(URL, 'VioletOrlandi')}
+    """
+    return {Link(GROUP_KINDS[match.lastgroup], match.group(match.lastgroup)) for match in LINK.finditer(text)}
+
+
+def extract_title_tags(title: str) -> set:
+    """
+    Find every channel tagged in a video title, eg: 'Crocodile Rock (@Halocene ft. @Violet Orlandi)'.
+    A tag starts with @, but has no end delimiter. The end is assumed to be the next @ symbol or end of string.
+    The title itself is left unchanged.
+
+    :param title: Video title to search
+    :return: set of strings. eg: {'Halocene ft.', 'Violet Orlandi'}
+    """
+    title = NOT_A_TAG.sub('', TITLE_PUNCTUATION.sub('', title))
+    return {tag.strip() for tag in title.split('@')[1:]}
@@ -0,0 +1,200 @@
+import datetime
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+from flask_sqlalchemy_session import current_session
+from sqlalchemy.orm import Session
+
+from src import config
+from src.models.channel import Channel
+from src.models.search import SearchResult
+
+logger = logging.getLogger()
+
+# Key marking the end of a title in the trie. Words are never None, so this can't clash with a word.
+END = None
+
+# Runs of letters and digits. Everything else, including punctuation and underscores, separates words once normalised.
+WORD = re.compile(r"[^\W_]+")
+
+
+def normalise(title: str) -> str:
+    """
+    Fold a title to a form shared by its case, width, spacing and punctuation variants.
+    eg: 'Violet  Orlandi!' and 'ＶＩＯＬＥＴ ORLANDI' both become 'violet orlandi'
+
+    :param title: Title to normalise
+    :return: Normalised title, or '' if the title has no letters or digits
+    """
+    return ' '.join(WORD.findall(unicodedata.normalize('NFKC', title).casefold()))
+
+
+def trigrams(normalised: str) -> set:
+    """
+    Split a normalised title into 3 character sequences, padding each word as pg_trgm does.
+    eg: 'cat' becomes {'  c', ' ca', 'cat', 'at '}
+    """
+    return {f"  {word} "[i:i + 3] for word in normalised.split() for i in range(len(word) + 1)}
+
+
+class TitleIndex:
+    """
+    In-memory trie of the titles of all cached channels, keyed word by word, so the longest cached title a tag
+    starts with is found in one pass over the tag, without querying the database.
+    eg: the tag 'Halocene ft. Lollia' walks 'Halocene' -> 'ft.' and matches the channel titled 'Halocene'.
+
+    Titles are matched exactly, as Channel.from_titles does. Titles with whitespace other than single spaces
+    can't be spelled by a tag's words, so they aren't indexed.
+    Trie lookups don't lock, as adding a title only ever assigns new keys.
+
+    Titles of cached channels and search results are also indexed normalised, with their trigrams. A name that
+    normalises to the title of exactly one known channel, eg: 'violet orlandi', is found locally without a search.
+    Trigram matches can't tell a typo from a different channel with a similar name, eg: 'Violeta Orlandi',
+    so they're only a fallback for when a search finds no exact match. See TitleIndex.closest
+    """
+
+    def __init__(self, bind=None):
+        self.bind = bind
+        self.root = {}
+        # Normalised title to the set of channel IDs with that title, trigrams of each normalised title,
+        # and normalised titles containing each trigram
+        self.normalised = {}
+        self.trigrams = {}
+        self.postings = {}
+        self.loaded_at = datetime.datetime.utcnow()
+        self.lock = threading.Lock()
+
+    def add(self, titles: dict):
+        """
+        Add channels to the index. Titles already indexed keep their first channel.
+
+        :param titles: dict of title to channel ID, eg: {'Violet Orlandi': 'UCo3AxjxePfj6DHn03aiIhww'}
+        """
+        self.add_normalised(titles)
+        with self.lock:
+            for title, channel_id in titles.items():
+                words = title.split()
+                if not words or ' '.join(words) != title:
+                    continue
+                node = self.root
+                for word in words:
+                    node = node.setdefault(word, {})
+                node.setdefault(END, channel_id)
+
+    def add_normalised(self, titles: dict):
+        """
+        Add titles to the normalised index only, eg: titles of search results, whose channels may not be cached.
+        Different channels with the same normalised title are all kept, so neither is matched.
+
+        :param titles: dict of title to channel ID
+        """
+        with self.lock:
+            for title, channel_id in titles.items():
+                if not (key := normalise(title)):
+                    continue
+                if key not in self.normalised:
+                    self.trigrams[key] = trigrams(key)
+                    for trigram in self.trigrams[key]:
+                        self.postings.setdefault(trigram, set()).add(key)
+                self.normalised.setdefault(key, set()).add(channel_id)
+
+    def normalised_match(self, title: str):
+        """
+        :param title: Title to match, eg: 'violet orlandi'
+        :return: ID of the channel whose normalised title matches, or None if none or several channels match
+        """
+        key = normalise(title)
+        with self.lock:
+            channel_ids = set(self.normalised.get(key, ()))
+        if len(channel_ids) == 1:
+            return channel_ids.pop()
+
+    def closest(self, title: str):
+        """
+        Find the channel whose normalised title is most similar, allowing typos.
+        Titles are compared by trigram similarity, as pg_trgm does, and must score at least config.title_similarity_threshold.
+        If different channels are equally similar, neither is returned.
+        A similar title may belong to a different channel than the one meant, so this is only a guess, for when a search
+        finds no channel with the exact title.
+
+        :param title: Title to match, eg: 'Violet Orlandy'
+        :return: ID of the closest channel, or None if no title is close enough
+        """
+        if not (key := normalise(title)):
+            return
+        wanted = trigrams(key)
+        with self.lock:
+            shared = Counter(candidate for trigram in wanted for candidate in self.postings.get(trigram, ()))
+            scores = {candidate: count / (len(wanted) + len(self.trigrams[candidate]) - count) for candidate, count in shared.items()}
+            top = max(scores.values(), default=0)
+            best = set().union(*(self.normalised[c] for c, score in scores.items() if score == top))
+        if top >= config.title_similarity_threshold and len(best) == 1:
+            return best.pop()
+
+    def longest_match(self, tag: str):
+        """
+        Find the channel with the longest title that the tag starts with, on word boundaries.
+
+        :param tag: Tag taken from a video title, eg: 'Halocene ft.'
+        :return: ID of the matching channel, or None if no cached title matches
+        """
+        match, node = None, self.root
+        for word in tag.split():
+            if (node := node.get(word)) is None:
+                break
+            match = node.get(END, match)
+        return match
+
+
+_index = TitleIndex()
+# Held while an index is loaded, so only one thread loads it at a time
+_load_lock = threading.Lock()
+
+
+def _load(bind) -> TitleIndex:
+    # Loaded with its own session, so it can run outside a request
+    index = TitleIndex(bind)
+    with Session(bind) as session:
+        index.add({title: channel_id for channel_id, title in session.query(Channel.id, Channel.title) if title})
+        index.add_normalised({title: channel_id for channel_id, title in session.query(SearchResult.id, SearchResult.title) if title})
+    return index
+
+
+def _rebuild(bind):
+    global _index
+    try:
+        index = _load(bind)
+        if _index.bind is bind:
+            _index = index
+    except Exception as e:
+        logger.error(f"Failed rebuilding the title index - {e}")
+    finally:
+        _load_lock.release()
+
+
+def get_index() -> TitleIndex:
+    """
+    Retrieve the title index for the current database, loading all cached channel and search result titles the first time.
+    The index is rebuilt after config.title_index_refresh_minutes, to pick up channels cached by other processes.
+    Rebuilds run in a background thread, and requests are served from the current index until the new one replaces it.
+    Between rebuilds, channels are added as they're found. See TitleIndex.add
+
+    :return: TitleIndex instance
+    """
+    global _index
+    bind = current_session.get_bind()
+    if _index.bind is not bind:
+        with _load_lock:
+            # Another thread may have loaded the index while this one waited
+            if _index.bind is not bind:
+                _index = _load(bind)
+        return _index
+
+    index = _index
+    expires_at = index.loaded_at + datetime.timedelta(minutes=config.title_index_refresh_minutes)
+    if expires_at <= datetime.datetime.utcnow() and _load_lock.acquire(blocking=False):
+        threading.Thread(target=_rebuild, args=(bind,), daemon=True, name="title-index").start()
+    return index
@@ -0,0 +1,104 @@
+import contextvars
+import logging
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from requests import HTTPError
+
+from src import config
+from src.controllers import http_client
+
+logger = logging.getLogger()
+
+YOUTUBE_URL = 'https://www.youtube.com/'
+CONSENT_COOKIE = {'CONSENT': 'YES+GB.en-GB+V9+BX'}
+CHUNK_SIZE = 16 * 1024
+
+# The og:url tag is in the page head. Attributes may be in either order, and quoted with either quote
+META_TAG = re.compile(rb'<meta\s[^>]*property\s*=\s*["\']og:url["\'][^>]*>', re.IGNORECASE)
+CONTENT_ATTRIBUTE = re.compile(rb'content\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+HEAD_END = re.compile(rb'</head\s*>', re.IGNORECASE)
+
+executor = ThreadPoolExecutor(max_workers=config.url_resolver_workers, thread_name_prefix="resolve")
+host_limits = defaultdict(lambda: threading.BoundedSemaphore(config.url_resolver_host_limit))
+
+
+class ResolvedUrl(NamedTuple):
+    """Where a youtube.com URL leads. Either a channel ID, or a username if the URL redirects to /user/"""
+    value: str
+    is_username: bool
+
+
+def read_head(response) -> bytes:
+    """
+    Read a streamed HTML response until the end of its head, and close it without downloading the rest of the page.
+
+    :param response: requests.Response, made with stream=True
+    :return: bytes of the page, up to and including </head>. The whole page if there's no </head>.
+    """
+    content = b''
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            # Only search the new chunk, and enough of the previous one to find a tag split across the boundary
+            search_from = max(len(content) - 16, 0)
+            content += chunk
+            if match := HEAD_END.search(content, search_from):
+                return content[:match.end()]
+        return content
+    finally:
+        response.close()
+
+
+def find_og_url(head: bytes) -> str:
+    """
+    :param head: HTML of a page head
+    :return: content of the og:url meta tag, or None if there isn't one
+    """
+    if tag := META_TAG.search(head):
+        if content := CONTENT_ATTRIBUTE.search(tag.group(0)):
+            return content.group(1).decode()
+
+
+def resolve_url(url: str) -> ResolvedUrl:
+    """
+    Visit a youtube.com URL, and find the channel it belongs to.
+
+    :param url: URL to look up. eg: 'VioletOrlandi'
+    :return: ResolvedUrl
+    :raises: HTTPError if Youtube responds with non 200 response code, or metadata tag is not found.
+    """
+    page_url = YOUTUBE_URL + url
+    with host_limits[urlsplit(page_url).netloc]:
+        logger.debug(f"Querying web for channel with URL {url}")
+        response = http_client.get(page_url, cookies=CONSENT_COOKIE, stream=True)
+        if response.status_code != 200:
+            response.close()
+            raise HTTPError(f"Request responded with {response.status_code} for {url}", response=response)
+        head = read_head(response)
+
+    if "/user/" in response.url:
+        return ResolvedUrl(response.url.split("/")[-1], True)
+    if og_url := find_og_url(head):
+        return ResolvedUrl(og_url.split("/")[-1], False)
+    raise HTTPError(f"Could not find og:url meta tag for url {url}", response=response)
+
+
+def resolve_urls(urls: set) -> tuple:
+    """
+    Resolve many youtube.com URLs concurrently, limited by config.url_resolver_workers and url_resolver_host_limit.
+
+    :param urls: set of URLs to look up. eg: {'VioletOrlandi'}
+    :return: tuple of dict of URL to ResolvedUrl, and dict of URL to the HTTPError raised for any that failed
+    """
+    futures = {url: executor.submit(contextvars.copy_context().run, resolve_url, url) for url in urls}
+    resolved, failed = {}, {}
+    for url, future in futures.items():
+        try:
+            resolved[url] = future.result()
+        except HTTPError as err:
+            failed[url] = err
+    return resolved, failed
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine, MetaData
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import create_engine, inspect, text, MetaData
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.pool import NullPool
 
@@ -7,3 +9,55 @@ from src.controllers import secrets
 engine = create_engine(secrets.get_secret("six_degrees_of_youtube_db_dsn"), poolclass=NullPool)
 Base = declarative_base(metadata=MetaData(engine))
 session_factory = sessionmaker(bind=engine)
+
+
+def dialect_insert(table):
+    """
+    Build an INSERT statement for the current session's database, which supports
+    on_conflict_do_nothing and on_conflict_do_update. Postgres in deployment, SQLite in tests.
+
+    :param table: Table to insert into
+    :return: dialect specific Insert construct
+    """
+    if current_session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def create_missing_columns():
+    """
+    Add any columns declared on the models that don't exist in the database yet.
+    create_all only creates columns alongside new tables, so this covers columns added to existing tables.
+    Added columns are nullable, as existing rows have no value for them.
+    """
+    connection = current_session.connection()
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}"))
+    current_session.commit()
+
+
+def create_missing_indexes():
+    """
+    Create any indexes declared on the models that don't exist in the database yet.
+    create_all only creates indexes alongside new tables, so this covers indexes added to existing tables.
+    Index names are checked directly, as SQLAlchemy can't reflect expression indexes such as lower(username).
+    """
+    connection = current_session.connection()
+    if connection.dialect.name == 'postgresql':
+        query = "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+    else:
+        query = "SELECT name FROM sqlite_master WHERE type = 'index'"
+    existing = {row[0] for row in connection.execute(text(query))}
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+    current_session.commit()
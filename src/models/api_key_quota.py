@@ -0,0 +1,164 @@
+import datetime
+import hashlib
+import threading
+
+from dateutil import tz
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, String, Integer, Date, DateTime, or_
+from sqlalchemy.orm import Session
+
+from src import config
+from src.extensions import Base, dialect_insert
+
+# API quotas reset at midnight Pacific time
+QUOTA_TIMEZONE = tz.gettz('America/Los_Angeles')
+
+# Quota units used per call to each endpoint. Any endpoint not listed costs 1 unit.
+# See https://developers.google.com/youtube/v3/determine_quota_cost
+QUOTA_COSTS = {'search': 100}
+
+# Reasons the API gives in a 403 for a key that has used up its quota. Other 403s, eg: for a private playlist, don't rest the key.
+QUOTA_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+
+
+def quota_day(now: datetime.datetime = None) -> datetime.date:
+    """
+    :param now: UTC time, defaults to the current time
+    :return: the Pacific date the given time counts towards
+    """
+    now = now or datetime.datetime.utcnow()
+    return now.replace(tzinfo=datetime.timezone.utc).astimezone(QUOTA_TIMEZONE).date()
+
+
+def next_reset(now: datetime.datetime = None) -> datetime.datetime:
+    """
+    :param now: UTC time, defaults to the current time
+    :return: UTC time of the next quota reset, at the following Pacific midnight
+    """
+    midnight = datetime.datetime.combine(quota_day(now) + datetime.timedelta(days=1), datetime.time(), tzinfo=QUOTA_TIMEZONE)
+    return midnight.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class ApiKeyQuota(Base):
+    """
+    Estimated quota used by each API key today, and whether the API has rejected the key until the next reset.
+    Stored in the database so every worker process shares the same view of the keys.
+    Keys are identified by a hash, so the keys themselves aren't stored.
+
+    Each process reserves quota in blocks of config.api_quota_block_units, and counts calls against its block locally,
+    so the database is only visited once per block, rather than on every call. A block is recorded as used in full
+    when it's reserved, so counts overestimate by up to a block per process.
+    Reservations are committed in their own session, so they aren't lost if the calling request rolls back.
+    """
+    __tablename__ = "api_key_quota"
+
+    key_id = Column(String, primary_key=True)
+    quota_day = Column(Date, nullable=False)
+    units_used = Column(Integer, nullable=False)
+    exhausted_until = Column(DateTime)
+
+    def __repr__(self):
+        return f"{self.key_id} - {self.quota_day} - {self.units_used}"
+
+    @staticmethod
+    def key_id_for(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    @classmethod
+    def _available(cls, session, keys: list, now: datetime.datetime) -> list:
+        """
+        Find the keys not in cooldown, least used first. Doesn't lock any rows.
+        Keys with no row, or a row from a previous day, are counted as unused.
+
+        :return: list of (units used today, key ID), sorted by units used. Ties go to the first configured key.
+        """
+        ids = [cls.key_id_for(key) for key in keys]
+        quotas = {q.key_id: q for q in session.query(cls).filter(cls.key_id.in_(ids))}
+        available = []
+        for key_id in dict.fromkeys(ids):
+            quota = quotas.get(key_id)
+            if quota is None or quota.exhausted_until is None or quota.exhausted_until <= now:
+                units_used = quota.units_used if quota and quota.quota_day == quota_day(now) else 0
+                available.append((units_used, key_id))
+        return sorted(available, key=lambda q: (q[0], ids.index(q[1])))
+
+    @classmethod
+    def _reserve(cls, keys: list, units: int, now: datetime.datetime):
+        """
+        Add a block of units to the least used key that isn't in cooldown. The key's row is updated with a single
+        conditional update, which fails if another process put the key in cooldown first, so no rows are locked.
+
+        :return: ID of the key reserved, or None if every key is in cooldown
+        """
+        today = quota_day(now)
+        with Session(current_session.get_bind()) as session:
+            ids = {cls.key_id_for(key) for key in keys}
+            session.execute(dialect_insert(cls.__table__).on_conflict_do_nothing(),
+                            [{'key_id': key_id, 'quota_day': today, 'units_used': 0} for key_id in ids])
+            # Counts restart on the first reservation of a new day
+            session.query(cls).filter(cls.key_id.in_(ids), cls.quota_day != today)\
+                .update({cls.quota_day: today, cls.units_used: 0}, synchronize_session=False)
+            for _, key_id in cls._available(session, keys, now):
+                not_exhausted = or_(cls.exhausted_until.is_(None), cls.exhausted_until <= now)
+                if session.query(cls).filter(cls.key_id == key_id, not_exhausted)\
+                        .update({cls.units_used: cls.units_used + units}, synchronize_session=False):
+                    session.commit()
+                    return key_id
+            session.commit()
+
+    @classmethod
+    def acquire(cls, keys: list, endpoint: str) -> str:
+        """
+        Choose the key to use for a call to the given endpoint, and count the units it will use.
+        Calls are counted against this process's block of quota. When the block runs out, a new block is reserved
+        from the key with the fewest units used today, which spreads load across keys.
+
+        :param keys: list of all API keys
+        :param endpoint: Youtube endpoint about to be called
+        :return: API key, or None if every key is exhausted until the next reset
+        """
+        cost = QUOTA_COSTS.get(endpoint, 1)
+        now = datetime.datetime.utcnow()
+        bind = current_session.get_bind()
+        with _block_lock:
+            block = _block.get(bind)
+            if not block or block['quota_day'] != quota_day(now) or block['units'] < cost:
+                units = max(cost, config.api_quota_block_units)
+                if not (key_id := cls._reserve(keys, units, now)):
+                    _block.pop(bind, None)
+                    return
+                block = _block[bind] = {'key_id': key_id, 'quota_day': quota_day(now), 'units': units}
+            block['units'] -= cost
+            key_id = block['key_id']
+        return next(key for key in keys if cls.key_id_for(key) == key_id)
+
+    @classmethod
+    def any_available(cls, keys: list) -> bool:
+        """
+        :param keys: list of all API keys
+        :return: True if any key isn't exhausted
+        """
+        with Session(current_session.get_bind()) as session:
+            return bool(cls._available(session, keys, datetime.datetime.utcnow()))
+
+    @classmethod
+    def exhaust(cls, key: str):
+        """
+        Stop using a key until the next quota reset, after the API rejects it for exceeding its quota.
+        The rest of this process's block for the key is dropped.
+
+        :param key: API key
+        """
+        key_id = cls.key_id_for(key)
+        with _block_lock:
+            for bind, block in list(_block.items()):
+                if block['key_id'] == key_id:
+                    del _block[bind]
+        with Session(current_session.get_bind()) as session:
+            session.query(cls).filter(cls.key_id == key_id).update({cls.exhausted_until: next_reset()})
+            session.commit()
+
+
+# This process's current block of quota for each database, as a dict of key ID, quota day and units left
+_block = {}
+_block_lock = threading.Lock()
@@ -1,13 +1,14 @@
 import logging
 
-import requests
-from bs4 import BeautifulSoup
 from flask_sqlalchemy_session import current_session
 from requests import HTTPError
-from sqlalchemy import Column, String, Boolean
+from sqlalchemy import Column, String, Boolean, DateTime, Index, func
 
+from src.controllers import http_client, url_resolver
+from src.extensions import dialect_insert
+from src.models.negative_result import NegativeResult
 from src.models.url_lookup import UrlLookup
-from src.models.youtube_object import YoutubeObject
+from src.models.youtube_object import YoutubeObject, MAX_RESULTS
 
 logger = logging.getLogger()
 
@@ -17,12 +18,19 @@ class Channel(YoutubeObject):
     __tablename__ = "channel"
 
     id = Column(String, primary_key=True)
-    title = Column(String)
+    title = Column(String, index=True)
     uploads_id = Column(String)
     thumbnail_url = Column(String)
     url = Column(String)
     username = Column(String)
     processed = Column(Boolean)
+    # UTC time the channel's last crawl finished, which decides whether it can be served from the cache
+    refreshed_at = Column(DateTime)
+    __table_args__ = (
+        # Usernames and URLs are matched case-insensitively
+        Index('ix_channel_username_lower', func.lower(username)),
+        Index('ix_channel_url_lower', func.lower(url)),
+    )
 
     def __repr__(self):
         return self.title
@@ -43,6 +51,18 @@ class Channel(YoutubeObject):
         """
         return current_session.query(cls).filter(cls.title == title).first()
 
+    @classmethod
+    def from_titles(cls, titles: set) -> dict:
+        """
+        Queries the cache for channels with any of the given titles, in one query.
+
+        :param titles: set of titles to match, eg: {'Violet Orlandi', 'Violet'}.
+        :return: dict of title to matching Channel instance. Titles with no match are omitted.
+        """
+        if not titles:
+            return {}
+        return {c.title: c for c in current_session.query(cls).filter(cls.title.in_(titles))}
+
     @classmethod
     def from_id(cls, id: str, cache_only: bool = False):
         """
@@ -63,16 +83,64 @@ class Channel(YoutubeObject):
         channels, _ = cls.get('channels', params)
         assert len(channels) == 1, f'Returned unexpected number of channels: {channels}'
 
-        new_channel = cls(id=channels[0]['id'],
-                          title=channels[0]['snippet']['title'],
-                          uploads_id=channels[0]['contentDetails']['relatedPlaylists']['uploads'],
-                          thumbnail_url=channels[0]['snippet']['thumbnails'].get('medium', {}).get('url'),
-                          url=channels[0]['snippet'].get('customUrl')
-                          )
+        new_channel = cls(**cls.columns_from_api_item(channels[0]))
         current_session.add(new_channel)
         current_session.commit()
         return new_channel
 
+    @classmethod
+    def from_ids(cls, ids: set, cache_only: bool = False, errors: dict = None) -> dict:
+        """
+        Bulk version of from_id. Queries the cache for all IDs in one query, then the API for
+        any missing IDs, in batches of up to 50 (the maximum the 'channels' endpoint accepts).
+        New channels are written in a single insert, ignoring any that another thread cached first.
+        IDs that can't be found are omitted from the result.
+
+        :param ids: set of Youtube channel IDs, eg: {'UCo3AxjxePfj6DHn03aiIhww'}.
+        :param cache_only: Default False. If True, only search the cache.
+        :param errors: Default None. If given, the HTTPError raised for each ID whose batch failed is added to it.
+        :return: dict of channel ID to matching Channel instance.
+        """
+        if not ids:
+            return {}
+        channels = {c.id: c for c in current_session.query(cls).filter(cls.id.in_(ids))}
+        missing = sorted(set(ids) - channels.keys())
+        if cache_only or not missing:
+            return channels
+
+        new_rows = []
+        for idx in range(0, len(missing), MAX_RESULTS):
+            batch = missing[idx:idx + MAX_RESULTS]
+            try:
+                items, _ = cls.get('channels', {'part': 'contentDetails,snippet', 'id': ','.join(batch)})
+            except HTTPError as err:
+                logger.error(f"Failed processing channel IDs '{batch}' - {err}")
+                if errors is not None:
+                    errors.update(dict.fromkeys(batch, err))
+                continue
+            new_rows.extend(cls.columns_from_api_item(item) for item in items)
+
+        if new_rows:
+            current_session.execute(dialect_insert(cls.__table__).on_conflict_do_nothing(), new_rows)
+            current_session.commit()
+            new_ids = [row['id'] for row in new_rows]
+            channels.update({c.id: c for c in current_session.query(cls).filter(cls.id.in_(new_ids))})
+        return channels
+
+    @staticmethod
+    def columns_from_api_item(item: dict) -> dict:
+        """
+        Extract the column values for a channel from an item returned by the 'channels' API endpoint.
+
+        :param item: dict of API response item
+        :return: dict of column name to value
+        """
+        return {'id': item['id'],
+                'title': item['snippet']['title'],
+                'uploads_id': item['contentDetails']['relatedPlaylists']['uploads'],
+                'thumbnail_url': item['snippet']['thumbnails'].get('medium', {}).get('url'),
+                'url': item['snippet'].get('customUrl')}
+
     @classmethod
     def from_username(cls, username: str, cache_only: bool = False):
         """
@@ -83,13 +151,21 @@ class Channel(YoutubeObject):
         :param cache_only: Default False. If True, only search the cache.
         :return: Matching Channel instance or None.
         :raises: AssertionError if more or less than 1 channel is returned from the API
+        :raises: HTTPError if the API has no channel for the username, now or within the negative cache's TTL
         """
-        if cached := current_session.query(cls).filter(cls.username == username or cls.username == username.lower()).first():
+        if cached := current_session.query(cls).filter(func.lower(cls.username) == username.lower()).first():
             return cached
         if cache_only:
             return
+        if NegativeResult.is_known(NegativeResult.USERNAME, username):
+            raise HTTPError(f"No channel found for username '{username}' by a recent lookup")
 
-        channels, _ = cls.get('channels', {'part': 'contentDetails,snippet', 'forUsername': username})
+        try:
+            channels, _ = cls.get('channels', {'part': 'contentDetails,snippet', 'forUsername': username})
+        except HTTPError as err:
+            if http_client.is_not_found(err):
+                NegativeResult.add(NegativeResult.USERNAME, {username: err})
+            raise
         assert len(channels) == 1, f'Returned unexpected number of channels: {channels}'
 
         # Usernames are queryable, but not returned by by the API. To speed up future queries,
@@ -99,17 +175,50 @@ class Channel(YoutubeObject):
             current_session.commit()
             return cached_by_id
 
-        new_channel = cls(id=channels[0]['id'],
-                          title=channels[0]['snippet']['title'],
-                          uploads_id=channels[0]['contentDetails']['relatedPlaylists']['uploads'],
-                          thumbnail_url=channels[0]['snippet']['thumbnails'].get('medium', {}).get('url'),
-                          url=channels[0]['snippet'].get('customUrl'),
-                          username=username
-                          )
+        new_channel = cls(**cls.columns_from_api_item(channels[0]), username=username)
         current_session.add(new_channel)
         current_session.commit()
         return new_channel
 
+    @classmethod
+    def from_usernames(cls, usernames: set) -> dict:
+        """
+        Queries the cache for channels with any of the given usernames, in one query.
+        Usernames are matched case-insensitively, as in from_username.
+
+        :param usernames: set of Youtube channel usernames, eg: {'VioletaOrlandi'}.
+        :return: dict of username to matching Channel instance. Usernames with no match are omitted.
+        """
+        if not usernames:
+            return {}
+        query = current_session.query(cls).filter(func.lower(cls.username).in_({u.lower() for u in usernames}))
+        by_username = {c.username.lower(): c for c in query}
+        return {u: by_username[u.lower()] for u in usernames if u.lower() in by_username}
+
+    @classmethod
+    def from_urls(cls, urls: set) -> dict:
+        """
+        Queries the cache for channels with any of the given urls, resolving known redirects
+        and usernames through UrlLookup, as from_url does. Uses a fixed number of queries.
+
+        :param urls: set of URLs to look up. eg: {'VioletOrlandi'}
+        :return: dict of URL to matching Channel instance. URLs with no match are omitted.
+        """
+        if not urls:
+            return {}
+        lookups = UrlLookup.for_urls(urls)
+        usernames = {url: lookups[url].resolved for url in urls if url in lookups and lookups[url].is_username}
+        resolved = {url: (lookups[url].resolved if url in lookups else None) or url for url in urls if url not in usernames}
+
+        by_username = cls.from_usernames(set(usernames.values()))
+        by_url = {}
+        if resolved:
+            query = current_session.query(cls).filter(func.lower(cls.url).in_({u.lower() for u in resolved.values()}))
+            by_url = {c.url.lower(): c for c in query}
+        channels = {url: by_username[username] for url, username in usernames.items() if username in by_username}
+        channels.update({url: by_url[resolved_url.lower()] for url, resolved_url in resolved.items() if resolved_url.lower() in by_url})
+        return channels
+
     @classmethod
     def from_url(cls, url, cache_only=False):
         """
@@ -129,26 +238,55 @@ class Channel(YoutubeObject):
             return cls.from_username(UrlLookup.get_resolved(url), cache_only=cache_only)
 
         url = UrlLookup.get_resolved(url) or url
-        if cached := current_session.query(cls).filter(cls.url == url or cls.url == url.lower()).first():
+        if cached := current_session.query(cls).filter(func.lower(cls.url) == url.lower()).first():
             return cached
         if cache_only:
             return
 
-        logger.debug(f"Querying web for channel with URL {url}")
-        response = requests.get(f'https://www.youtube.com/{url}', cookies={'CONSENT': 'YES+GB.en-GB+V9+BX'})
-
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content.decode(), 'html.parser')
-            if og_url := soup.find('meta', property='og:url'):
-                if "/user/" in response.url:
-                    channel = cls.from_username(response.url.split("/")[-1])
-                    current_session.add(UrlLookup(original=url, resolved=response.url.split("/")[-1], is_username=True))
-                else:
-                    channel = cls.from_id(og_url['content'].split("/")[-1])
-                    current_session.add(UrlLookup(original=url, resolved=channel.url, is_username=False))
-                current_session.commit()
-                return channel
+        channels, failed = cls.resolve_urls({url})
+        if url in failed:
+            raise failed[url]
+        return channels.get(url)
+
+    @classmethod
+    def resolve_urls(cls, urls: set) -> tuple:
+        """
+        Bulk version of from_url for URLs that aren't cached. All URLs are visited concurrently,
+        then the channels they lead to are fetched with a bulk lookup, and the UrlLookups are written in one insert.
+        URLs which lead nowhere, or to a channel the API doesn't have, are remembered in the negative cache,
+        and aren't visited again until they expire.
+
+        :param urls: set of URLs to look up. eg: {'VioletOrlandi'}
+        :return: tuple of dict of URL to Channel instance, and dict of URL to the HTTPError raised for any that failed
+        """
+        if not urls:
+            return {}, {}
+        failed = {url: HTTPError(f"No channel found for url '{url}' by a recent lookup")
+                  for url in NegativeResult.known(NegativeResult.URL, urls)}
+        resolved, new_failures = url_resolver.resolve_urls(set(urls) - failed.keys())
+        failed.update(new_failures)
+        errors = {}
+        by_id = cls.from_ids({r.value for r in resolved.values() if not r.is_username}, errors=errors)
+
+        channels, lookups = {}, []
+        for url, result in resolved.items():
+            if result.is_username:
+                try:
+                    channels[url] = cls.from_username(result.value)
+                except HTTPError as err:
+                    failed[url] = err
+                    continue
+                lookups.append({'original': url, 'resolved': result.value, 'is_username': True})
+            elif channel := by_id.get(result.value):
+                channels[url] = channel
+                lookups.append({'original': url, 'resolved': channel.url, 'is_username': False})
             else:
-                raise HTTPError(f"Could not find og:url meta tag for url {url}")
-        else:
-            raise HTTPError(f"Request responded with {response.status_code} for {url}")
+                # The API was asked for the channel, and didn't return it, unless the request itself failed
+                failed[url] = new_failures[url] = errors.get(result.value) or \
+                    http_client.not_found(f"Could not find channel '{result.value}' for url {url}")
+
+        NegativeResult.add(NegativeResult.URL, {url: err for url, err in new_failures.items() if http_client.is_not_found(err)})
+        if lookups:
+            current_session.execute(dialect_insert(UrlLookup.__table__).on_conflict_do_nothing(), lookups)
+            current_session.commit()
+        return channels, failed
@@ -15,9 +15,9 @@ class Collaboration(Base):
     __tablename__ = "collaboration"
 
     id = Column(Integer, primary_key=True)
-    channel_1_id = Column(String, ForeignKey('channel.id'))
-    channel_2_id = Column(String, ForeignKey('channel.id'))
-    video_id = Column(String, ForeignKey('video.id'))
+    channel_1_id = Column(String, ForeignKey('channel.id'), index=True)
+    channel_2_id = Column(String, ForeignKey('channel.id'), index=True)
+    video_id = Column(String, ForeignKey('video.id'), index=True)
     channel_1 = relationship("Channel", foreign_keys=[channel_1_id], lazy='subquery')
     channel_2 = relationship("Channel", foreign_keys=[channel_2_id], lazy='subquery')
     video = relationship("Video", backref="collaboration", lazy='subquery')
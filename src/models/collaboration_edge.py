@@ -0,0 +1,64 @@
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, Integer, String, ForeignKey, func, literal, select
+from sqlalchemy.orm import relationship
+
+from src.extensions import Base, dialect_insert
+from src.models.collaboration import Collaboration
+
+
+class CollaborationEdge(Base):
+    """
+    Number of collaborations between a host channel and a guest appearing in the host's videos.
+    This is an aggregate of the collaboration table, kept up to date as collaborations are added,
+    so a channel's collaboration network can be read without scanning every collaboration.
+    """
+    __tablename__ = "collaboration_edge"
+
+    host_id = Column(String, ForeignKey('channel.id'), primary_key=True)
+    guest_id = Column(String, ForeignKey('channel.id'), primary_key=True, index=True)
+    collaborations = Column(Integer, nullable=False)
+    host = relationship("Channel", foreign_keys=[host_id], lazy='joined')
+    guest = relationship("Channel", foreign_keys=[guest_id], lazy='joined')
+
+    def __repr__(self):
+        return f"{self.host.title} - {self.guest.title} - {self.collaborations}"
+
+    @classmethod
+    def increment(cls, pairs: dict):
+        """
+        Add newly created collaborations to the counts, in a single upsert.
+        Doesn't commit, so the counts are committed in the same transaction as the collaborations.
+
+        :param pairs: dict of (host ID, guest ID) to the number of new collaborations between them
+        """
+        if not pairs:
+            return
+        insert = dialect_insert(cls.__table__)
+        upsert = insert.on_conflict_do_update(index_elements=['host_id', 'guest_id'],
+                                              set_={'collaborations': cls.__table__.c.collaborations + insert.excluded.collaborations})
+        current_session.execute(upsert, [{'host_id': host_id, 'guest_id': guest_id, 'collaborations': count}
+                                         for (host_id, guest_id), count in pairs.items()])
+
+    @classmethod
+    def for_target_channel(cls, target_channel) -> list:
+        """
+        Return the edges between the target channel and the guests in its videos, and between those guests.
+        Equivalent to aggregating Collaboration.for_target_channel, in a single query.
+
+        :param target_channel: Channel object for target channel
+        :return: list of matching CollaborationEdge objects, with host and guest channels loaded.
+        """
+        partners = select(cls.guest_id).where(cls.host_id == target_channel.id).union(select(literal(target_channel.id)))
+        return current_session.query(cls).filter(cls.host_id.in_(partners), cls.guest_id.in_(partners)).all()
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recalculate every count from the collaboration table. Used to populate the table
+        for collaborations that were created before it existed.
+        """
+        counts = select(Collaboration.channel_1_id, Collaboration.channel_2_id, func.count())\
+            .group_by(Collaboration.channel_1_id, Collaboration.channel_2_id)
+        current_session.query(cls).delete()
+        current_session.execute(cls.__table__.insert().from_select(['host_id', 'guest_id', 'collaborations'], counts))
+        current_session.commit()
@@ -0,0 +1,178 @@
+import datetime
+
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, String, Integer, DateTime, Index, and_, or_, exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from src import config
+from src.extensions import Base, dialect_insert
+
+
+class CrawlJob(Base):
+    """
+    A crawl requested from the web app, and run by a worker process (see src/worker.py), so requests don't wait for it.
+    Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED in Postgres. The claim is also a conditional update,
+    so two workers never run the same job, even with SQLite, which doesn't support row locks.
+
+    Running jobs are updated at least every config.crawl_job_heartbeat_seconds. If a worker stops, its job is claimed
+    again after config.crawl_job_timeout_minutes. The resumed crawl reuses the guests the job saved, the mentions stored
+    for host videos already searched, and skips videos already processed for the channel. See get_collaborations.crawl_channel
+    Progress is committed in its own session, so it's visible while the crawl's own transactions are open.
+    """
+    __tablename__ = "crawl_job"
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # Phases of a crawl, in order. See get_collaborations.crawl_channel
+    GUEST_DISCOVERY = 'guest_discovery'
+    UPLOADS = 'uploads'
+    COLLABORATIONS = 'collaborations'
+
+    id = Column(Integer, primary_key=True)
+    channel_name = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False)
+    phase = Column(String)
+    videos_done = Column(Integer, nullable=False)
+    videos_total = Column(Integer)
+    # Pipe delimited IDs of the guest channels found, so a resumed crawl doesn't search the host's videos again
+    guest_ids = Column(String)
+    # Set when the job is queued for a refresh of a cached channel, or when a crawl finishes
+    channel_id = Column(String, index=True)
+    # Name of the exception that failed the crawl
+    error = Column(String)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    # Serves claiming the next job. The partial unique indexes allow one queued job per channel name and ID,
+    # so concurrent requests can't queue the same crawl twice. See CrawlJob.claim for running jobs.
+    __table_args__ = (Index('ix_crawl_job_status_updated_at', status, updated_at),
+                      Index('uq_crawl_job_queued_channel_name', channel_name, unique=True,
+                            postgresql_where=status == QUEUED, sqlite_where=status == QUEUED),
+                      Index('uq_crawl_job_queued_channel_id', channel_id, unique=True,
+                            postgresql_where=status == QUEUED, sqlite_where=status == QUEUED))
+
+    def __repr__(self):
+        return f"{self.id} - {self.channel_name} - {self.status}"
+
+    def to_dict(self) -> dict:
+        return {'id': self.id,
+                'channel_name': self.channel_name,
+                'status': self.status,
+                'phase': self.phase,
+                'videos_done': self.videos_done,
+                'videos_total': self.videos_total,
+                'error': self.error}
+
+    @classmethod
+    def enqueue(cls, channel_name: str, channel_id: str = None):
+        """
+        Queue a crawl of the channel, unless one is already queued or running, or finished within
+        config.refresh_after_minutes. In those cases, the existing job is returned instead.
+        The insert is ignored if another request queues the channel first, in which case that job is returned.
+
+        :param channel_name: Name of channel, as shown on the Youtube webpage.
+        :param channel_id: Default None. ID of the channel, if it's cached. Jobs for the channel under other names are also reused.
+        :return: CrawlJob instance
+        """
+        now = datetime.datetime.utcnow()
+        same_channel = or_(cls.channel_name == channel_name, cls.channel_id == channel_id) if channel_id else cls.channel_name == channel_name
+        latest = current_session.query(cls).filter(same_channel).order_by(cls.id.desc()).first()
+        if latest and (latest.status in (cls.QUEUED, cls.RUNNING) or
+                       latest.updated_at >= now - datetime.timedelta(minutes=config.refresh_after_minutes)):
+            return latest
+
+        values = {'channel_name': channel_name, 'channel_id': channel_id, 'status': cls.QUEUED, 'videos_done': 0,
+                  'created_at': now, 'updated_at': now}
+        result = current_session.execute(dialect_insert(cls.__table__).on_conflict_do_nothing(), values)
+        current_session.commit()
+        if result.rowcount == 1:
+            return current_session.get(cls, result.inserted_primary_key[0])
+        return current_session.query(cls).filter(same_channel, cls.status.in_([cls.QUEUED, cls.RUNNING])).order_by(cls.id.desc()).first()
+
+    @classmethod
+    def claim(cls):
+        """
+        Claim the oldest queued job, or a running job whose worker has stopped, and mark it as running.
+        Jobs for a channel another worker is crawling, under the same name or ID, are left until it finishes.
+        eg: a job queued by a request that read the channel's last job just before another request queued a new one.
+
+        :return: CrawlJob instance, or None if there are no jobs to run
+        """
+        now = datetime.datetime.utcnow()
+        abandoned = now - datetime.timedelta(minutes=config.crawl_job_timeout_minutes)
+        other = aliased(cls)
+        crawling = exists().where(other.id != cls.id, other.status == cls.RUNNING, other.updated_at >= abandoned,
+                                  or_(other.channel_name == cls.channel_name, other.channel_id == cls.channel_id))
+        claimable = and_(or_(cls.status == cls.QUEUED, and_(cls.status == cls.RUNNING, cls.updated_at < abandoned)), ~crawling)
+
+        job_id = current_session.query(cls.id).filter(claimable).order_by(cls.id).with_for_update(skip_locked=True).limit(1).scalar()
+        claimed = job_id is not None and current_session.query(cls).filter(cls.id == job_id, claimable).update(
+            {cls.status: cls.RUNNING, cls.updated_at: now}, synchronize_session=False) == 1
+        current_session.commit()
+        if claimed:
+            return current_session.get(cls, job_id)
+
+    @classmethod
+    def get(cls, job_id: int):
+        return current_session.get(cls, job_id)
+
+    @classmethod
+    def _update(cls, job_id: int, values: dict):
+        values[cls.updated_at] = datetime.datetime.utcnow()
+        with Session(current_session.get_bind()) as session:
+            session.query(cls).filter(cls.id == job_id).update(values, synchronize_session=False)
+            session.commit()
+
+    @classmethod
+    def start_phase(cls, job_id: int, phase: str, videos_total: int = None):
+        """
+        :param job_id: ID of the running job
+        :param phase: Phase the crawl is starting, eg: CrawlJob.UPLOADS
+        :param videos_total: Default None. Number of videos the phase will process, if it's known up front.
+        """
+        cls._update(job_id, {cls.phase: phase, cls.videos_done: 0, cls.videos_total: videos_total})
+
+    @classmethod
+    def add_progress(cls, job_id: int, videos_done: int):
+        """
+        Count videos processed in the current phase. Also shows the job's worker is still running, even if no videos are done.
+
+        :param job_id: ID of the running job
+        :param videos_done: Number of videos processed since the last update
+        """
+        cls._update(job_id, {cls.videos_done: cls.videos_done + videos_done})
+
+    @classmethod
+    def save_guests(cls, job_id: int, channel_ids: set):
+        cls._update(job_id, {cls.guest_ids: '|'.join(sorted(channel_ids))})
+
+    @classmethod
+    def saved_guests(cls, job_id: int):
+        """
+        :param job_id: ID of the running job
+        :return: set of guest channel IDs found by an earlier run of the job, or None if it hasn't found them yet
+        """
+        if guest_ids := current_session.query(cls.guest_ids).filter(cls.id == job_id).scalar():
+            return set(guest_ids.split('|'))
+
+    @classmethod
+    def finish(cls, job_id: int, channel_id: str):
+        cls._update(job_id, {cls.status: cls.DONE, cls.channel_id: channel_id})
+
+    @classmethod
+    def fail(cls, job_id: int, error: Exception):
+        cls._update(job_id, {cls.status: cls.FAILED, cls.error: type(error).__name__})
+
+    @classmethod
+    def release(cls, job_id: int):
+        """
+        Return a job to the queue, for another worker to resume, eg: when its worker is shut down.
+        If the channel has been queued again since, that job crawls it instead, and this one is failed.
+        """
+        try:
+            cls._update(job_id, {cls.status: cls.QUEUED})
+        except IntegrityError:
+            cls._update(job_id, {cls.status: cls.FAILED, cls.error: 'WorkerStopped'})
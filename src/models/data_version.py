@@ -0,0 +1,48 @@
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, Integer, String, ForeignKey
+
+from src.extensions import Base, dialect_insert
+from src.models.collaboration_edge import CollaborationEdge
+
+
+class DataVersion(Base):
+    """
+    Counter for each channel, incremented whenever new collaborations involving that channel are stored.
+    Used to tell whether anything derived from a channel's collaborations, or its guests', is out of date.
+    """
+    __tablename__ = "data_version"
+
+    channel_id = Column(String, ForeignKey('channel.id'), primary_key=True)
+    version = Column(Integer, nullable=False)
+
+    @classmethod
+    def bump(cls, channel_ids: set):
+        """
+        Increment the version of each channel, in a single upsert.
+        Doesn't commit, so the new versions are committed along with the data that changed.
+
+        :param channel_ids: set of IDs of channels whose collaborations have changed
+        """
+        if not channel_ids:
+            return
+        insert = dialect_insert(cls.__table__)
+        upsert = insert.on_conflict_do_update(index_elements=['channel_id'], set_={'version': cls.__table__.c.version + 1})
+        current_session.execute(upsert, [{'channel_id': channel_id, 'version': 1} for channel_id in channel_ids])
+
+    @classmethod
+    def describe(cls, *channels) -> str:
+        """
+        Summarise the current versions of the given channels' networks. A channel's graph also draws the collaborations
+        between the guests in its videos, so each channel's network is itself and those guests, and its summary is the
+        total of their versions. Versions only increase, so the result changes whenever any of them is bumped.
+
+        :param channels: Channel instances, or None
+        :return: string of channel IDs and network versions, eg: 'UCo3AxjxePfj6DHn03aiIhww:3|'
+        """
+        ids = [c.id for c in channels if c]
+        networks = {channel_id: {channel_id} for channel_id in ids}
+        for host_id, guest_id in current_session.query(CollaborationEdge.host_id, CollaborationEdge.guest_id).filter(CollaborationEdge.host_id.in_(ids)):
+            networks[host_id].add(guest_id)
+        members = set().union(*networks.values())
+        versions = dict(current_session.query(cls.channel_id, cls.version).filter(cls.channel_id.in_(members)))
+        return "|".join(f"{c.id}:{sum(versions.get(m, 0) for m in networks[c.id])}" if c else "" for c in channels)
@@ -0,0 +1,73 @@
+import datetime
+import json
+
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, String, Text, Float, DateTime, func, select
+
+from src import config
+from src.extensions import Base, dialect_insert
+
+
+class GraphCache(Base):
+    """
+    Render-ready graph data for a channel, and the channel the user navigated from.
+    Entries are only valid for the data versions they were built from. Once the cache is full,
+    the least recently used entries are evicted. Stored in the database so every worker shares it.
+    """
+    __tablename__ = "graph_cache"
+
+    key = Column(String, primary_key=True)
+    versions = Column(String, nullable=False)
+    collab_data = Column(Text, nullable=False)
+    node_size = Column(Float, nullable=False)
+    last_used = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return self.key + " - " + self.versions
+
+    @staticmethod
+    def make_key(channel, previous_channel) -> str:
+        """
+        :param channel: Channel the graph is drawn for
+        :param previous_channel: Channel the user navigated from, or None
+        :return: cache key for the pair
+        """
+        return f"{channel.id}|{previous_channel.id if previous_channel else ''}"
+
+    @classmethod
+    def get(cls, key: str, versions: str):
+        """
+        Retrieve the graph data for the given key, if it was built from the given data versions.
+
+        :param key: Key from make_key
+        :param versions: Current data versions, from DataVersion.describe
+        :return: tuple of collab_data (dict) and node_size (float), or None
+        """
+        entry = current_session.get(cls, key)
+        if entry is None or entry.versions != versions:
+            return None
+        entry.last_used = datetime.datetime.now()
+        current_session.commit()
+        return json.loads(entry.collab_data), entry.node_size
+
+    @classmethod
+    def add(cls, key: str, versions: str, collab_data: dict, node_size: float):
+        """
+        Store graph data, replacing any older entry for the same key, then evict entries over the size limit.
+
+        :param key: Key from make_key
+        :param versions: Data versions the graph was built from, from DataVersion.describe
+        :param collab_data: dict of nodes and edges, as passed to the template
+        :param node_size: node size, as passed to the template
+        """
+        row = {'key': key, 'versions': versions, 'collab_data': json.dumps(collab_data),
+               'node_size': node_size, 'last_used': datetime.datetime.now()}
+        insert = dialect_insert(cls.__table__)
+        updates = {column: insert.excluded[column] for column in row if column != 'key'}
+        current_session.execute(insert.on_conflict_do_update(index_elements=['key'], set_=updates), row)
+
+        size = current_session.query(func.count(cls.key)).scalar()
+        if size > config.graph_cache_size:
+            oldest = select(cls.key).order_by(cls.last_used).limit(size - config.graph_cache_size)
+            current_session.query(cls).filter(cls.key.in_(oldest)).delete(synchronize_session=False)
+        current_session.commit()
@@ -0,0 +1,105 @@
+import datetime
+
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.orm import Session
+
+from src import config
+from src.extensions import Base, dialect_insert
+
+
+class NegativeResult(Base):
+    """
+    Lookups which found nothing, such as a URL that 404s, a deleted video, or a search with no results.
+    These are remembered until they expire, so re-crawls don't spend quota and time repeating them.
+    Only lookups that found nothing are stored. Transient failures, like timeouts, are tried again on the next crawl.
+
+    Results are committed in their own session, so they aren't lost if the calling request rolls back.
+    """
+    __tablename__ = "negative_result"
+
+    # Kinds of lookup remembered. URLs and usernames are matched case-insensitively, so their keys are stored lowercase.
+    URL = 'url'
+    USERNAME = 'username'
+    VIDEO = 'video'
+    SEARCH = 'search'
+    CASE_INSENSITIVE = {URL, USERNAME}
+
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    reason = Column(String)
+
+    def __repr__(self):
+        return f"{self.kind} - {self.key} - {self.expires_at}"
+
+    @classmethod
+    def normalise(cls, kind: str, key: str) -> str:
+        return key.lower() if kind in cls.CASE_INSENSITIVE else key
+
+    @classmethod
+    def known(cls, kind: str, keys: set) -> set:
+        """
+        Find which of the given keys are known to find nothing, in one query.
+
+        :param kind: Kind of lookup, eg: NegativeResult.URL
+        :param keys: set of keys looked up, eg: {'VioletOrlandi'}
+        :return: set of the given keys with an unexpired negative result
+        """
+        if not keys:
+            return set()
+        normalised = {cls.normalise(kind, key): key for key in keys}
+        query = current_session.query(cls.key).filter(cls.kind == kind, cls.key.in_(normalised),
+                                                      cls.expires_at > datetime.datetime.utcnow())
+        return {normalised[key] for key, in query}
+
+    @classmethod
+    def is_known(cls, kind: str, key: str) -> bool:
+        """
+        :param kind: Kind of lookup, eg: NegativeResult.USERNAME
+        :param key: Key looked up, eg: 'VioletaOrlandi'
+        :return: True if the key has an unexpired negative result
+        """
+        return bool(cls.known(kind, {key}))
+
+    @classmethod
+    def add(cls, kind: str, reasons: dict):
+        """
+        Remember that each key found nothing, until config.negative_cache_ttl_hours from now.
+        Keys already stored have their expiry extended. If the cache then holds more than
+        config.negative_cache_size results, expired results and those closest to expiring are dropped.
+
+        :param kind: Kind of lookup, eg: NegativeResult.VIDEO
+        :param reasons: dict of key to the reason it found nothing, eg: {'ZUeA9_f2JTw': 'API responded with no items'}
+        """
+        if not reasons:
+            return
+        now = datetime.datetime.utcnow()
+        expires_at = now + datetime.timedelta(hours=config.negative_cache_ttl_hours)
+        rows = {cls.normalise(kind, key): {'kind': kind, 'key': cls.normalise(kind, key), 'expires_at': expires_at, 'reason': str(reason)}
+                for key, reason in reasons.items()}
+        insert = dialect_insert(cls.__table__)
+        insert = insert.on_conflict_do_update(index_elements=['kind', 'key'],
+                                              set_={'expires_at': insert.excluded.expires_at, 'reason': insert.excluded.reason})
+        with Session(current_session.get_bind()) as session:
+            session.execute(insert, list(rows.values()))
+            session.query(cls).filter(cls.expires_at <= now).delete(synchronize_session=False)
+            cutoff = session.query(cls.expires_at).order_by(cls.expires_at.desc()).offset(config.negative_cache_size).limit(1).scalar()
+            if cutoff:
+                session.query(cls).filter(cls.expires_at <= cutoff).delete(synchronize_session=False)
+            session.commit()
+
+    @classmethod
+    def purge(cls, kind: str = None) -> int:
+        """
+        Forget stored results, so they're looked up again on the next crawl.
+
+        :param kind: Default None. Kind of lookup to forget, eg: NegativeResult.SEARCH. If None, all results are forgotten.
+        :return: Number of results removed
+        """
+        query = current_session.query(cls)
+        if kind:
+            query = query.filter(cls.kind == kind)
+        removed = query.delete(synchronize_session=False)
+        current_session.commit()
+        return removed
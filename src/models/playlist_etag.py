@@ -0,0 +1,41 @@
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, String
+
+from src.extensions import Base, dialect_insert
+
+
+class PlaylistETag(Base):
+    """
+    ETag of the first page of a playlist, when its videos were last cached.
+    Sent back as If-None-Match, so the API can respond with 304 Not Modified if nothing has been uploaded since.
+    Only the first page is tracked, as new uploads are added to the start of the playlist, changing every page after.
+    """
+    __tablename__ = "playlist_etag"
+
+    playlist_id = Column(String, primary_key=True)
+    etag = Column(String, nullable=False)
+
+    def __repr__(self):
+        return self.playlist_id + " - " + self.etag
+
+    @classmethod
+    def for_playlist(cls, playlist_id: str) -> str:
+        """
+        :param playlist_id: ID of playlist, eg: 'UUo3AxjxePfj6DHn03aiIhww'
+        :return: ETag of the playlist's first page, or None if it hasn't been cached
+        """
+        if cached := current_session.get(cls, playlist_id):
+            return cached.etag
+
+    @classmethod
+    def save(cls, playlist_id: str, etag: str):
+        """
+        Record the ETag of a playlist's first page, replacing any previous ETag.
+        Doesn't commit, so it's only saved if the videos from the playlist are.
+
+        :param playlist_id: ID of playlist
+        :param etag: ETag header of the first page
+        """
+        insert = dialect_insert(cls.__table__)
+        current_session.execute(insert.on_conflict_do_update(index_elements=['playlist_id'], set_={'etag': insert.excluded.etag}),
+                                {'playlist_id': playlist_id, 'etag': etag})
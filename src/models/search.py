@@ -1,6 +1,9 @@
 from flask_sqlalchemy_session import current_session
+from requests import HTTPError
 from sqlalchemy import Column, String
 
+from src.controllers import http_client
+from src.models.negative_result import NegativeResult
 from src.models.youtube_object import YoutubeObject
 
 
@@ -10,11 +13,25 @@ class SearchResult(YoutubeObject):
 
     id = Column(String, primary_key=True)
     title = Column(String)
-    search_term = Column(String, primary_key=True)
+    search_term = Column(String, primary_key=True, index=True)
 
     def __repr__(self):
         return self.search_term + " - " + self.title + " - " + self.id
 
+    @classmethod
+    def from_terms(cls, search_terms: set) -> dict:
+        """
+        Retrieve cached search results for all of the given search terms, in one query.
+
+        :param search_terms: set of terms to look up
+        :return: dict of search term to list of SearchResult objects. Terms with no cached results are omitted.
+        """
+        results = {}
+        if search_terms:
+            for result in current_session.query(cls).filter(cls.search_term.in_(search_terms)):
+                results.setdefault(result.search_term, []).append(result)
+        return results
+
     @classmethod
     def from_term(cls, search_term, cache_only=False):
         """
@@ -24,11 +41,14 @@ class SearchResult(YoutubeObject):
         :param search_term: Term to search for
         :param cache_only: Default False. If True, only search the cache.
         :return: list of SearchResults objects or None
+        :raises: HTTPError if the API finds no channels for the term, now or within the negative cache's TTL
         """
         if cached := current_session.query(cls).filter(cls.search_term == search_term).all():
             return cached
         if cache_only:
             return
+        if NegativeResult.is_known(NegativeResult.SEARCH, search_term):
+            raise HTTPError(f"No channels found for search term '{search_term}' by a recent search")
 
         params = {
             'part': 'snippet',
@@ -37,7 +57,12 @@ class SearchResult(YoutubeObject):
             'type': 'channel'
         }
 
-        api_items, _ = cls.get('search', params)
+        try:
+            api_items, _ = cls.get('search', params)
+        except HTTPError as err:
+            if http_client.is_not_found(err):
+                NegativeResult.add(NegativeResult.SEARCH, {search_term: err})
+            raise
         results = []
         for item in api_items:
             result = cls(id=item['id'].get('channelId'), title=item['snippet']['title'], search_term=search_term)
@@ -1,5 +1,5 @@
 from flask_sqlalchemy_session import current_session
-from sqlalchemy import Column, String, Boolean
+from sqlalchemy import Column, String, Boolean, Index, func
 
 from src.extensions import Base
 
@@ -15,10 +15,27 @@ class UrlLookup(Base):
     original = Column(String, primary_key=True)
     resolved = Column(String)
     is_username = Column(Boolean)
+    # URLs are matched case-insensitively
+    __table_args__ = (Index('ix_url_lookup_original_lower', func.lower(original)),)
 
     def __repr__(self):
         return self.original + " - " + self.resolved
 
+    @classmethod
+    def for_urls(cls, urls: set) -> dict:
+        """
+        Retrieve the lookups for all of the given URLs, in one query.
+        URLs are matched case-insensitively, as in get_resolved.
+
+        :param urls: set of URLs to resolve
+        :return: dict of given URL to UrlLookup instance. URLs with no lookup are omitted.
+        """
+        if not urls:
+            return {}
+        query = current_session.query(cls).filter(func.lower(cls.original).in_({url.lower() for url in urls}))
+        lookups = {lookup.original.lower(): lookup for lookup in query}
+        return {url: lookups[url.lower()] for url in urls if url.lower() in lookups}
+
     @classmethod
     def get_resolved(cls, url: str) -> str:
         """
@@ -28,7 +45,7 @@ class UrlLookup(Base):
         :param url: URL to resolve
         :return: Resolved URL of None
         """
-        if lookup := current_session.query(cls).filter(cls.original == url or cls.original == url.lower()).first():
+        if lookup := current_session.query(cls).filter(func.lower(cls.original) == url.lower()).first():
             return lookup.resolved
 
     @classmethod
@@ -39,5 +56,5 @@ class UrlLookup(Base):
         :param url: URL to check
         :return: bool if URL found, None if not
         """
-        if lookup := current_session.query(cls).filter(cls.original == url or cls.original == url.lower()).first():
+        if lookup := current_session.query(cls).filter(func.lower(cls.original) == url.lower()).first():
             return lookup.is_username
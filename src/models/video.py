@@ -1,16 +1,33 @@
 import datetime
 import logging
-import re
 
 from flask_sqlalchemy_session import current_session
-from sqlalchemy import Column, String, DateTime
+from requests import HTTPError
+from sqlalchemy import Column, String, Boolean, DateTime, Index, exists, inspect
 
+from src.controllers import http_client, link_extractor
+from src.extensions import dialect_insert
 from src.models.channel import Channel
-from src.models.youtube_object import YoutubeObject
+from src.models.negative_result import NegativeResult
+from src.models.playlist_etag import PlaylistETag
+from src.models.video_link import VideoLink
+from src.models.video_processed_for import VideoProcessedFor
+from src.models.youtube_object import YoutubeObject, MAX_RESULTS
 
 logger = logging.getLogger()
 
 
+def parse_timestamps(timestamps: list) -> list:
+    """
+    Parse timestamps returned by the API, eg: '2021-03-04T17:00:11Z'.
+    fromisoformat is several times faster than strptime, but doesn't accept the 'Z' suffix until Python 3.11.
+
+    :param timestamps: list of timestamp strings, in UTC
+    :return: list of naive datetimes, in UTC
+    """
+    return [datetime.datetime.fromisoformat(timestamp.rstrip('Z')) for timestamp in timestamps]
+
+
 class Video(YoutubeObject):
     """Representation of a Video as returned from the Youtube 'videos' API endpoint"""
     __tablename__ = "video"
@@ -21,7 +38,14 @@ class Video(YoutubeObject):
     description = Column(String, nullable=False)
     thumbnail_url = Column(String)
     published_at = Column(DateTime, nullable=False)
-    processed_for = Column(String, default='')
+    # Legacy pipe delimited list of channel IDs. Superseded by VideoProcessedFor, and emptied by migrate_processed_for
+    processed_for = Column(String)
+    # True once the links in the description are stored as VideoLinks. Videos cached before these were stored are extracted on first use
+    links_extracted = Column(Boolean)
+    # True once the channels mentioned in the video are resolved with the API, and stored as VideoMentions, during guest discovery
+    mentions_resolved = Column(Boolean)
+    # Serves listing a channel's uploads, newest first
+    __table_args__ = (Index('ix_video_channel_id_published_at', channel_id, published_at),)
 
     def __repr__(self):
         return self.title + " - " + self.id
@@ -36,23 +60,77 @@ class Video(YoutubeObject):
         :param cache_only: Default False. If True, only search the cache.
         :return: Matching Video instance or None.
         :raises: AssertionError if more or less than 1 video is returned from the API
+        :raises: HTTPError if the API has no video with the ID, now or within the negative cache's TTL
         """
         if cached := current_session.query(cls).filter(cls.id == id).first():
             return cached
         if cache_only:
             return
+        if NegativeResult.is_known(NegativeResult.VIDEO, id):
+            raise HTTPError(f"No video found for ID '{id}' by a recent lookup")
 
         params = {'part': 'snippet', 'id': id}
-        videos, _ = cls.get('videos', params)
+        try:
+            videos, _ = cls.get('videos', params)
+        except HTTPError as err:
+            if http_client.is_not_found(err):
+                NegativeResult.add(NegativeResult.VIDEO, {id: err})
+            raise
         assert len(videos) == 1, f'Returned unexpected number of videos: {videos}'
 
         # Don't cache videos returned from individual lookups, as it breaks the ability to refresh an uploads playlist
-        return cls(id=videos[0]['id'],
-                   channel_id=videos[0]['snippet']['channelId'],
-                   title=videos[0]['snippet']['title'],
-                   description=videos[0]['snippet']['description'],
-                   thumbnail_url=videos[0]['snippet']['thumbnails'].get('medium', {}).get('url'),
-                   published_at=datetime.datetime.strptime(videos[0]['snippet']['publishedAt'], '%Y-%m-%dT%H:%M:%SZ'),
+        return cls.from_api_item(videos[0])
+
+    @classmethod
+    def from_ids(cls, ids: set, cache_only: bool = False) -> dict:
+        """
+        Bulk version of from_id. Queries the cache for all IDs in one query, then the API for
+        any missing IDs, in batches of up to 50 (the maximum the 'videos' endpoint accepts).
+        IDs that can't be found are omitted from the result, and remembered in the negative cache so they
+        aren't requested again until they expire.
+
+        :param ids: set of Youtube video IDs, eg: {'ZUeA9_f2JTw'}.
+        :param cache_only: Default False. If True, only search the cache.
+        :return: dict of video ID to matching Video instance.
+        """
+        if not ids:
+            return {}
+        videos = {v.id: v for v in current_session.query(cls).filter(cls.id.in_(ids))}
+        if cache_only:
+            return videos
+
+        missing = set(ids) - videos.keys()
+        missing = sorted(missing - NegativeResult.known(NegativeResult.VIDEO, missing))
+        not_found = {}
+        for idx in range(0, len(missing), MAX_RESULTS):
+            batch = missing[idx:idx + MAX_RESULTS]
+            try:
+                items, _ = cls.get('videos', {'part': 'snippet', 'id': ','.join(batch)})
+            except HTTPError as err:
+                if http_client.is_not_found(err):
+                    not_found.update({video_id: err for video_id in batch})
+                logger.error(f"Failed processing video IDs '{batch}' - {err}")
+                continue
+            # As with from_id, these aren't cached
+            videos.update({item['id']: cls.from_api_item(item) for item in items})
+            not_found.update({video_id: 'API responded without this video' for video_id in batch if video_id not in videos})
+        NegativeResult.add(NegativeResult.VIDEO, not_found)
+        return videos
+
+    @classmethod
+    def from_api_item(cls, item: dict):
+        """
+        Build a Video instance from an item returned by the 'videos' API endpoint.
+
+        :param item: dict of API response item
+        :return: Video instance, not added to the session
+        """
+        return cls(id=item['id'],
+                   channel_id=item['snippet']['channelId'],
+                   title=item['snippet']['title'],
+                   description=item['snippet']['description'],
+                   thumbnail_url=item['snippet']['thumbnails'].get('medium', {}).get('url'),
+                   published_at=parse_timestamps([item['snippet']['publishedAt']])[0],
                    )
 
     @classmethod
@@ -60,58 +138,182 @@ class Video(YoutubeObject):
         """
         Queries the Youtube API and retrieves a list of videos uploaded by that Channel.
         If the channel has previously been cached, then only newer unprocessed videos are returned.
+        The uploads playlist is only fetched if its first page has changed since the videos were cached.
 
         :param channel: Channel to retrieve uploads for
         :param cache_only: Default False. If true, only queries the database for videos
-        :return: list of unprocessed videos
+        :return: list of unprocessed videos, newest first
         """
-        params = {
-            'part': 'snippet',
-            'playlistId': channel.uploads_id,
-            'maxResults': 50
-        }
-        cached_videos = current_session.query(cls).filter(cls.channel_id == channel.id).order_by(cls.published_at.desc()).all()
-        if cache_only:
-            return cached_videos
+        if not cache_only:
+            cls.cache_uploads(channel)
+        return cls._unprocessed_query(current_session.query(cls), channel, cache_only).all()
+
+    @classmethod
+    def ids_from_channel(cls, channel: Channel) -> list:
+        """
+        Version of from_channel which only loads the IDs of the videos, so memory use doesn't grow
+        with the size of the video descriptions.
+
+        :param channel: Channel to retrieve uploads for
+        :return: list of unprocessed video IDs, newest first
+        """
+        cls.cache_uploads(channel)
+        return [video_id for video_id, in cls._unprocessed_query(current_session.query(cls.id), channel)]
 
+    @classmethod
+    def _unprocessed_query(cls, query, channel: Channel, cache_only=False):
+        query = query.filter(cls.channel_id == channel.id)
         # Only omit processed videos if the channel has been successfully processed before.
         # This stops collaborations being missed if a previous processed halted due to error.
-        if channel.processed:
-            unprocessed_videos = current_session.query(cls).filter(cls.channel_id == channel.id, ~cls.processed_for.contains(channel.id))\
-                .order_by(cls.published_at.desc()).all()
-        else:
-            unprocessed_videos = cached_videos
+        if channel.processed and not cache_only:
+            processed = exists().where(VideoProcessedFor.video_id == cls.id, VideoProcessedFor.channel_id == channel.id)
+            query = query.filter(~processed)
+        return query.order_by(cls.published_at.desc())
 
-        ids = [v.id for v in cached_videos]
-        latest_video = cached_videos[0] if cached_videos else None
-        playlist_content, next_page = cls.get('playlistItems', params)
+    @classmethod
+    def cache_uploads(cls, channel: Channel):
+        """
+        Cache any videos uploaded by the channel since its newest cached video.
+        Each page of the uploads playlist is written with a single insert as it arrives, so only one page
+        is held in memory. Everything is committed together, so an interrupted refresh is retried in full.
+        The links in each description are extracted and stored at the same time.
+
+        :param channel: Channel to retrieve uploads for
+        """
+        params = {
+            'part': 'snippet',
+            'playlistId': channel.uploads_id,
+            'maxResults': MAX_RESULTS
+        }
+        latest_id = current_session.query(cls.id).filter(cls.channel_id == channel.id).order_by(cls.published_at.desc()).limit(1).scalar()
+        etag = PlaylistETag.for_playlist(channel.uploads_id) if latest_id else None
+        playlist_content, next_page, first_page_etag = cls.get_page('playlistItems', params, etag)
+        if playlist_content is None:
+            logger.debug(f"No new uploads for channel '{channel}'")
+            return
+        if first_page_etag:
+            PlaylistETag.save(channel.uploads_id, first_page_etag)
 
         while True:
+            rows = {}
             for new_video in playlist_content:
-                if latest_video and latest_video.id == new_video['snippet']['resourceId']['videoId']:
-                    current_session.commit()
-                    return unprocessed_videos
-                if new_video['snippet']['resourceId']['videoId'] in ids:
-                    # Items uploaded on the same day aren't in the right order. Eg, videos at 1pm, 2pm, 3pm may come
-                    # back in order 2, 3, 1. This means the 1st video isn't the newest, if the code tries to cache it,
-                    # it would raise an IntegrityError as is already exists.
-                    logger.warning(f"Tried to cache video {new_video['snippet']['resourceId']['videoId']} when it already exists")
-                    continue
-
-                video_instance = cls(id=new_video['snippet']['resourceId']['videoId'],
-                                     channel_id=new_video['snippet']['channelId'],
-                                     title=new_video['snippet']['title'],
-                                     description=new_video['snippet']['description'],
-                                     thumbnail_url=new_video['snippet']['thumbnails'].get('medium', {}).get('url'),
-                                     published_at=datetime.datetime.strptime(new_video['snippet']['publishedAt'], '%Y-%m-%dT%H:%M:%SZ'))
-                current_session.add(video_instance)
-                unprocessed_videos.append(video_instance)
+                snippet = new_video['snippet']
+                video_id = snippet['resourceId']['videoId']
+                if video_id == latest_id:
+                    next_page = None
+                    break
+                # Items uploaded on the same day aren't in the right order, so a page can contain videos
+                # that are already cached. These are ignored by the insert.
+                rows[video_id] = {'id': video_id,
+                                  'channel_id': snippet['channelId'],
+                                  'title': snippet['title'],
+                                  'description': snippet['description'],
+                                  'thumbnail_url': snippet['thumbnails'].get('medium', {}).get('url'),
+                                  'published_at': snippet['publishedAt'],
+                                  'links_extracted': True}
+            if rows:
+                published = parse_timestamps([row['published_at'] for row in rows.values()])
+                for row, published_at in zip(rows.values(), published):
+                    row['published_at'] = published_at
+                current_session.execute(dialect_insert(cls.__table__).on_conflict_do_nothing(), list(rows.values()))
+                VideoLink.add({video_id: link_extractor.extract_links(row['description']) for video_id, row in rows.items()})
 
             if next_page is None:
                 current_session.commit()
-                return unprocessed_videos
+                return
             params['pageToken'] = next_page
-            playlist_content, next_page = cls.get('playlistItems', params)
+            playlist_content, next_page, _ = cls.get_page('playlistItems', params)
+
+    @classmethod
+    def mark_processed(cls, ids: set, target_channel: Channel):
+        """
+        Record that the given videos have been processed for the target channel, in a single insert.
+        Doesn't commit, so this is committed alongside the collaborations found in the videos.
+
+        :param ids: set of video IDs
+        :param target_channel: Channel the videos were processed for
+        """
+        VideoProcessedFor.add(ids, target_channel.id)
+
+    @classmethod
+    def processed_ids(cls, ids: set, target_channel: Channel) -> set:
+        """
+        :param ids: set of video IDs
+        :param target_channel: Channel the videos may have been processed for
+        :return: set of the IDs of the given videos that have been processed for the target channel
+        """
+        if not ids:
+            return set()
+        query = current_session.query(VideoProcessedFor.video_id)\
+            .filter(VideoProcessedFor.channel_id == target_channel.id, VideoProcessedFor.video_id.in_(ids))
+        return {video_id for video_id, in query}
+
+    @classmethod
+    def mentions_resolved_for(cls, ids: set) -> dict:
+        """
+        :param ids: set of video IDs
+        :return: dict of the ID of each cached video to True if its mentions were resolved during guest discovery
+        """
+        if not ids:
+            return {}
+        return {video_id: bool(resolved) for video_id, resolved in current_session.query(cls.id, cls.mentions_resolved).filter(cls.id.in_(ids))}
+
+    @classmethod
+    def mark_mentions_resolved(cls, ids: set):
+        """
+        Record that the channels mentioned in the given videos are stored as VideoMentions.
+        Doesn't commit, so this is committed alongside the mentions.
+
+        :param ids: set of video IDs
+        """
+        if ids:
+            current_session.query(cls).filter(cls.id.in_(ids)).update({cls.mentions_resolved: True}, synchronize_session=False)
+
+    @classmethod
+    def migrate_processed_for(cls, batch_size: int = 1000):
+        """
+        Move the channel IDs from the legacy processed_for strings into the video_processed_for table.
+        Each migrated video has its processed_for cleared, so running this again only migrates new rows.
+
+        :param batch_size: number of videos to migrate per transaction
+        """
+        while rows := current_session.query(cls.id, cls.processed_for)\
+                .filter(cls.processed_for.isnot(None), cls.processed_for != '').limit(batch_size).all():
+            processed = [{'video_id': video_id, 'channel_id': channel_id}
+                         for video_id, processed_for in rows for channel_id in set(processed_for.split('|')) if channel_id]
+            if processed:
+                current_session.execute(dialect_insert(VideoProcessedFor.__table__).on_conflict_do_nothing(), processed)
+            current_session.query(cls).filter(cls.id.in_([video_id for video_id, _ in rows]))\
+                .update({cls.processed_for: None}, synchronize_session=False)
+            current_session.commit()
+
+    @classmethod
+    def links_for(cls, videos: list) -> dict:
+        """
+        Retrieve the links in each video's description. Stored links are loaded in one query.
+        Descriptions of videos cached before links were stored are parsed, and their links stored, without committing.
+        Videos which aren't cached are parsed every time.
+
+        :param videos: list of Videos
+        :return: dict of video ID to set of link_extractor.Link
+        """
+        stored = VideoLink.for_videos({v.id for v in videos if v.links_extracted})
+        links = {v.id: stored.get(v.id, set()) for v in videos if v.links_extracted}
+        extracted = {v.id: link_extractor.extract_links(v.description) for v in videos if not v.links_extracted}
+        links.update(extracted)
+
+        cached = {v.id for v in videos if not v.links_extracted and inspect(v).persistent}
+        if cached:
+            VideoLink.add({video_id: extracted[video_id] for video_id in cached})
+            current_session.query(cls).filter(cls.id.in_(cached)).update({cls.links_extracted: True}, synchronize_session=False)
+        return links
+
+    def get_links_from_description(self, kind: str) -> set:
+        """
+        :param kind: Kind of link to retrieve, eg: link_extractor.URL
+        :return: set of the values of links of that kind in the video description
+        """
+        return {link.value for link in link_extractor.extract_links(self.description) if link.kind == kind}
 
     def get_collaborators_from_title(self) -> set:
         """
@@ -121,27 +323,17 @@ class Video(YoutubeObject):
 
         :return: set of strings. eg: {'Violet Orlandi'}
         """
-        illegal_characters = ['(', ')', ',', '@ ']
-        for char in illegal_characters:
-            self.title = self.title.replace(char, '')
-
-        if "@" in self.title:
-            return {s.strip() for s in self.title.split('@')[1:]}
-        return set()
+        return link_extractor.extract_title_tags(self.title)
 
     def get_urls_from_description(self) -> set:
         """
         Retrieve any channels linked in a video description.
         The returned string is just the endpoint, not full URL. eg: 'VioletOrlandi', not 'https://youtube.com/VioletOrlandi'.
         URLs look like 'https://youtube.com/VioletOrlandi' or 'https://youtube.com/c/VioletOrlandi'
-        This will miss URLs of the form youtube.com/url if they're at the very end of the description
-        I have to check for trailing whitespace otherwise it identifies 'youtube.com/c' as a url, from the first pattern
 
         :return: set of endpoints for Youtube website. eg: {'VioletOrlandi'}
         """
-        match_1 = re.findall(r'youtube.com/c/([\w_\-]+)', self.description, re.UNICODE)
-        match_2 = re.findall(r'youtube.com/([\w_\-]+\s)', self.description, re.UNICODE)
-        return {url.strip() for url in match_1 + match_2}
+        return self.get_links_from_description(link_extractor.URL)
 
     def get_users_from_description(self) -> set:
         """
@@ -150,8 +342,7 @@ class Video(YoutubeObject):
 
         :return: set of usernames eg: {'VioletaOrlandi'}
         """
-        match = re.findall(r'youtube.com/user/([\w_\-]+)', self.description, re.UNICODE)
-        return {user.strip() for user in match}
+        return self.get_links_from_description(link_extractor.USERNAME)
 
     def get_channel_ids_from_description(self) -> set:
         """
@@ -160,8 +351,7 @@ class Video(YoutubeObject):
 
         :return: set of channel IDs. eg: {'UCo3AxjxePfj6DHn03aiIhww'}
         """
-        match = re.findall(r'youtube.com/channel/([a-zA-Z0-9_\-]+)', self.description)
-        return {c.strip() for c in match}
+        return self.get_links_from_description(link_extractor.CHANNEL_ID)
 
     def get_video_ids_from_description(self) -> set:
         """
@@ -170,7 +360,4 @@ class Video(YoutubeObject):
 
         :return: set of video IDs. eg: {'53XW1xxmmuM'}
         """
-
-        match_1 = re.findall(r'youtube.com/watch\?v=([a-zA-Z0-9_\-]+)', self.description)
-        match_2 = re.findall(r'youtu.be/([a-zA-Z0-9_\-]+)', self.description)
-        return {v.strip() for v in match_1 + match_2}
+        return self.get_links_from_description(link_extractor.VIDEO_ID)
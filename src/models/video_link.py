@@ -0,0 +1,43 @@
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, String, ForeignKey
+
+from src.controllers.link_extractor import Link
+from src.extensions import Base, dialect_insert
+
+
+class VideoLink(Base):
+    """
+    A link to a channel or video found in a video's description, extracted once when the video is cached.
+    Later phases of a crawl read these instead of parsing the description again.
+    """
+    __tablename__ = "video_link"
+
+    video_id = Column(String, ForeignKey('video.id'), primary_key=True)
+    kind = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+
+    @classmethod
+    def for_videos(cls, video_ids: set) -> dict:
+        """
+        Retrieve the links found in each of the given videos, in one query.
+
+        :param video_ids: set of video IDs
+        :return: dict of video ID to set of Link. Videos with no links are omitted.
+        """
+        links = {}
+        if video_ids:
+            for video_id, kind, value in current_session.query(cls.video_id, cls.kind, cls.value).filter(cls.video_id.in_(video_ids)):
+                links.setdefault(video_id, set()).add(Link(kind, value))
+        return links
+
+    @classmethod
+    def add(cls, links: dict):
+        """
+        Store the links found in each video, in a single insert. Links already stored are ignored.
+        Doesn't commit, so this is committed alongside the videos.
+
+        :param links: dict of video ID to set of Link
+        """
+        rows = [{'video_id': video_id, 'kind': link.kind, 'value': link.value} for video_id, video_links in links.items() for link in video_links]
+        if rows:
+            current_session.execute(dialect_insert(cls.__table__).on_conflict_do_nothing(), rows)
@@ -0,0 +1,66 @@
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, String, ForeignKey, and_, or_, exists
+
+from src.extensions import Base, dialect_insert
+from src.models.collaboration import Collaboration
+from src.models.video import Video
+
+
+class VideoMention(Base):
+    """
+    A channel mentioned in a video, by a link in its description or a tag in its title, resolved to the channel's ID.
+    Mentions are stored when they're resolved, so processing a video again for another target channel
+    finds its collaborations with one set based query, instead of resolving its links and titles again.
+    """
+    __tablename__ = "video_mention"
+
+    # Where in the video the channel was mentioned
+    DESCRIPTION = 'description'
+    TITLE = 'title'
+
+    video_id = Column(String, ForeignKey('video.id'), primary_key=True)
+    channel_id = Column(String, ForeignKey('channel.id'), primary_key=True, index=True)
+    source = Column(String, primary_key=True)
+
+    @classmethod
+    def add(cls, source: str, mentions: dict):
+        """
+        Store the channels mentioned in each video, in a single insert. Mentions already stored are ignored.
+        Doesn't commit, so this is committed alongside the videos' processing.
+
+        :param source: Where the channels were mentioned, eg: VideoMention.TITLE
+        :param mentions: dict of video ID to set of mentioned channel IDs
+        """
+        rows = [{'video_id': video_id, 'channel_id': channel_id, 'source': source}
+                for video_id, channel_ids in mentions.items() for channel_id in channel_ids]
+        if rows:
+            current_session.execute(dialect_insert(cls.__table__).on_conflict_do_nothing(), rows)
+
+    @classmethod
+    def channels_for(cls, video_ids: set) -> set:
+        """
+        :param video_ids: set of video IDs
+        :return: set of IDs of the channels mentioned in any of the videos
+        """
+        if not video_ids:
+            return set()
+        return {channel_id for channel_id, in current_session.query(cls.channel_id).filter(cls.video_id.in_(video_ids)).distinct()}
+
+    @classmethod
+    def new_collaborations(cls, video_ids: set) -> list:
+        """
+        Find the collaborations in the given videos that aren't recorded yet, in one query.
+        Each video's uploader collaborated with every other channel mentioned in it. Pairs already recorded for
+        the video, in either order, are skipped, as happens when re-processing a video in the context of another channel.
+
+        :param video_ids: set of video IDs
+        :return: list of dicts of channel_1_id (the uploader), channel_2_id and video_id, ready to insert as Collaborations
+        """
+        if not video_ids:
+            return []
+        recorded = exists().where(Collaboration.video_id == cls.video_id, or_(
+            and_(Collaboration.channel_1_id == Video.channel_id, Collaboration.channel_2_id == cls.channel_id),
+            and_(Collaboration.channel_1_id == cls.channel_id, Collaboration.channel_2_id == Video.channel_id)))
+        query = current_session.query(Video.channel_id, cls.channel_id, cls.video_id).join(Video, Video.id == cls.video_id)\
+            .filter(cls.video_id.in_(video_ids), cls.channel_id != Video.channel_id, ~recorded).distinct()
+        return [{'channel_1_id': host_id, 'channel_2_id': guest_id, 'video_id': video_id} for host_id, guest_id, video_id in query]
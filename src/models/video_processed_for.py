@@ -0,0 +1,30 @@
+from flask_sqlalchemy_session import current_session
+from sqlalchemy import Column, String, ForeignKey
+
+from src.extensions import Base, dialect_insert
+
+
+class VideoProcessedFor(Base):
+    """
+    Records that a video has been searched for collaborations as part of crawling a target channel.
+    The composite primary key indexes (video_id, channel_id), so checking whether a video has been
+    processed for a channel is an index lookup.
+    """
+    __tablename__ = "video_processed_for"
+
+    video_id = Column(String, ForeignKey('video.id'), primary_key=True)
+    channel_id = Column(String, ForeignKey('channel.id'), primary_key=True)
+
+    @classmethod
+    def add(cls, video_ids: set, channel_id: str):
+        """
+        Mark each video as processed for the channel, in a single insert. Videos already marked are ignored.
+        Doesn't commit, so this is committed alongside the collaborations found in the videos.
+
+        :param video_ids: set of video IDs
+        :param channel_id: ID of the channel the videos were processed for
+        """
+        if not video_ids:
+            return
+        insert = dialect_insert(cls.__table__).on_conflict_do_nothing()
+        current_session.execute(insert, [{'video_id': video_id, 'channel_id': channel_id} for video_id in video_ids])
@@ -2,17 +2,38 @@ import logging
 import os
 from copy import copy
 
-import requests
 from requests import HTTPError
 
-from src.controllers import secrets
+from src.controllers import http_client, secrets
 from src.controllers.exceptions import YoutubeAuthenticationException
 from src.extensions import Base
+from src.models.api_key_quota import ApiKeyQuota, QUOTA_REASONS
 
 logger = logging.getLogger()
 
 api_keys = secrets.get_secret('YOUTUBE_API_KEYS').split(',')
 
+# Maximum page size, and maximum number of IDs per lookup, accepted by the Youtube API
+MAX_RESULTS = 50
+
+# Partial response for each endpoint, limited to the fields the models read.
+# See https://developers.google.com/youtube/v3/getting-started#fields
+FIELDS = {
+    'channels': 'nextPageToken,items(id,snippet(title,customUrl,thumbnails/medium/url),contentDetails/relatedPlaylists/uploads)',
+    'playlistItems': 'nextPageToken,items/snippet(resourceId/videoId,channelId,title,description,thumbnails/medium/url,publishedAt)',
+    'search': 'nextPageToken,items(id/channelId,snippet/title)',
+    'videos': 'nextPageToken,items(id,snippet(channelId,title,description,thumbnails/medium/url,publishedAt))',
+}
+
+
+def is_quota_error(body) -> bool:
+    """
+    :param body: Decoded body of an API error response, eg: {'error': {'errors': [{'reason': 'quotaExceeded'}]}}
+    :return: True if the API rejected the key for exceeding its quota
+    """
+    errors = body.get('error', {}).get('errors', []) if isinstance(body, dict) and isinstance(body.get('error'), dict) else []
+    return any(isinstance(e, dict) and e.get('reason') in QUOTA_REASONS for e in errors)
+
 
 class YoutubeObject(Base):
     """Base class for objects retrieved from the Youtube API"""
@@ -29,27 +50,56 @@ class YoutubeObject(Base):
         :raises: HTTPError if the API responds with non-20x response, or no items
         :raises: YoutubeAuthenticationException if an unrecoverable authentication error occurs
         """
+        items, next_page, _ = YoutubeObject.get_page(endpoint, params)
+        return items, next_page
+
+    @staticmethod
+    def get_page(endpoint: str, params: dict, etag: str = None) -> tuple:
+        """
+        Query the Youtube data API, and return the 'items', 'nextPageToken' and ETag.
+        If an ETag from a previous response is given, the API only sends the page if it has changed since.
+
+        :param endpoint: Youtube endpoing to call. See https://developers.google.com/youtube/v3/docs
+        :param params: Dictionary of parameters to send as a querystring
+        :param etag: Default None. ETag of the page when it was last retrieved.
+        :return: tuple of API items (dict), pagination token (str) and ETag (str). Items and token are None if the page hasn't changed.
+        :raises: HTTPError if the API responds with non-20x response, or no items
+        :raises: YoutubeAuthenticationException if an unrecoverable authentication error occurs
+        """
 
-        logger.debug(f"Querying API with: '{endpoint}' - '{params}")
+        logger.debug("Querying API with: '%s' - '%s'", endpoint, params)
         base_url = os.getenv('YOUTUBE_API_URL', 'https://www.googleapis.com/youtube/v3/')
 
+        if not (key := ApiKeyQuota.acquire(api_keys, endpoint)):
+            raise YoutubeAuthenticationException("All API keys have exhausted their quota until the next reset")
         auth_params = copy(params)  # Make a copy so the key doesn't end up in logs
-        auth_params['key'] = api_keys[0]
-        response = requests.get(base_url + endpoint, params=auth_params)
-        logger.debug(f"Response: {response.json()}")
+        auth_params['key'] = key
+        if endpoint in FIELDS:
+            auth_params.setdefault('fields', FIELDS[endpoint])
+        headers = {'If-None-Match': etag} if etag else {}
+        response = http_client.get(base_url + endpoint, params=auth_params, headers=headers)
+        if response.status_code == 304:
+            logger.debug("Response: not modified since '%s'", etag)
+            return None, None, etag
+        try:
+            body = http_client.decode(response)
+        except ValueError:
+            # Errors from Google's front end, such as a 502 after retries run out, aren't JSON
+            raise HTTPError(f"API responded with {response.status_code} and a body that isn't JSON")
+        logger.debug("Response: %s", body)
 
-        # If we still have multiple keys, try the next one
-        if response.status_code == 403 and len(api_keys) > 1:
-            logger.warning("API quota limit reached, swapping key")
-            api_keys.pop(0)
-            return YoutubeObject.get(endpoint, params)
+        # Rest the key until the quota resets. If we still have other keys, try the next one
+        if response.status_code == 403 and is_quota_error(body):
+            ApiKeyQuota.exhaust(key)
+            if ApiKeyQuota.any_available(api_keys):
+                logger.warning("API quota limit reached, swapping key")
+                return YoutubeObject.get_page(endpoint, params, etag)
+            raise YoutubeAuthenticationException(body)
 
         # Unrecoverable errors. Raised for calling methods to handle
-        if response.status_code == 403:
-            raise YoutubeAuthenticationException(response.json())
-        elif response.status_code < 200 or response.status_code >= 400:
-            raise HTTPError(response.json())
-        if 'items' not in response.json() or len(response.json()['items']) == 0:
-            raise HTTPError('API responded with no items')
-
-        return response.json().get('items'), response.json().get('nextPageToken')
+        if response.status_code < 200 or response.status_code >= 400:
+            raise HTTPError(body, response=response)
+        if not body.get('items'):
+            raise HTTPError('API responded with no items', response=response)
+
+        return body['items'], body.get('nextPageToken'), response.headers.get('ETag')
@@ -1,6 +1,9 @@
-from flask import Blueprint
+from flask import Blueprint, request
 
-from src.extensions import Base
+from src.extensions import Base, create_missing_columns, create_missing_indexes
+from src.models.collaboration_edge import CollaborationEdge
+from src.models.negative_result import NegativeResult
+from src.models.video import Video
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -10,3 +13,21 @@ def reset_cache():
     Base.metadata.drop_all()
     Base.metadata.create_all()
     return ''
+
+
+@admin_bp.route('/migrate')
+def migrate():
+    # Creates any tables, columns and indexes added since the database was built, without touching the existing cache
+    Base.metadata.create_all()
+    create_missing_columns()
+    create_missing_indexes()
+    CollaborationEdge.rebuild()
+    Video.migrate_processed_for()
+    return ''
+
+
+@admin_bp.route('/purge_negative_cache')
+def purge_negative_cache():
+    # Forgets lookups which found nothing, so they're tried again. Optionally only one kind, eg: ?kind=url
+    removed = NegativeResult.purge(request.args.get('kind'))
+    return f'Removed {removed} results'
@@ -1,21 +1,26 @@
+import itertools
 import logging
-import statistics
 import traceback
 import urllib
 
-from flask import Blueprint, current_app, request, render_template, jsonify, url_for
+from flask import Blueprint, current_app, jsonify, request, render_template, url_for
 from flask_sqlalchemy_session import current_session
 
 from src.controllers import get_collaborations
 from src.controllers.exceptions import ChannelNotFoundException, YoutubeAuthenticationException
 from src.models.channel import Channel
 from src.models.collaboration import Collaboration
+from src.models.crawl_job import CrawlJob
+from src.models.data_version import DataVersion
+from src.models.graph_cache import GraphCache
 from src.models.history import History
-from src.models.video import Video
 
 graph_bp = Blueprint('graph', __name__)
 logger = logging.getLogger()
 
+# Failed crawl jobs record the name of the exception, which is raised again to show the matching message
+JOB_ERRORS = {e.__name__: e for e in (ChannelNotFoundException, YoutubeAuthenticationException)}
+
 
 @graph_bp.route('/')
 def generate_collaboration_graph():
@@ -25,19 +30,43 @@ def generate_collaboration_graph():
     if not target_channel_name:  # Default for when users load the page
         target_channel_name = 'Violet Orlandi'
     with current_app.app_context():
-        collabs_json = {"nodes": [], "edges": []}
+        collab_data = {"nodes": [], "edges": []}
         node_size = 1
-        chart_title = message = None
+        chart_title = message = job = None
         history = [[urllib.parse.quote(c.channel.title), c.channel.title] for c in History.get(current_session)]
 
         try:
-            collabs = get_collaborations.get_collaborations_for_channel(target_channel_name, previous_channel_name)
-            if len(collabs) > 0:
-                self_url = url_for('graph.generate_collaboration_graph', _external=True, _scheme="https")
-                collabs_json, node_size = build_anygraph_json(self_url, target_channel_name, collabs)
-                chart_title = f"{target_channel_name} & {previous_channel_name}" if previous_channel_name else target_channel_name
-            else:
-                message = "This channel has no collaborations"
+            target_channel = get_collaborations.get_cached_channel(target_channel_name)
+            if not target_channel:
+                # Crawls run in a worker. Until the job's done, the page polls its progress, then reloads
+                job = CrawlJob.enqueue(target_channel_name)
+                if job.status == CrawlJob.FAILED:
+                    raise JOB_ERRORS.get(job.error, Exception)(target_channel_name)
+                if job.status == CrawlJob.DONE:
+                    # Workers don't record history, so the channel is counted when it's served, as get_cached_channel does
+                    if target_channel := Channel.from_id(job.channel_id, cache_only=True):
+                        History.add(target_channel)
+                    job = None
+
+            if target_channel:
+                previous_channel = get_collaborations.get_previous_channel(previous_channel_name) if previous_channel_name else None
+                graph_key = GraphCache.make_key(target_channel, previous_channel)
+                versions = DataVersion.describe(target_channel, previous_channel)
+                if cached := GraphCache.get(graph_key, versions):
+                    logger.info(f"Serving graph for '{graph_key}' from cache")
+                    collab_data, node_size = cached
+                elif collabs := get_collaborations.get_collaborations_for_channel(target_channel, previous_channel):
+                    self_url = url_for('graph.generate_collaboration_graph', _external=True, _scheme="https")
+                    # Cached graphs are shared by every spelling of the channel's name, so links use its title
+                    collabs_json, node_size = build_anygraph_json(self_url, target_channel.title, collabs)
+                    collab_data = {'nodes': sorted(collabs_json['nodes'], key=lambda x: x['id']),
+                                   'edges': sorted(collabs_json['edges'], key=lambda x: x['id'])}
+                    GraphCache.add(graph_key, versions, collab_data, node_size)
+
+                if collab_data['nodes']:
+                    chart_title = f"{target_channel.title} & {previous_channel.title}" if previous_channel else target_channel.title
+                else:
+                    message = "This channel has no collaborations"
         except ChannelNotFoundException:
             message = f"Couldn't find channel named '{target_channel_name}'\n" \
                       f"Please check that the spelling and case is correct and try again."
@@ -53,39 +82,19 @@ def generate_collaboration_graph():
                       "<p>Meanwhile, try a cached result using the popular channels button</p>"
 
     return render_template('draw_graph.html',
-                           collab_data={'nodes': sorted(collabs_json['nodes'], key=lambda x: x['id']),
-                                        'edges': sorted(collabs_json['edges'], key=lambda x: x['id'])},
+                           collab_data=collab_data,
                            node_size=node_size,
                            chart_title=chart_title,
                            history=history,
-                           message=message)
-
-
-@graph_bp.route("/calc/uploads", methods=['POST'])
-def get_uploads_for_channel():
-    channel_id = request.get_json()['channel']
-    videos = get_collaborations.get_uploads_for_channel(channel_id)
-    return jsonify(videos=videos)
-
-
-@graph_bp.route("/calc/parse_videos", methods=['POST'])
-def get_collaborators_for_videos():
-    video_ids = request.get_json()['videos']
-    guest_channels = set()
-    for video_id in video_ids:
-        video = Video.from_id(video_id)
-        logger.debug(f"Parsing host video '{video}'")
-        guest_channels.update(get_collaborations.get_channels_from_description(video))
-        guest_channels.update(get_collaborations.get_channels_from_title(video))
-    return jsonify(channels=[c.id for c in guest_channels])
+                           message=message,
+                           job=job.to_dict() if job else None)
 
 
-@graph_bp.route("/calc/process_collaborations", methods=['POST'])
-def process_collaborations():
-    target_channel = request.get_json()['target_channel']
-    video_ids = request.get_json()['videos']
-    get_collaborations.populate_collaborations(target_channel, video_ids)
-    return ''
+@graph_bp.route('/crawl_progress/<int:job_id>')
+def get_crawl_progress(job_id):
+    if job := CrawlJob.get(job_id):
+        return jsonify(job.to_dict())
+    return jsonify(msg="Crawl job not found"), 404
 
 
 @graph_bp.route('/dual_collaborations')
@@ -109,64 +118,96 @@ def get_single_collaboration_videos():
                            videos=sorted(videos, key=lambda v: v.published_at, reverse=True))
 
 
-def build_anygraph_json(self_url, previous_channel, collabs):
+def get_trimmed_range(strengths: list) -> int:
+    """
+    Remove the most aggressive deviations, so we don't end up with whisker thin lines for single collabs.
+    The strongest pairs are dropped until the standard deviation of the remainder is 50 or less,
+    and the range of strengths up to that point is returned.
+
+    This uses one sort and running totals, rather than recalculating the deviation of each slice.
+    Strengths are integers, so comparing the variance against 50^2 with integer arithmetic is exact:
+    stdev(x) > 50 when n * sum(x^2) - sum(x)^2 > 2500 * n * (n - 1)
+
+    :param strengths: list of collaboration counts, one per pair of channels
+    :return: range of the retained strengths
+    """
+    ordered = sorted(strengths)
+    totals = list(itertools.accumulate(ordered, initial=0))
+    squares = list(itertools.accumulate((s * s for s in ordered), initial=0))
+
+    def deviation_too_high(n):
+        # Standard deviation of the n weakest pairs is over 50
+        return n * squares[n] - totals[n] ** 2 > 2500 * n * (n - 1)
+
+    # The first check covers every pair. After that, dropping the strongest pairs one at a time,
+    # the deviation covers the pairs below 'top' and the range is measured up to 'top'
+    top = len(ordered) - 1
+    count = len(ordered)
+    while deviation_too_high(count):
+        top -= 1
+        count = top
+    return ordered[top] - ordered[0]
+
+
+def build_anygraph_json(self_url, previous_channel, collab_edges):
     nodes = {}
     pairs = {}
     edges = []
 
-    for collab in collabs:
-        nodes[collab.channel_1.title] = {"fill": collab.channel_1.thumbnail_url, "id": collab.channel_1.id}
-        nodes[collab.channel_2.title] = {"fill": collab.channel_2.thumbnail_url, "id": collab.channel_2.id}
-        if collab in pairs:
-            pairs[collab] = pairs[collab] + 1
+    # Edges are directional (host and guest), but the graph isn't, so both directions are combined into one pair
+    for edge in collab_edges:
+        nodes[edge.host.title] = edge.host
+        nodes[edge.guest.title] = edge.guest
+        pair = frozenset([edge.host_id, edge.guest_id])
+        if pair in pairs:
+            pairs[pair][2] += edge.collaborations
         else:
-            pairs[collab] = 1
+            pairs[pair] = [edge.host, edge.guest, edge.collaborations]
 
-    # Remove the most aggressive deviations, so we don't end up with whisker thin lines for single collabs
-    index = -1
-    std_dev = statistics.stdev(sorted(pairs.values()))
-    range = sorted(pairs.values())[-1] - sorted(pairs.values())[0]
-    while std_dev > 50:
-        index -= 1
-        std_dev = statistics.stdev(sorted(pairs.values())[:index])
-        range = sorted(pairs.values())[index] - sorted(pairs.values())[0]
+    range = get_trimmed_range([strength for _, _, strength in pairs.values()])
 
     # Node size maximum is 100. Edge width maximum is node size. Otherwise clipping occurs
+    # Styles only depend on strength, so they're built once per distinct strength and shared between edges
     node_size = 1000 / len(nodes) if 1000 / len(nodes) < 100 else 100
-    edge_id = 1
-    for collab, strength in pairs.items():
-        line_thickess = strength / range * 40 if strength / range * 40 < node_size else node_size
-        edges.append({
-            "id": f"edge_{edge_id}",
-            "from": collab.channel_1.title,
-            "to": collab.channel_2.title,
-            "channels": [collab.channel_1.id, collab.channel_2.id],
-            "normal": {
-                "stroke": {
-                    "color": "#000000",
-                    "thickness": line_thickess,
-                }
-            },
-            "hovered": {
-                "stroke": {
-                    "color": "#0d4fba",
-                    "thickness": line_thickess,
-                }
-            },
-            "selected": {
-                "stroke": {
-                    "color": "#0d4fba",
-                    "thickness": line_thickess,
+    styles = {}
+    for edge_id, (channel_1, channel_2, strength) in enumerate(pairs.values(), start=1):
+        if strength not in styles:
+            # A range of 0 means every pair is equally strong, so every line is drawn at full width
+            line_thickess = min(strength / range * 40, node_size) if range else node_size
+            styles[strength] = {
+                "normal": {
+                    "stroke": {
+                        "color": "#000000",
+                        "thickness": line_thickess,
+                    }
+                },
+                "hovered": {
+                    "stroke": {
+                        "color": "#0d4fba",
+                        "thickness": line_thickess,
+                    }
+                },
+                "selected": {
+                    "stroke": {
+                        "color": "#0d4fba",
+                        "thickness": line_thickess,
+                    }
                 }
             }
+        edges.append({
+            "id": f"edge_{edge_id}",
+            "from": channel_1.title,
+            "to": channel_2.title,
+            "channels": [channel_1.id, channel_2.id],
+            **styles[strength]
         })
-        edge_id += 1
 
+    previous_channel_param = urllib.parse.quote(previous_channel)
     collabs_json = {
-        "nodes": [{"id": k,
-                   "channel_id": v["id"],
-                   "url": f"{self_url}?channel={urllib.parse.quote(k)}&previous_channel={urllib.parse.quote(previous_channel)}",
-                   "fill": {"src": v["fill"]}} for k, v in nodes.items()],
+        "nodes": [{"id": title,
+                   "channel_id": channel.id,
+                   "url": f"{self_url}?channel={urllib.parse.quote(title)}&previous_channel={previous_channel_param}",
+                   "fill": {"src": channel.thumbnail_url}} for title, channel in nodes.items()],
         "edges": edges
     }
     # import json
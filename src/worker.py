@@ -0,0 +1,73 @@
+"""
+Runs the crawls queued by the web app, so requests don't wait for them.
+Any number of workers can run alongside the web app, each running one crawl at a time:
+
+    python -m src.worker
+"""
+import logging
+import signal
+import sys
+import threading
+import time
+
+from flask_sqlalchemy_session import current_session
+
+from src import config
+from src.app import app
+from src.controllers import get_collaborations
+from src.models.crawl_job import CrawlJob
+
+logger = logging.getLogger()
+
+
+def heartbeat(job_id: int, stop: threading.Event):
+    """Update the job until stop is set, so other workers know it's still running while a phase reports no progress"""
+    with app.app_context():
+        while not stop.wait(config.crawl_job_heartbeat_seconds):
+            CrawlJob.add_progress(job_id, 0)
+
+
+def run_job(job: CrawlJob):
+    """
+    Crawl the job's channel, recording its progress and result on the job.
+    If the worker is stopped part way through, the job is returned to the queue for another worker to resume.
+
+    :param job: CrawlJob claimed by this worker
+    """
+    logger.info(f"Running crawl job '{job}'")
+    stop = threading.Event()
+    threading.Thread(target=heartbeat, args=(job.id, stop), daemon=True).start()
+    token = get_collaborations.current_job.set(job.id)
+    try:
+        # The request that's served the crawled channel records it in the history, so it's only counted once
+        channel = get_collaborations.crawl_channel(job.channel_name, record_history=False)
+        CrawlJob.finish(job.id, channel.id)
+        logger.info(f"Finished crawl job '{job}'")
+    except Exception as e:
+        logger.exception(f"Failed crawl job '{job}' - {e}")
+        current_session.rollback()
+        CrawlJob.fail(job.id, e)
+    except BaseException:
+        logger.warning(f"Worker stopped, returning crawl job '{job}' to the queue")
+        CrawlJob.release(job.id)
+        raise
+    finally:
+        stop.set()
+        get_collaborations.current_job.reset(token)
+
+
+def main():
+    # Stop cleanly when the container is stopped, so the running job is released
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    logger.info("Crawl worker started")
+    while True:
+        # A new app context per job gives each job a fresh DB session
+        with app.app_context():
+            if job := CrawlJob.claim():
+                run_job(job)
+                continue
+        time.sleep(config.crawl_job_poll_seconds)
+
+
+if __name__ == '__main__':
+    main()
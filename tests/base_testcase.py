@@ -1,21 +1,26 @@
 from unittest import TestCase
 
 from flask import Flask
+from flask_sqlalchemy_session import flask_scoped_session
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
-from src import extensions
+from src.extensions import Base
+from src.models import api_key_quota, channel, collaboration, collaboration_edge, crawl_job, data_version, graph_cache, history, negative_result, playlist_etag, search, url_lookup, video, video_link, video_mention, video_processed_for  # noqa: Register all tables
 
 
 class TestYoutube(TestCase):
 
     def setUp(self):
         self.app = Flask(__name__)
-        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-        extensions.db.init_app(self.app)
-        self.app.app_context().push()  # Required to allow SQLAlchemy extension to load correctly
-        with self.app.app_context():
-            extensions.db.create_all()
+        # StaticPool keeps the single in-memory database alive across connections and threads
+        self.engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        Base.metadata.create_all(self.engine)
+        self.session = flask_scoped_session(sessionmaker(bind=self.engine), self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
 
     def tearDown(self):
-        with self.app.app_context():
-            extensions.db.drop_all()
+        self.app_context.pop()
+        Base.metadata.drop_all(self.engine)
@@ -0,0 +1,69 @@
+import datetime
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from src.models.api_key_quota import ApiKeyQuota, next_reset, quota_day
+from tests.base_testcase import TestYoutube
+
+
+class TestApiKeyQuota(TestYoutube):
+    keys = ['KeyOne', 'KeyTwo']
+
+    def units(self):
+        self.session.expire_all()
+        return {q.key_id: q.units_used for q in self.session.query(ApiKeyQuota)}
+
+    def test_quota_day(self):
+        assert quota_day(datetime.datetime(2021, 1, 2, 7, 59)) == datetime.date(2021, 1, 1)
+        assert quota_day(datetime.datetime(2021, 1, 2, 8, 0)) == datetime.date(2021, 1, 2)
+
+    def test_next_reset(self):
+        # Midnight Pacific is 08:00 UTC in winter, and 07:00 UTC during daylight saving
+        assert next_reset(datetime.datetime(2021, 1, 2, 7, 59)) == datetime.datetime(2021, 1, 2, 8)
+        assert next_reset(datetime.datetime(2021, 1, 2, 8, 0)) == datetime.datetime(2021, 1, 3, 8)
+        assert next_reset(datetime.datetime(2021, 7, 2, 12, 0)) == datetime.datetime(2021, 7, 3, 7)
+
+    @patch('src.models.api_key_quota.config')
+    def test_acquire_spreads_load(self, config):
+        config.api_quota_block_units = 2
+        acquired = [ApiKeyQuota.acquire(self.keys, 'videos') for _ in range(4)]
+        assert acquired == ['KeyOne', 'KeyOne', 'KeyTwo', 'KeyTwo']
+        # A search costs more than a block, so reserves its own
+        assert ApiKeyQuota.acquire(self.keys, 'search') == 'KeyOne'
+        assert [ApiKeyQuota.acquire(self.keys, 'videos') for _ in range(3)] == ['KeyTwo', 'KeyTwo', 'KeyTwo']
+        assert self.units() == {ApiKeyQuota.key_id_for('KeyOne'): 102, ApiKeyQuota.key_id_for('KeyTwo'): 6}
+
+    @patch('src.models.api_key_quota.config')
+    def test_calls_within_block_skip_database(self, config):
+        config.api_quota_block_units = 50
+        ApiKeyQuota.acquire(self.keys, 'videos')
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        assert {ApiKeyQuota.acquire(self.keys, 'videos') for _ in range(49)} == {'KeyOne'}
+        assert statements == []
+        assert ApiKeyQuota.acquire(self.keys, 'videos') == 'KeyTwo'
+        assert self.units() == {ApiKeyQuota.key_id_for('KeyOne'): 50, ApiKeyQuota.key_id_for('KeyTwo'): 50}
+
+    @patch('src.models.api_key_quota.config')
+    def test_exhausted_key_skipped_until_reset(self, config):
+        config.api_quota_block_units = 2
+        ApiKeyQuota.acquire(self.keys, 'videos')
+        ApiKeyQuota.exhaust('KeyOne')
+        assert [ApiKeyQuota.acquire(self.keys, 'videos') for _ in range(2)] == ['KeyTwo', 'KeyTwo']
+        ApiKeyQuota.exhaust('KeyTwo')
+        assert ApiKeyQuota.acquire(self.keys, 'videos') is None
+        assert ApiKeyQuota.any_available(self.keys) is False
+
+        # After the reset, both keys are available again, with fresh counts
+        yesterday = quota_day() - datetime.timedelta(days=1)
+        self.session.query(ApiKeyQuota).update({ApiKeyQuota.quota_day: yesterday,
+                                                ApiKeyQuota.exhausted_until: datetime.datetime.utcnow()})
+        self.session.commit()
+        assert ApiKeyQuota.any_available(self.keys) is True
+        assert ApiKeyQuota.acquire(self.keys, 'videos') == 'KeyOne'
+        assert self.units() == {ApiKeyQuota.key_id_for('KeyOne'): 2, ApiKeyQuota.key_id_for('KeyTwo'): 0}
+
+    def test_keys_not_stored(self):
+        ApiKeyQuota.acquire(self.keys, 'videos')
+        assert all(q.key_id not in self.keys for q in self.session.query(ApiKeyQuota))
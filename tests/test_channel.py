@@ -4,6 +4,7 @@ import responses
 from requests import HTTPError
 
 from src.models.channel import Channel
+from src.models.url_lookup import UrlLookup
 from tests.base_testcase import TestYoutube
 
 
@@ -218,3 +219,85 @@ class TestChannel(TestYoutube):
             with self.assertRaises(HTTPError) as err:
                 Channel.from_url('unknown_url')
             assert err.exception.args[0] == 'Request responded with 404 for unknown_url'
+
+
+class TestChannelFromIds(TestYoutube):
+
+    def setUp(self):
+        super(TestChannelFromIds, self).setUp()
+        self.session.add(Channel(id='cached_id', title='cached_title', uploads_id='cached_uploads'))
+        self.session.commit()
+
+    @staticmethod
+    def api_item(channel_id):
+        return {
+            "id": channel_id,
+            "snippet": {"title": f"title_{channel_id}", "thumbnails": {"medium": {"url": "thumbnail_url"}}},
+            "contentDetails": {"relatedPlaylists": {"uploads": f"uploads_{channel_id}"}}
+        }
+
+    def test_from_cache_only(self):
+        with patch('src.models.channel.Channel.get') as patch_get:
+            channels = Channel.from_ids({'cached_id', 'unknown_id'}, cache_only=True)
+        assert set(channels) == {'cached_id'}
+        assert patch_get.call_count == 0
+
+    def test_misses_batched_and_cached(self):
+        ids = {f'id_{i:03}' for i in range(75)}
+
+        def side_effect(endpoint, params):
+            return [self.api_item(i) for i in params['id'].split(',')], None
+
+        with patch('src.models.channel.Channel.get', side_effect=side_effect) as patch_get:
+            channels = Channel.from_ids(ids | {'cached_id'})
+        assert set(channels) == ids | {'cached_id'}
+        assert [len(c.args[1]['id'].split(',')) for c in patch_get.call_args_list] == [50, 25]
+        assert channels['id_000'].uploads_id == 'uploads_id_000'
+        assert channels['id_000'] is Channel.from_id('id_000', cache_only=True)
+
+    def test_insert_ignores_channels_cached_concurrently(self):
+        def side_effect(endpoint, params):
+            # Another thread caches the same channel while this one is waiting on the API
+            self.session.execute(Channel.__table__.insert(), {'id': 'raced_id', 'title': 'first_write'})
+            return [self.api_item('raced_id'), self.api_item('new_id')], None
+
+        with patch('src.models.channel.Channel.get', side_effect=side_effect):
+            channels = Channel.from_ids({'raced_id', 'new_id'})
+        assert channels['raced_id'].title == 'first_write'
+        assert channels['new_id'].title == 'title_new_id'
+
+
+class TestChannelCaseInsensitive(TestYoutube):
+
+    def setUp(self):
+        super(TestChannelCaseInsensitive, self).setUp()
+        self.url_channel = Channel(id='id_1', title='Violet Orlandi', url='VioletOrlandi')
+        self.user_channel = Channel(id='id_2', title='Violeta Orlandi', username='VioletaOrlandi')
+        self.session.add_all([self.url_channel, self.user_channel,
+                              UrlLookup(original='OldVioletOrlandi', resolved='VioletOrlandi', is_username=False),
+                              UrlLookup(original='VioletaOrlandiUrl', resolved='VioletaOrlandi', is_username=True)])
+        self.session.commit()
+
+    @patch('src.models.channel.Channel.get')
+    @patch('src.controllers.url_resolver.http_client.get')
+    def test_mixed_case_url_from_cache(self, patch_request, patch_get):
+        assert Channel.from_url('violetorlandi') == self.url_channel
+        assert Channel.from_url('OLDVIOLETORLANDI') == self.url_channel
+        assert Channel.from_url('violetaorlandiurl') == self.user_channel
+        assert patch_request.call_count == 0
+        assert patch_get.call_count == 0
+
+    @patch('src.models.channel.Channel.get')
+    def test_mixed_case_username_from_cache(self, patch_get):
+        assert Channel.from_username('violetaorlandi') == self.user_channel
+        assert patch_get.call_count == 0
+
+    def test_mixed_case_bulk_lookups(self):
+        assert Channel.from_usernames({'VIOLETAORLANDI', 'unknown'}) == {'VIOLETAORLANDI': self.user_channel}
+        channels = Channel.from_urls({'violetOrlandi', 'oldvioletorlandi', 'VIOLETAORLANDIURL', 'unknown'})
+        assert channels == {'violetOrlandi': self.url_channel, 'oldvioletorlandi': self.url_channel, 'VIOLETAORLANDIURL': self.user_channel}
+
+    def test_mixed_case_url_lookup(self):
+        assert UrlLookup.get_resolved('oldvioletorlandi') == 'VioletOrlandi'
+        assert UrlLookup.url_is_username('VIOLETAORLANDIURL') is True
+        assert set(UrlLookup.for_urls({'OLDVIOLETORLANDI', 'unknown'})) == {'OLDVIOLETORLANDI'}
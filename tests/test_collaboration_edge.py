@@ -0,0 +1,62 @@
+import datetime
+
+from src.models.channel import Channel
+from src.models.collaboration import Collaboration
+from src.models.collaboration_edge import CollaborationEdge
+from src.models.video import Video
+from tests.base_testcase import TestYoutube
+
+
+class TestCollaborationEdge(TestYoutube):
+
+    def setUp(self):
+        super(TestCollaborationEdge, self).setUp()
+        self.channels = [Channel(id=str(i), title=f'title_{i}') for i in range(1, 6)]
+        self.session.add_all(self.channels)
+        self.session.commit()
+
+    def add_collaboration(self, host, guest, video_id):
+        video = self.session.get(Video, video_id) or Video(id=video_id, channel_id=host.id, title='title', description='',
+                                                           published_at=datetime.datetime.now())
+        self.session.add(Collaboration(host, guest, video))
+        CollaborationEdge.increment({(host.id, guest.id): 1})
+        self.session.commit()
+
+    def test_increment(self):
+        c1, c2 = self.channels[:2]
+        self.add_collaboration(c1, c2, 'v1')
+        self.add_collaboration(c1, c2, 'v2')
+        CollaborationEdge.increment({(c1.id, c2.id): 3, (c2.id, c1.id): 1})
+        counts = {(e.host_id, e.guest_id): e.collaborations for e in self.session.query(CollaborationEdge)}
+        assert counts == {('1', '2'): 5, ('2', '1'): 1}
+
+    def test_for_target_channel_matches_collaborations(self):
+        c1, c2, c3, c4, c5 = self.channels
+        self.add_collaboration(c1, c2, 'v1')
+        self.add_collaboration(c1, c3, 'v1')
+        self.add_collaboration(c3, c2, 'v2')
+        self.add_collaboration(c3, c2, 'v3')
+        self.add_collaboration(c3, c5, 'v2')
+        self.add_collaboration(c5, c4, 'v4')
+        self.add_collaboration(c2, c4, 'v5')
+
+        edges = CollaborationEdge.for_target_channel(c1)
+        assert {(e.host.id, e.guest.id, e.collaborations) for e in edges} == {('1', '2', 1), ('1', '3', 1), ('3', '2', 2)}
+        collabs = Collaboration.for_target_channel(c1)
+        assert sum(e.collaborations for e in edges) == len(collabs)
+
+    def test_for_target_channel_without_collaborations(self):
+        assert CollaborationEdge.for_target_channel(self.channels[0]) == []
+
+    def test_rebuild(self):
+        c1, c2, c3 = self.channels[:3]
+        self.add_collaboration(c1, c2, 'v1')
+        self.add_collaboration(c1, c2, 'v2')
+        self.add_collaboration(c3, c1, 'v3')
+        self.session.query(CollaborationEdge).delete()
+        self.session.add(CollaborationEdge(host_id='2', guest_id='3', collaborations=10))
+        self.session.commit()
+
+        CollaborationEdge.rebuild()
+        counts = {(e.host_id, e.guest_id): e.collaborations for e in self.session.query(CollaborationEdge)}
+        assert counts == {('1', '2'): 2, ('3', '1'): 1}
@@ -0,0 +1,213 @@
+import datetime
+from unittest.mock import patch, call
+
+from sqlalchemy.orm import Query
+
+from src.controllers import get_collaborations
+from src.controllers.exceptions import ChannelNotFoundException
+from src.models.channel import Channel
+from src.models.crawl_job import CrawlJob
+from src.models.history import History
+from src.models.video import Video
+from src.views.graph import graph_bp
+from src import worker
+from tests.base_testcase import TestYoutube
+
+
+class TestCrawlJob(TestYoutube):
+
+    def job(self, job_id):
+        self.session.expire_all()
+        return self.session.get(CrawlJob, job_id)
+
+    def test_enqueue_reuses_unfinished_and_recent_jobs(self):
+        job = CrawlJob.enqueue('Violet Orlandi')
+        assert job.status == CrawlJob.QUEUED
+        assert CrawlJob.enqueue('Violet Orlandi').id == job.id
+        assert CrawlJob.enqueue('Halocene').id != job.id
+
+        CrawlJob.finish(job.id, 'id_1')
+        assert CrawlJob.enqueue('Violet Orlandi').id == job.id
+        self.session.query(CrawlJob).update({CrawlJob.updated_at: datetime.datetime(2020, 1, 1)})
+        self.session.commit()
+        assert CrawlJob.enqueue('Violet Orlandi').id != job.id
+
+    def test_enqueue_refresh_reuses_jobs_for_channel(self):
+        job = CrawlJob.enqueue('Violet Orlandi', channel_id='id_1')
+        assert job.channel_id == 'id_1'
+        assert CrawlJob.enqueue('violet orlandi', channel_id='id_1').id == job.id
+        assert CrawlJob.enqueue('Violet Orlandi').id == job.id
+        assert CrawlJob.enqueue('Halocene', channel_id='id_2').id != job.id
+
+    def test_enqueue_returns_job_queued_concurrently(self):
+        job = CrawlJob.enqueue('Violet Orlandi')
+        real_first = Query.first
+        reads = []
+
+        def first(query):
+            # This request read the channel's jobs before the other request queued its job
+            reads.append(query)
+            return None if len(reads) == 1 else real_first(query)
+
+        with patch.object(Query, 'first', first):
+            assert CrawlJob.enqueue('Violet Orlandi').id == job.id
+        assert self.session.query(CrawlJob).count() == 1
+
+    def queue_duplicate(self, job):
+        # As queued by a request which read the channel's last job before the given job was queued
+        now = datetime.datetime.utcnow()
+        duplicate = CrawlJob(channel_name=job.channel_name, channel_id=job.channel_id, status=CrawlJob.QUEUED, videos_done=0,
+                             created_at=now, updated_at=now)
+        self.session.add(duplicate)
+        self.session.commit()
+        return duplicate
+
+    def test_claim_skips_channel_being_crawled(self):
+        job = CrawlJob.enqueue('Violet Orlandi', channel_id='id_1')
+        assert CrawlJob.claim().id == job.id
+        duplicate = self.queue_duplicate(job)
+        other = CrawlJob.enqueue('Halocene')
+
+        assert CrawlJob.claim().id == other.id
+        assert CrawlJob.claim() is None
+        CrawlJob.finish(job.id, 'id_1')
+        assert CrawlJob.claim().id == duplicate.id
+
+    def test_release_fails_job_queued_again(self):
+        job = CrawlJob.enqueue('Violet Orlandi')
+        CrawlJob.claim()
+        duplicate = self.queue_duplicate(job)
+        CrawlJob.release(job.id)
+        assert (self.job(job.id).status, self.job(duplicate.id).status) == (CrawlJob.FAILED, CrawlJob.QUEUED)
+
+    def test_claim_in_order_once(self):
+        first, second = CrawlJob.enqueue('Violet Orlandi'), CrawlJob.enqueue('Halocene')
+        assert CrawlJob.claim().id == first.id
+        assert CrawlJob.claim().id == second.id
+        assert CrawlJob.claim() is None
+        assert self.job(first.id).status == CrawlJob.RUNNING
+
+    def test_abandoned_job_claimed_again(self):
+        job = CrawlJob.enqueue('Violet Orlandi')
+        CrawlJob.claim()
+        self.session.query(CrawlJob).update({CrawlJob.updated_at: datetime.datetime(2020, 1, 1)})
+        self.session.commit()
+        assert CrawlJob.claim().id == job.id
+        CrawlJob.release(job.id)
+        assert CrawlJob.claim().id == job.id
+
+    def test_progress(self):
+        job = CrawlJob.enqueue('Violet Orlandi')
+        CrawlJob.start_phase(job.id, CrawlJob.GUEST_DISCOVERY, 120)
+        CrawlJob.add_progress(job.id, 50)
+        CrawlJob.add_progress(job.id, 20)
+        assert (self.job(job.id).phase, self.job(job.id).videos_done, self.job(job.id).videos_total) == (CrawlJob.GUEST_DISCOVERY, 70, 120)
+        CrawlJob.start_phase(job.id, CrawlJob.UPLOADS)
+        assert (self.job(job.id).videos_done, self.job(job.id).videos_total) == (0, None)
+
+        assert CrawlJob.saved_guests(job.id) is None
+        CrawlJob.save_guests(job.id, {'id_2', 'id_1'})
+        assert CrawlJob.saved_guests(job.id) == {'id_1', 'id_2'}
+
+    def test_progress_endpoint(self):
+        self.app.register_blueprint(graph_bp)
+        job = CrawlJob.enqueue('Violet Orlandi')
+        CrawlJob.start_phase(job.id, CrawlJob.COLLABORATIONS, 10)
+        self.session.expire_all()
+        response = self.app.test_client().get(f'/crawl_progress/{job.id}')
+        assert response.json == {'id': job.id, 'channel_name': 'Violet Orlandi', 'status': CrawlJob.QUEUED,
+                                 'phase': CrawlJob.COLLABORATIONS, 'videos_done': 0, 'videos_total': 10, 'error': None}
+        assert self.app.test_client().get('/crawl_progress/999').status_code == 404
+
+
+class TestCrawlJobWorker(TestYoutube):
+
+    def setUp(self):
+        super(TestCrawlJobWorker, self).setUp()
+        self.channel = Channel(id='id_1', title='Violet Orlandi', uploads_id='uploads_1')
+        self.session.add(self.channel)
+        self.session.commit()
+        self.job = CrawlJob.enqueue('Violet Orlandi')
+        CrawlJob.claim()
+
+    def status(self):
+        self.session.expire_all()
+        return self.session.get(CrawlJob, self.job.id)
+
+    @patch('src.worker.heartbeat')
+    @patch('src.worker.get_collaborations.crawl_channel')
+    def test_run_job(self, patch_crawl, patch_heartbeat):
+        patch_crawl.side_effect = lambda name, record_history: self.session.get(Channel, 'id_1')
+        worker.run_job(self.job)
+        assert (self.status().status, self.status().channel_id) == (CrawlJob.DONE, 'id_1')
+        # The history is recorded when the crawled channel is served
+        assert patch_crawl.call_args == call('Violet Orlandi', record_history=False)
+        assert get_collaborations.current_job.get() is None
+
+    @patch('src.worker.logger')
+    @patch('src.worker.heartbeat')
+    @patch('src.worker.get_collaborations.crawl_channel', side_effect=ChannelNotFoundException('Violet Orlandi'))
+    def test_run_job_failure(self, patch_crawl, patch_heartbeat, patch_logger):
+        worker.run_job(self.job)
+        assert (self.status().status, self.status().error) == (CrawlJob.FAILED, 'ChannelNotFoundException')
+
+    @patch('src.worker.logger')
+    @patch('src.worker.heartbeat')
+    @patch('src.worker.get_collaborations.crawl_channel', side_effect=KeyboardInterrupt)
+    def test_stopped_worker_releases_job(self, patch_crawl, patch_heartbeat, patch_logger):
+        with self.assertRaises(KeyboardInterrupt):
+            worker.run_job(self.job)
+        assert self.status().status == CrawlJob.QUEUED
+
+    @patch('src.worker.heartbeat')
+    @patch('src.controllers.get_collaborations.Video.ids_from_channel', return_value=[])
+    @patch('src.controllers.get_collaborations.get_target_channel')
+    def test_crawl_counted_once_in_history(self, patch_target, patch_ids, patch_heartbeat):
+        patch_target.return_value = self.channel
+        self.channel.processed = True
+        self.session.commit()
+        worker.run_job(self.job)
+        assert get_collaborations.get_cached_channel('Violet Orlandi') == self.channel
+        assert self.session.query(History.popularity).scalar() == 1
+
+    @patch('src.controllers.get_collaborations.History')
+    @patch('src.controllers.get_collaborations.get_uploads_for_channel', return_value=['video_1'])
+    @patch('src.controllers.get_collaborations.get_guest_channels_for_videos')
+    @patch('src.controllers.get_collaborations.populate_collaborations')
+    @patch('src.controllers.get_collaborations.Video.ids_from_channel', return_value=[])
+    @patch('src.controllers.get_collaborations.get_target_channel')
+    def test_resumed_crawl_skips_guest_discovery(self, patch_target, patch_ids, patch_populate, patch_guests, patch_uploads, patch_history):
+        patch_target.return_value = self.channel
+        CrawlJob.save_guests(self.job.id, {'id_1', 'id_2'})
+        token = get_collaborations.current_job.set(self.job.id)
+        try:
+            get_collaborations.crawl_channel('Violet Orlandi')
+        finally:
+            get_collaborations.current_job.reset(token)
+        assert patch_guests.call_count == 0
+        assert sorted(c.args[0] for c in patch_uploads.call_args_list) == ['id_1', 'id_2']
+        assert sorted(v for c in patch_populate.call_args_list for v in c.args[1]) == ['video_1', 'video_1']
+        assert (self.status().phase, self.status().videos_total) == (CrawlJob.COLLABORATIONS, 2)
+        assert self.session.get(Channel, 'id_1').processed
+
+    @patch('src.controllers.get_collaborations.History')
+    @patch('src.controllers.get_collaborations.get_uploads_for_channel')
+    @patch('src.controllers.get_collaborations.populate_collaborations')
+    @patch('src.controllers.get_collaborations.Video.ids_from_channel', return_value=[])
+    @patch('src.controllers.get_collaborations.get_target_channel')
+    def test_resumed_crawl_skips_processed_videos(self, patch_target, patch_ids, patch_populate, patch_uploads, patch_history):
+        patch_target.return_value = self.channel
+        patch_uploads.side_effect = lambda channel_id: [f'{channel_id}_video_{i}' for i in range(2)]
+        self.session.add_all([Video(id=f'id_{c}_video_{i}', channel_id=f'id_{c}', title='', description='',
+                                    published_at=datetime.datetime.now()) for c in (1, 2) for i in range(2)])
+        # An earlier run of the job processed one chunk, before the channel was processed
+        Video.mark_processed({'id_1_video_0', 'id_2_video_1'}, self.channel)
+        self.session.commit()
+        CrawlJob.save_guests(self.job.id, {'id_1', 'id_2'})
+        token = get_collaborations.current_job.set(self.job.id)
+        try:
+            get_collaborations.crawl_channel('Violet Orlandi')
+        finally:
+            get_collaborations.current_job.reset(token)
+        assert sorted(v for c in patch_populate.call_args_list for v in c.args[1]) == ['id_1_video_1', 'id_2_video_0']
+        assert (self.status().videos_done, self.status().videos_total) == (2, 4)
@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+import contextvars
+
+from flask import Flask, current_app
+
+from src.controllers import crawler
+
+
+class TestCrawler(TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_get_chunks(self):
+        chunks = crawler.get_chunks(list(range(7)), 3)
+        assert chunks == [[0, 3, 6], [1, 4], [2, 5]]
+
+    def test_get_chunks_omits_empty(self):
+        chunks = crawler.get_chunks([1, 2], 4)
+        assert chunks == [[1], [2]]
+
+    def test_run_parallel_preserves_order(self):
+        results = crawler.run_parallel(lambda a, b: a * b, [[i, 2] for i in range(20)])
+        assert results == [i * 2 for i in range(20)]
+
+    def test_run_parallel_pushes_app_context(self):
+        results = crawler.run_parallel(lambda: current_app.name, [[], []])
+        assert results == [self.app.name, self.app.name]
+
+    def test_run_parallel_raises_worker_errors(self):
+        def fail():
+            raise ValueError("Test Error")
+
+        with self.assertRaises(ValueError):
+            crawler.run_parallel(fail, [[]])
+
+    def test_run_parallel_copies_context(self):
+        var = contextvars.ContextVar('var')
+        var.set('value')
+        assert crawler.run_parallel(var.get, [[], []]) == ['value', 'value']
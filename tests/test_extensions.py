@@ -0,0 +1,32 @@
+from sqlalchemy import inspect, text
+
+from src.extensions import create_missing_columns, create_missing_indexes
+from tests.base_testcase import TestYoutube
+
+
+class TestExtensions(TestYoutube):
+
+    def index_names(self):
+        return {row[0] for row in self.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+
+    def test_create_missing_columns(self):
+        self.session.execute(text("ALTER TABLE channel DROP COLUMN refreshed_at"))
+        self.session.commit()
+
+        create_missing_columns()
+        create_missing_columns()
+        assert 'refreshed_at' in {c['name'] for c in inspect(self.engine).get_columns('channel')}
+
+    def test_create_missing_indexes(self):
+        self.session.execute(text("DROP INDEX ix_channel_title"))
+        self.session.execute(text("DROP INDEX ix_channel_username_lower"))
+        self.session.commit()
+
+        create_missing_indexes()
+        assert {'ix_channel_title', 'ix_channel_username_lower', 'ix_video_channel_id_published_at'} <= self.index_names()
+        assert 'ix_channel_title' in {i['name'] for i in inspect(self.engine).get_indexes('channel')}
+
+    def test_create_missing_indexes_is_repeatable(self):
+        before = self.index_names()
+        create_missing_indexes()
+        assert self.index_names() == before
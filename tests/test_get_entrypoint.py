@@ -2,12 +2,19 @@ import datetime
 from unittest.mock import patch, call, MagicMock
 
 from requests import HTTPError
+from sqlalchemy import event
 
 from src.controllers import get_collaborations
 from src.controllers.exceptions import ChannelNotFoundException
 from src.models.channel import Channel
+from src.models.collaboration import Collaboration
+from src.models.collaboration_edge import CollaborationEdge
+from src.models.crawl_job import CrawlJob
+from src.models.data_version import DataVersion
 from src.models.search import SearchResult
 from src.models.video import Video
+from src.models.video_mention import VideoMention
+from src.models.video_processed_for import VideoProcessedFor
 from tests.base_testcase import TestYoutube
 
 
@@ -27,7 +34,7 @@ class TestGetEntrypoint(TestYoutube):
         from_id.return_value = matching_channel
         channel = get_collaborations.get_target_channel(search_term)
         assert from_id.call_count == 1
-        assert from_id.call_args_list[0] == call("2")
+        assert from_id.call_args_list[0] == call("2", cache_only=False)
         assert channel == matching_channel  # Check we actually return the result of Channel.from_id
 
     @patch('src.controllers.get_collaborations.SearchResult.from_term')
@@ -45,74 +52,65 @@ class TestGetEntrypoint(TestYoutube):
 
     @patch('src.controllers.get_collaborations.logger.error')
     @patch('src.controllers.get_collaborations.Channel')
-    @patch('src.controllers.get_collaborations.Video.from_id')
-    def test_get_channels_from_description_success(self, patch_video_from_id, patch_channel, patch_logger):
-        channel_1 = Channel('1', 'title_1', 'uploads_1', 'thumbnail_1', 'url_1')
-        channel_2 = Channel('2', 'title_2', 'uploads_2', 'thumbnail_2', 'url_2')
+    @patch('src.controllers.get_collaborations.Video.from_ids')
+    def test_get_channels_from_description_success(self, patch_video_from_ids, patch_channel, patch_logger):
+        channel_1 = Channel(id='1', title='title_1', uploads_id='uploads_1', thumbnail_url='thumbnail_1', url='url_1')
+        channel_2 = Channel(id='2', title='title_2', uploads_id='uploads_2', thumbnail_url='thumbnail_2', url='url_2')
 
-        patch_video_from_id.return_value = MagicMock(id="123")
-        patch_channel.from_id.return_value = channel_1
+        patch_video_from_ids.return_value = {v: MagicMock(id=v, channel_id="456") for v in ["9", "10", "11", "12"]}
+        patch_channel.from_ids.return_value = {"456": channel_1}
+        patch_channel.from_usernames.return_value = {}
         patch_channel.from_username.return_value = channel_2
-        patch_channel.from_url.return_value = channel_1
+        patch_channel.from_urls.return_value = {}
+        patch_channel.resolve_urls.return_value = {"url": channel_1}, {}
 
-        video = MagicMock(
-            get_channel_ids_from_description=MagicMock(return_value={"456"}),
-            get_users_from_description=MagicMock(return_value={"user1", "user2"}),
-            get_video_ids_from_description=MagicMock(return_value={"9", "10", "11", "12"}),
-            get_urls_from_description=MagicMock(return_value={"url"})
-        )
+        video = Video(id='video_id', title='title', description="""
+            https://www.youtube.com/channel/456 https://www.youtube.com/user/user1 https://www.youtube.com/user/user2
+            https://www.youtube.com/watch?v=9 https://www.youtube.com/watch?v=10 https://youtu.be/11 https://youtu.be/12
+            https://www.youtube.com/url""")
         channels = get_collaborations.get_channels_from_description(video)
         assert channels == {channel_1, channel_2}
-        assert patch_video_from_id.call_count == 4
-        assert patch_channel.from_id.call_count == 5
+        assert patch_video_from_ids.call_count == 1
+        assert patch_video_from_ids.call_args_list[0] == call({"9", "10", "11", "12"}, cache_only=False)
+        assert patch_channel.from_ids.call_count == 1
+        assert patch_channel.from_ids.call_args_list[0] == call({"456"}, cache_only=False)
         assert patch_channel.from_username.call_count == 2
-        assert patch_channel.from_url.call_count == 1
+        assert patch_channel.resolve_urls.call_args_list == [call({"url"})]
         assert patch_logger.call_count == 0
 
     @patch('src.controllers.get_collaborations.logger.error')
     @patch('src.controllers.get_collaborations.Channel')
-    @patch('src.controllers.get_collaborations.Video.from_id')
-    def test_get_channels_from_description_failures(self, patch_video_from_id, patch_channel, patch_logger):
-        # ID 1 returns channel_1, ID 2 raises HTTP error for each video method
-        channel_1 = Channel('1', 'title_1', 'uploads_1', 'thumbnail_1', 'url_1')
+    @patch('src.controllers.get_collaborations.Video.from_ids')
+    def test_get_channels_from_description_failures(self, patch_video_from_ids, patch_channel, patch_logger):
+        # ID 1 returns channel_1, ID 2 raises HTTP error for each channel method, and isn't found by ID
+        channel_1 = Channel(id='1', title='title_1', uploads_id='uploads_1', thumbnail_url='thumbnail_1', url='url_1')
 
         def side_effect(arg, **kwargs):
             if arg == "1":
                 return channel_1
             raise HTTPError("Test Error")
 
-        def side_effect_video(arg, **kwargs):
-            if arg == "1":
-                return MagicMock(channel_id="1")
-            raise HTTPError("Test Error")
-
-        patch_video_from_id.side_effect = side_effect_video
-        patch_channel.from_id.side_effect = side_effect
+        patch_video_from_ids.return_value = {"1": MagicMock(channel_id="1")}
+        patch_channel.from_ids.return_value = {"1": channel_1}
+        patch_channel.from_usernames.return_value = {}
         patch_channel.from_username.side_effect = side_effect
-        patch_channel.from_url.side_effect = side_effect
+        patch_channel.from_urls.return_value = {}
+        patch_channel.resolve_urls.return_value = {"1": channel_1}, {"2": HTTPError("Test Error")}
 
-        video = MagicMock(
-            get_channel_ids_from_description=MagicMock(return_value={"1", "2"}),
-            get_users_from_description=MagicMock(return_value={"1", "2"}),
-            get_video_ids_from_description=MagicMock(return_value={"1", "2"}),
-            get_urls_from_description=MagicMock(return_value={"1", "2"}),
-            __repr__=MagicMock(return_value="Test Video")
-        )
+        video = Video(id='video_id', title='Test Video', description="""
+            https://www.youtube.com/channel/1 https://www.youtube.com/channel/2 https://www.youtube.com/user/1
+            https://www.youtube.com/user/2 https://youtu.be/1 https://youtu.be/2 https://www.youtube.com/1 https://www.youtube.com/2""")
         channels = get_collaborations.get_channels_from_description(video)
         assert channels == {channel_1}
-        assert patch_video_from_id.call_count == 2
-        assert patch_channel.from_id.call_count == 3
+        assert patch_video_from_ids.call_count == 1
+        assert patch_channel.from_ids.call_args_list[0] == call({"1", "2"}, cache_only=False)
         assert patch_channel.from_username.call_count == 2
-        assert patch_channel.from_url.call_count == 2
+        assert patch_channel.resolve_urls.call_args_list == [call({"1", "2"})]
 
-        assert patch_logger.call_count == 4
-        assert call(
-            "Failed processing channel ID '2' from video 'Test Video' - Test Error") in patch_logger.call_args_list
+        assert patch_logger.call_count == 2
         assert call(
-            "Failed processing username '2' from video 'Test Video' - Test Error") in patch_logger.call_args_list
-        assert call(
-            "Failed processing video ID '2' from video 'Test Video' - Test Error") in patch_logger.call_args_list
-        assert call("Failed processing url '2' from video 'Test Video' - Test Error") in patch_logger.call_args_list
+            "Failed processing username '2' from video 'Test Video - video_id' - Test Error") in patch_logger.call_args_list
+        assert call("Failed processing url '2' from video 'Test Video - video_id' - Test Error") in patch_logger.call_args_list
 
     @patch('src.controllers.get_collaborations.logger')
     @patch('src.controllers.get_collaborations.SearchResult')
@@ -129,37 +127,30 @@ class TestGetEntrypoint(TestYoutube):
                     SearchResult("2", "Violet Orlandi", "term"),
                     SearchResult("3", "Topic - Violet Orlandi & Lauren Babic", "term")]
 
-        def title_side_effect(title):
-            if title == 'Halocene':
-                return halocene
-
-        def id_side_effect(id):
-            if id == '2':
-                return violet_orlandi
-            return MagicMock()
-
-        def search_side_effect(term, **kwargs):
+        def search_side_effect(term):
             if term == 'h20Delir':
                 raise HTTPError("Test Error")
             else:
                 return searches
 
-        patch_channel.from_title.side_effect = title_side_effect
-        patch_channel.from_id.side_effect = id_side_effect
+        patch_channel.from_titles.return_value = {'Halocene': halocene}
+        patch_channel.from_ids.return_value = {'1': MagicMock(), '2': violet_orlandi, '3': MagicMock()}
+        patch_search.from_terms.return_value = {}
         patch_search.from_term.side_effect = search_side_effect
         video = MagicMock(
+            id='video1',
             __repr__=MagicMock(return_value="Test Video"),
             get_collaborators_from_title=MagicMock(return_value={'Halocene ft.', 'Violet Orlandi', 'Lollia', 'h20Delir'})
         )
 
         channels = get_collaborations.get_channels_from_title(video)
         assert channels == {halocene, violet_orlandi}
-        assert patch_channel.from_id.call_count == 5
-        assert patch_channel.from_title.call_count == 6
+        patch_channel.from_titles.assert_called_once_with({'Halocene ft.', 'Halocene', 'Violet Orlandi', 'Violet', 'Lollia', 'h20Delir'})
+        patch_search.from_terms.assert_called_once_with({'Violet Orlandi|Violet', 'Lollia', 'h20Delir'})
         assert patch_search.from_term.call_count == 3
-        assert call('h20Delir', cache_only=False) in patch_search.from_term.call_args_list
-        assert call('Lollia', cache_only=False) in patch_search.from_term.call_args_list
-        assert call('Violet Orlandi|Violet', cache_only=False) in patch_search.from_term.call_args_list
+        assert call('h20Delir') in patch_search.from_term.call_args_list
+        assert call('Lollia') in patch_search.from_term.call_args_list
+        assert call('Violet Orlandi|Violet') in patch_search.from_term.call_args_list
         assert patch_logger.error.call_count == 3
         assert call("Processing channel name 'Lollia' from title of 'Test Video' failed") in patch_logger.error.call_args_list
         assert call("Processing search term '['h20Delir']' for video 'Test Video' - 'Test Error'") in patch_logger.error.call_args_list
@@ -170,12 +161,11 @@ class TestGetEntrypoint(TestYoutube):
     def test_get_uploads_for_channels(self, patch_video, patch_logger):
         def side_effect(channel):
             if channel.id == 'id1':
-                return [Video('1', 'id1', 'title1', 'desc', 'thumb', datetime.datetime.now()),
-                        Video('2', 'id1', 'title2', 'desc', 'thumb', datetime.datetime.now())]
+                return ['1', '2']
             else:
                 raise HTTPError("TestError")
 
-        patch_video.from_channel.side_effect = side_effect
+        patch_video.ids_from_channel.side_effect = side_effect
         Channel('id1', 'title1', 'uploads1', 'thumbnail1', '')
         videos = get_collaborations.get_uploads_for_channel('id1')
         assert len(videos) == 2
@@ -186,21 +176,148 @@ class TestGetEntrypoint(TestYoutube):
         assert patch_logger.error.call_count == 1
         assert patch_logger.error.call_args_list[0] == call("Processing uploads for channel 'title2' - 'TestError'")
 
-    @patch('src.controllers.get_collaborations.Collaboration')
-    @patch('src.controllers.get_collaborations.Channel')
-    @patch('src.controllers.get_collaborations.Video.from_id')
-    @patch('src.controllers.get_collaborations.get_channels_from_description')
-    @patch('src.controllers.get_collaborations.get_channels_from_title')
-    def test_populate_collaborations(self, patch_title, patch_description, patch_video_from_id,
-                                     patch_channel, patch_collaboration):
-        c1 = MagicMock(id="id_1")
-        c2 = MagicMock(id="id_2")
-        c_host = MagicMock(id="id_host")
-        patch_title.return_value = {c1}
-        patch_description.return_value = {c1, c2, c_host}
-        patch_channel.from_id.return_value = c_host
-        get_collaborations.populate_collaborations("1", ['id1', 'id1'])
-
-        # assert patch_collaboration.call_count == 4
-        assert set([call.args[0].id for call in patch_collaboration.call_args_list]) == {'id_host'}
-        assert set([call.args[1].id for call in patch_collaboration.call_args_list]) == {'id_1', 'id_2'}
+    def populate_chunk(self, video_count, patch_description, patch_title):
+        self.session.add(Channel(id='id_host', title='host', uploads_id='uploads'))
+        self.session.add_all([Channel(id=f'id_{i}', title=f'title_{i}') for i in range(1, 4)])
+        self.session.add_all([Video(id=f'video_{i}', channel_id='id_host', title=f'title {i}', description='',
+                                    published_at=datetime.datetime.now()) for i in range(video_count)])
+        self.session.commit()
+
+        # Every video mentions all guests, and the host itself, in its description, and the first guest in its title
+        def description_side_effect(videos, **kwargs):
+            channels = set(self.session.query(Channel))
+            return {v.id: channels for v in videos}
+
+        def title_side_effect(videos, **kwargs):
+            channel = self.session.get(Channel, 'id_1')
+            return {v.id: {channel} for v in videos}
+
+        patch_description.side_effect = description_side_effect
+        patch_title.side_effect = title_side_effect
+
+    @patch('src.controllers.get_collaborations.get_channels_from_titles')
+    @patch('src.controllers.get_collaborations.get_channels_from_descriptions')
+    def test_populate_collaborations(self, patch_description, patch_title):
+        self.populate_chunk(2, patch_description, patch_title)
+        host = self.session.get(Channel, 'id_host')
+        guests = [self.session.get(Channel, f'id_{i}') for i in range(1, 4)]
+        self.session.add(Collaboration(host, guests[0], self.session.get(Video, 'video_0')))
+        self.session.commit()
+
+        get_collaborations.populate_collaborations('id_host', ['video_0', 'video_1', 'video_1'])
+
+        collabs = {(c.channel_1_id, c.channel_2_id, c.video_id) for c in self.session.query(Collaboration)}
+        assert collabs == {(host.id, guest.id, f'video_{i}') for guest in guests for i in range(2)}
+        edges = {(e.host_id, e.guest_id): e.collaborations for e in self.session.query(CollaborationEdge)}
+        assert edges == {('id_host', 'id_1'): 1, ('id_host', 'id_2'): 2, ('id_host', 'id_3'): 2}
+        assert DataVersion.describe(host, guests[1]) == 'id_host:4|id_2:1'
+        assert {(p.video_id, p.channel_id) for p in self.session.query(VideoProcessedFor)} == {('video_0', 'id_host'), ('video_1', 'id_host')}
+
+    @patch('src.controllers.get_collaborations.get_channels_from_titles')
+    @patch('src.controllers.get_collaborations.get_channels_from_descriptions')
+    def test_populate_collaborations_constant_queries(self, patch_description, patch_title):
+        self.populate_chunk(100, patch_description, patch_title)
+        self.session.remove()
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+        get_collaborations.populate_collaborations('id_host', ['video_0'])
+        single_video = len(statements)
+        self.session.remove()
+        statements.clear()
+        get_collaborations.populate_collaborations('id_host', [f'video_{i}' for i in range(1, 100)])
+        assert len(statements) == single_video, statements
+
+    @patch('src.controllers.get_collaborations.get_channels_from_titles')
+    @patch('src.controllers.get_collaborations.get_channels_from_descriptions')
+    def test_guest_discovery_stores_mentions(self, patch_description, patch_title):
+        self.populate_chunk(2, patch_description, patch_title)
+
+        guests = get_collaborations.get_guest_channels_for_videos(['video_0', 'video_1'])
+
+        assert set(guests) == {'id_host', 'id_1', 'id_2', 'id_3'}
+        mentions = {(m.video_id, m.channel_id, m.source) for m in self.session.query(VideoMention)}
+        assert (('video_0', 'id_2', VideoMention.DESCRIPTION) in mentions and ('video_1', 'id_1', VideoMention.TITLE) in mentions)
+        assert len(mentions) == 10
+        assert Video.mentions_resolved_for({'video_0', 'video_1', 'video_2'}) == {'video_0': True, 'video_1': True}
+
+    @patch('src.controllers.get_collaborations.get_channels_from_titles')
+    @patch('src.controllers.get_collaborations.get_channels_from_descriptions')
+    def test_guest_discovery_reads_resolved_mentions(self, patch_description, patch_title):
+        self.populate_chunk(2, patch_description, patch_title)
+        get_collaborations.get_guest_channels_for_videos(['video_0'])
+        patch_description.reset_mock()
+
+        guests = get_collaborations.get_guest_channels_for_videos(['video_0', 'video_1'])
+
+        assert set(guests) == {'id_host', 'id_1', 'id_2', 'id_3'}
+        assert [v.id for v in patch_description.call_args.args[0]] == ['video_1']
+
+    @patch('src.controllers.get_collaborations.get_channels_from_titles')
+    @patch('src.controllers.get_collaborations.get_channels_from_descriptions')
+    def test_populate_collaborations_from_stored_mentions(self, patch_description, patch_title):
+        self.populate_chunk(2, patch_description, patch_title)
+        get_collaborations.get_guest_channels_for_videos(['video_0', 'video_1'])
+        patch_description.reset_mock()
+        patch_title.reset_mock()
+
+        get_collaborations.populate_collaborations('id_host', ['video_0', 'video_1'])
+        get_collaborations.populate_collaborations('id_1', ['video_0', 'video_1'])
+
+        patch_description.assert_not_called()
+        patch_title.assert_not_called()
+        collabs = [(c.channel_1_id, c.channel_2_id, c.video_id) for c in self.session.query(Collaboration)]
+        assert sorted(collabs) == sorted(('id_host', f'id_{g}', f'video_{i}') for g in range(1, 4) for i in range(2))
+
+    @patch('src.controllers.get_collaborations.get_channels_from_titles')
+    @patch('src.controllers.get_collaborations.get_channels_from_descriptions')
+    def test_populate_collaborations_resolves_undiscovered_videos_again(self, patch_description, patch_title):
+        self.populate_chunk(1, patch_description, patch_title)
+
+        get_collaborations.populate_collaborations('id_host', ['video_0'])
+        get_collaborations.populate_collaborations('id_1', ['video_0'])
+
+        # Mentions resolved from the cache alone may be incomplete, so they're resolved again
+        assert patch_description.call_count == 2
+        assert all(c.kwargs == {'cache_only': True} for c in patch_description.call_args_list)
+        assert self.session.query(Collaboration).count() == 3
+        assert Video.mentions_resolved_for({'video_0'}) == {'video_0': False}
+
+
+class TestGetCachedChannel(TestYoutube):
+
+    def setUp(self):
+        super(TestGetCachedChannel, self).setUp()
+        self.channel = Channel(id='id_1', title='Violet Orlandi', uploads_id='uploads_1', processed=True)
+        self.session.add_all([self.channel, SearchResult(id='id_1', title='Violet Orlandi', search_term='Violet Orlandi')])
+        self.session.commit()
+
+    def crawled(self, **age):
+        self.channel.refreshed_at = datetime.datetime.utcnow() - datetime.timedelta(**age)
+        self.session.commit()
+
+    def queued(self):
+        return [(j.channel_name, j.channel_id) for j in self.session.query(CrawlJob)]
+
+    def test_recent_crawl_served_from_cache(self):
+        self.crawled(minutes=1)
+        assert get_collaborations.get_cached_channel('Violet Orlandi') == self.channel
+        assert self.queued() == []
+
+    def test_stale_crawl_refreshed_once_in_background(self):
+        self.crawled(hours=2)
+        self.session.add(SearchResult(id='id_1', title='Violet Orlandi', search_term='violet orlandi'))
+        self.session.commit()
+        for name in ['Violet Orlandi', 'Violet Orlandi', 'violet orlandi']:
+            assert get_collaborations.get_cached_channel(name) == self.channel
+        # Requests by other names for the same channel share its job
+        assert self.queued() == [('Violet Orlandi', 'id_1')]
+
+    def test_old_or_unprocessed_needs_crawl(self):
+        self.crawled(days=30)
+        assert get_collaborations.get_cached_channel('Violet Orlandi') is None
+        self.channel.processed = False
+        self.crawled(minutes=1)
+        assert get_collaborations.get_cached_channel('Violet Orlandi') is None
+        assert get_collaborations.get_cached_channel('Halocene') is None
+        assert self.queued() == []
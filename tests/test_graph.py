@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+from types import SimpleNamespace
+from unittest import TestCase
+
+from src.views import graph
+
+
+def reference_trimmed_range(strengths):
+    # The original implementation, re-sorting and recalculating the deviation for every dropped pair
+    index = -1
+    std_dev = statistics.stdev(sorted(strengths))
+    range = sorted(strengths)[-1] - sorted(strengths)[0]
+    while std_dev > 50:
+        index -= 1
+        std_dev = statistics.stdev(sorted(strengths)[:index])
+        range = sorted(strengths)[index] - sorted(strengths)[0]
+    return range
+
+
+def make_edges(pair_count):
+    channels = [SimpleNamespace(id=f'id_{i}', title=f'title_{i}', thumbnail_url='thumb') for i in range(pair_count + 1)]
+    rng = random.Random(pair_count)
+    return [SimpleNamespace(host=channels[0], guest=channels[i], host_id=channels[0].id, guest_id=channels[i].id,
+                            collaborations=int(rng.paretovariate(0.8)))
+            for i in range(1, pair_count + 1)]
+
+
+class TestGraph(TestCase):
+
+    def test_trimmed_range_matches_reference(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            strengths = [int(rng.paretovariate(rng.uniform(0.3, 2))) for _ in range(rng.randint(2, 150))]
+            assert graph.get_trimmed_range(strengths) == reference_trimmed_range(strengths), strengths
+
+    def test_trimmed_range_drops_outliers(self):
+        # Untrimmed range is 599, the range is measured up to the weakest of the dropped pairs
+        assert graph.get_trimmed_range([1, 2, 3, 400, 500, 600]) == 399
+
+    def test_trimmed_range_single_pair(self):
+        assert graph.get_trimmed_range([7]) == 0
+
+    def test_build_anygraph_json(self):
+        c1 = SimpleNamespace(id='id_1', title='title 1', thumbnail_url='thumb_1')
+        c2 = SimpleNamespace(id='id_2', title='title_2', thumbnail_url='thumb_2')
+        c3 = SimpleNamespace(id='id_3', title='title_3', thumbnail_url='thumb_3')
+        edges = [SimpleNamespace(host=c1, guest=c2, host_id='id_1', guest_id='id_2', collaborations=3),
+                 SimpleNamespace(host=c2, guest=c1, host_id='id_2', guest_id='id_1', collaborations=1),
+                 SimpleNamespace(host=c1, guest=c3, host_id='id_1', guest_id='id_3', collaborations=1)]
+        collabs_json, node_size = graph.build_anygraph_json('https://self', 'title 1', edges)
+
+        assert node_size == 100
+        assert collabs_json['nodes'][0] == {'id': 'title 1', 'channel_id': 'id_1',
+                                            'url': 'https://self?channel=title%201&previous_channel=title%201',
+                                            'fill': {'src': 'thumb_1'}}
+        assert [(e['from'], e['to'], e['normal']['stroke']['thickness']) for e in collabs_json['edges']] == \
+            [('title 1', 'title_2', 4 / 3 * 40), ('title 1', 'title_3', 1 / 3 * 40)]
+
+    def test_build_anygraph_json_equal_strengths(self):
+        collabs_json, node_size = graph.build_anygraph_json('https://self', 'title_0', make_edges(20)[:1])
+        assert collabs_json['edges'][0]['normal']['stroke']['thickness'] == node_size
+
+    def test_build_anygraph_json_scales_linearly(self):
+        # Micro-benchmark: 10x the pairs should cost roughly 10x the time, not 100x+ as the original loop did.
+        # The bound is loose to allow for sorting, and noise on shared machines.
+        def best_time(edges):
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                graph.build_anygraph_json('https://self', 'title_0', edges)
+                timings.append(time.perf_counter() - start)
+            return min(timings)
+
+        small, large = make_edges(10_000), make_edges(100_000)
+        ratio = best_time(large) / best_time(small)
+        assert ratio < 30, f"100k pairs took {ratio:.1f}x as long as 10k pairs"
@@ -0,0 +1,102 @@
+import datetime
+from unittest.mock import patch
+
+from src.models.channel import Channel
+from src.models.collaboration_edge import CollaborationEdge
+from src.models.data_version import DataVersion
+from src.models.graph_cache import GraphCache
+from src.views.graph import graph_bp
+from tests.base_testcase import TestYoutube
+
+
+class TestGraphCache(TestYoutube):
+
+    def setUp(self):
+        super(TestGraphCache, self).setUp()
+        self.c1 = Channel(id='id_1', title='title_1')
+        self.c2 = Channel(id='id_2', title='title_2')
+        self.session.add_all([self.c1, self.c2])
+        self.session.commit()
+        self.collab_data = {'nodes': [{'id': 'title_1'}], 'edges': []}
+
+    def test_make_key(self):
+        assert GraphCache.make_key(self.c1, None) == 'id_1|'
+        assert GraphCache.make_key(self.c1, self.c2) == 'id_1|id_2'
+
+    def test_describe_versions(self):
+        assert DataVersion.describe(self.c1, None) == 'id_1:0|'
+        DataVersion.bump({'id_1', 'id_2'})
+        DataVersion.bump({'id_2'})
+        assert DataVersion.describe(self.c1, self.c2) == 'id_1:1|id_2:2'
+
+    def test_hit(self):
+        versions = DataVersion.describe(self.c1, None)
+        GraphCache.add('id_1|', versions, self.collab_data, 12.5)
+        assert GraphCache.get('id_1|', versions) == (self.collab_data, 12.5)
+
+    def test_miss_after_version_bump(self):
+        GraphCache.add('id_1|', DataVersion.describe(self.c1, None), self.collab_data, 12.5)
+        DataVersion.bump({'id_1'})
+        assert GraphCache.get('id_1|', DataVersion.describe(self.c1, None)) is None
+
+    def test_miss_after_guests_collaborate(self):
+        c3 = Channel(id='id_3', title='title_3')
+        self.session.add(c3)
+        CollaborationEdge.increment({('id_1', 'id_2'): 1, ('id_1', 'id_3'): 1})
+        DataVersion.bump({'id_1', 'id_2', 'id_3'})
+        self.session.commit()
+        versions = DataVersion.describe(self.c1, None)
+        GraphCache.add('id_1|', versions, self.collab_data, 12.5)
+
+        # A crawl of guest id_2 finds it collaborated with id_3, which is drawn on id_1's graph too
+        CollaborationEdge.increment({('id_2', 'id_3'): 1})
+        DataVersion.bump({'id_2', 'id_3'})
+        self.session.commit()
+        assert DataVersion.describe(self.c1, None) != versions
+        assert GraphCache.get('id_1|', DataVersion.describe(self.c1, None)) is None
+
+    def test_replace_entry(self):
+        GraphCache.add('id_1|', 'id_1:0|', self.collab_data, 12.5)
+        GraphCache.add('id_1|', 'id_1:1|', {'nodes': [], 'edges': []}, 100)
+        assert GraphCache.get('id_1|', 'id_1:1|') == ({'nodes': [], 'edges': []}, 100)
+        assert self.session.query(GraphCache).count() == 1
+
+    @patch('src.models.graph_cache.config')
+    def test_least_recently_used_evicted(self, patch_config):
+        patch_config.graph_cache_size = 2
+        GraphCache.add('a|', 'v', self.collab_data, 1)
+        GraphCache.add('b|', 'v', self.collab_data, 1)
+        GraphCache.get('a|', 'v')
+        GraphCache.add('c|', 'v', self.collab_data, 1)
+        assert {e.key for e in self.session.query(GraphCache)} == {'a|', 'c|'}
+
+
+class TestGraphView(TestYoutube):
+
+    def setUp(self):
+        super(TestGraphView, self).setUp()
+        self.app.register_blueprint(graph_bp)
+        now = datetime.datetime.utcnow()
+        self.session.add_all([Channel(id='id_1', title='Host Channel', processed=True, refreshed_at=now),
+                              Channel(id='id_2', title='Guest Channel', processed=True, refreshed_at=now),
+                              Channel(id='id_3', title='Other Channel')])
+        CollaborationEdge.increment({('id_1', 'id_2'): 2, ('id_2', 'id_3'): 1})
+        self.session.commit()
+
+    def render(self, query_string):
+        with patch('src.views.graph.render_template', return_value='') as patch_render:
+            self.app.test_client().get('/', query_string=query_string)
+        return patch_render.call_args.kwargs
+
+    def test_links_use_title_for_every_spelling(self):
+        for name in ['host channel', 'Host Channel']:
+            page = self.render({'channel': name})
+            assert page['chart_title'] == 'Host Channel'
+            urls = [node['url'] for node in page['collab_data']['nodes']]
+            assert urls and all(url.endswith('previous_channel=Host%20Channel') for url in urls), urls
+        assert self.session.query(GraphCache).count() == 1
+
+    def test_previous_channel_matched_as_target_is(self):
+        page = self.render({'channel': 'Guest Channel', 'previous_channel': 'host channel'})
+        assert page['chart_title'] == 'Guest Channel & Host Channel'
+        assert self.session.query(GraphCache.key).scalar() == 'id_2|id_1'
@@ -0,0 +1,113 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from requests import HTTPError
+
+from src import config
+from src.controllers import http_client
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    """Stub server. Responds with each of the scripted (status, headers) in turn, then 200"""
+    protocol_version = 'HTTP/1.1'  # Allows keep-alive
+    client_ports = []
+    script = []
+
+    def do_GET(self):
+        self.client_ports.append(self.client_address[1])
+        status, headers = self.script.pop(0) if self.script else (200, {})
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient(TestCase):
+
+    def setUp(self):
+        RecordingHandler.client_ports = []
+        RecordingHandler.script = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RecordingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        for _ in range(5):
+            assert http_client.get(self.url).status_code == 200
+        assert len(RecordingHandler.client_ports) == 5
+        assert len(set(RecordingHandler.client_ports)) == 1
+
+    def test_default_timeout(self):
+        with patch.object(http_client.session, 'get') as patch_get:
+            http_client.get(self.url, params={'a': 'b'})
+            http_client.get(self.url, timeout=1)
+        assert patch_get.call_args_list[0].kwargs == {'params': {'a': 'b'}, 'timeout': (config.http_connect_timeout, config.http_read_timeout)}
+        assert patch_get.call_args_list[1].kwargs == {'timeout': 1}
+
+    @patch('src.controllers.http_client.time.sleep')
+    def test_retry_transient_statuses(self, patch_sleep):
+        RecordingHandler.script = [(503, {}), (429, {'Retry-After': '7'}), (500, {})]
+        assert http_client.get(self.url).status_code == 200
+        assert len(RecordingHandler.client_ports) == 4
+        delays = [c.args[0] for c in patch_sleep.call_args_list]
+        assert 0 <= delays[0] <= config.http_backoff_base
+        assert delays[1] == 7
+        assert 0 <= delays[2] <= config.http_backoff_base * 4
+
+    @patch('src.controllers.http_client.time.sleep')
+    def test_no_retry_for_client_errors(self, patch_sleep):
+        RecordingHandler.script = [(404, {}), (503, {})]
+        assert http_client.get(self.url).status_code == 404
+        assert patch_sleep.call_count == 0
+
+    @patch('src.controllers.http_client.time.sleep')
+    def test_retries_run_out(self, patch_sleep):
+        RecordingHandler.script = [(502, {})] * (config.http_max_retries + 2)
+        assert http_client.get(self.url).status_code == 502
+        assert len(RecordingHandler.client_ports) == config.http_max_retries + 1
+
+    @patch('src.controllers.http_client.time.sleep')
+    def test_connection_errors_raise_after_retries(self, patch_sleep):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(HTTPError):
+            http_client.get(self.url)
+        assert patch_sleep.call_count == config.http_max_retries
+
+    @patch('src.controllers.http_client.time.sleep')
+    def test_retry_budget_shared_by_crawl(self, patch_sleep):
+        RecordingHandler.script = [(503, {})] * 2
+        with http_client.crawl_retry_budget(3) as budget:
+            assert http_client.get(self.url).status_code == 200
+            RecordingHandler.script = [(503, {})] * 10
+            assert http_client.get(self.url).status_code == 503
+        assert budget.remaining == 0
+        assert patch_sleep.call_count == 3
+        assert http_client.retry_budget.get() is None
+
+    def test_retry_delay_capped(self):
+        response = MagicMock(headers={'Retry-After': '3600'})
+        assert http_client.get_retry_delay(1, response) == config.http_backoff_max
+        response = MagicMock(headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        assert http_client.get_retry_delay(1, response) == 0
+        assert 0 <= http_client.get_retry_delay(20) <= config.http_backoff_max
+
+    def test_retry_delay_malformed_header(self):
+        assert http_client.get_retry_delay(1, MagicMock(headers={'Retry-After': '1.5'})) == 1.5
+        for retry_after in ['soon', '-', 'nan', 'Wed, 99 Foo 2015']:
+            delay = http_client.get_retry_delay(3, MagicMock(headers={'Retry-After': retry_after}))
+            assert 0 <= delay <= config.http_backoff_base * 4, retry_after
+        # A naive date is taken as UTC
+        response = MagicMock(headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 -0000'})
+        assert http_client.get_retry_delay(1, response) == 0
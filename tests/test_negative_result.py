@@ -0,0 +1,101 @@
+import datetime
+from unittest.mock import patch, MagicMock
+
+from requests import HTTPError
+
+from src.controllers.url_resolver import ResolvedUrl
+from src.models.channel import Channel
+from src.models.negative_result import NegativeResult
+from src.models.search import SearchResult
+from tests.base_testcase import TestYoutube
+
+
+def not_found(message='API responded with no items'):
+    return HTTPError(message, response=MagicMock(status_code=200))
+
+
+class TestNegativeResult(TestYoutube):
+
+    def test_known(self):
+        NegativeResult.add(NegativeResult.URL, {'DeadUrl': 'Request responded with 404'})
+        NegativeResult.add(NegativeResult.VIDEO, {'deleted_id': 'API responded with no items'})
+        assert NegativeResult.known(NegativeResult.URL, {'deadurl', 'LiveUrl'}) == {'deadurl'}
+        assert NegativeResult.is_known(NegativeResult.VIDEO, 'deleted_id')
+        assert not NegativeResult.is_known(NegativeResult.VIDEO, 'DELETED_ID')
+        assert not NegativeResult.is_known(NegativeResult.SEARCH, 'deleted_id')
+        assert NegativeResult.known(NegativeResult.URL, set()) == set()
+
+    def test_expired_results_forgotten(self):
+        NegativeResult.add(NegativeResult.USERNAME, {'gone': 'API responded with no items'})
+        self.session.query(NegativeResult).update({NegativeResult.expires_at: datetime.datetime.utcnow()})
+        self.session.commit()
+        assert not NegativeResult.is_known(NegativeResult.USERNAME, 'gone')
+
+        NegativeResult.add(NegativeResult.USERNAME, {'other': 'API responded with no items'})
+        assert [r.key for r in self.session.query(NegativeResult)] == ['other']
+
+    @patch('src.models.negative_result.config.negative_cache_size', 3)
+    def test_size_bound(self):
+        for i in range(5):
+            with patch('src.models.negative_result.config.negative_cache_ttl_hours', i + 1):
+                NegativeResult.add(NegativeResult.SEARCH, {f'term_{i}': 'API responded with no items'})
+        assert {r.key for r in self.session.query(NegativeResult)} == {'term_2', 'term_3', 'term_4'}
+
+    def test_purge(self):
+        NegativeResult.add(NegativeResult.URL, {'a': 'reason', 'b': 'reason'})
+        NegativeResult.add(NegativeResult.VIDEO, {'c': 'reason'})
+        assert NegativeResult.purge(NegativeResult.URL) == 2
+        assert NegativeResult.known(NegativeResult.VIDEO, {'c'}) == {'c'}
+        assert NegativeResult.purge() == 1
+
+    def test_unknown_username_not_requested_again(self):
+        with patch('src.models.channel.Channel.get', side_effect=not_found()) as patch_get:
+            for _ in range(2):
+                try:
+                    Channel.from_username('Gone')
+                    assert False, "Expected HTTPError"
+                except HTTPError:
+                    pass
+        assert patch_get.call_count == 1
+        assert NegativeResult.is_known(NegativeResult.USERNAME, 'gone')
+
+    def test_transient_failure_not_remembered(self):
+        with patch('src.models.search.SearchResult.get', side_effect=HTTPError('Request failed after 5 attempts')) as patch_get:
+            for _ in range(2):
+                try:
+                    SearchResult.from_term('Halocene')
+                    assert False, "Expected HTTPError"
+                except HTTPError:
+                    pass
+        assert patch_get.call_count == 2
+        assert not NegativeResult.is_known(NegativeResult.SEARCH, 'Halocene')
+
+    @patch('src.models.channel.url_resolver.resolve_urls')
+    def test_unresolvable_url_not_visited_again(self, patch_resolve):
+        patch_resolve.side_effect = lambda urls: ({}, {url: not_found(f'Could not find og:url meta tag for url {url}') for url in urls})
+        channels, failed = Channel.resolve_urls({'DeadUrl'})
+        assert channels == {} and failed.keys() == {'DeadUrl'}
+
+        channels, failed = Channel.resolve_urls({'DEADURL'})
+        assert channels == {} and failed.keys() == {'DEADURL'}
+        assert patch_resolve.call_count == 2
+        assert patch_resolve.call_args.args == (set(),)
+
+    @patch('src.models.channel.Channel.get')
+    @patch('src.models.channel.url_resolver.resolve_urls')
+    def test_url_to_missing_channel_not_visited_again(self, patch_resolve, patch_get):
+        patch_resolve.side_effect = lambda urls: ({url: ResolvedUrl('UC_deleted', False) for url in urls}, {})
+        patch_get.side_effect = not_found()
+        for _ in range(2):
+            channels, failed = Channel.resolve_urls({'DeletedChannel'})
+            assert channels == {} and failed.keys() == {'DeletedChannel'}
+        assert patch_resolve.call_count == 2
+        assert patch_resolve.call_args.args == (set(),)
+
+    @patch('src.models.channel.Channel.get', side_effect=HTTPError('Request failed after 5 attempts'))
+    @patch('src.models.channel.url_resolver.resolve_urls')
+    def test_url_to_unfetched_channel_not_remembered(self, patch_resolve, patch_get):
+        patch_resolve.return_value = {'VioletOrlandi': ResolvedUrl('UC_1', False)}, {}
+        channels, failed = Channel.resolve_urls({'VioletOrlandi'})
+        assert str(failed['VioletOrlandi']) == 'Request failed after 5 attempts'
+        assert not NegativeResult.is_known(NegativeResult.URL, 'VioletOrlandi')
@@ -0,0 +1,184 @@
+import datetime
+from unittest.mock import patch, MagicMock
+
+from sqlalchemy import event
+
+from src.controllers import get_collaborations, title_index
+from src.controllers.exceptions import ChannelNotFoundException
+from src.controllers.title_index import TitleIndex
+from src.models.channel import Channel
+from tests.base_testcase import TestYoutube
+
+
+class TestTitleIndex(TestYoutube):
+
+    def test_longest_match(self):
+        index = TitleIndex()
+        index.add({'Halocene': 'id_1', 'Violet Orlandi': 'id_2', 'Violet': 'id_3', 'Lauren  Babic': 'id_4'})
+
+        assert index.longest_match('Halocene ft.') == 'id_1'
+        assert index.longest_match('Violet Orlandi & Friends') == 'id_2'
+        assert index.longest_match('Violet Orl') == 'id_3'
+        assert index.longest_match('violet orlandi') is None
+        assert index.longest_match('Lauren Babic') is None  # Titles with other whitespace can't be spelled by a tag
+        assert index.longest_match('') is None
+
+    def test_add_keeps_first_channel(self):
+        index = TitleIndex()
+        index.add({'Halocene': 'id_1'})
+        index.add({'Halocene': 'id_2', 'Halocene Live': 'id_3'})
+        assert index.longest_match('Halocene') == 'id_1'
+        assert index.longest_match('Halocene Live') == 'id_3'
+
+    def test_get_index_loads_and_refreshes(self):
+        self.session.add(Channel(id='id_1', title='Halocene'))
+        self.session.commit()
+
+        index = title_index.get_index()
+        assert index.longest_match('Halocene ft.') == 'id_1'
+        self.session.add(Channel(id='id_2', title='Violet Orlandi'))
+        self.session.commit()
+        assert title_index.get_index() is index
+        assert index.longest_match('Violet Orlandi') is None
+
+        index.loaded_at -= datetime.timedelta(minutes=60)
+        assert title_index.get_index() is index
+        # The rebuild holds the load lock until the new index is swapped in
+        with title_index._load_lock:
+            assert title_index.get_index().longest_match('Violet Orlandi') == 'id_2'
+
+    def test_stale_index_served_while_rebuilt(self):
+        index = title_index.get_index()
+        index.loaded_at -= datetime.timedelta(minutes=60)
+        with title_index._load_lock:  # As held by a rebuild in progress
+            assert title_index.get_index() is index
+        assert title_index.get_index() is index
+        with title_index._load_lock:
+            assert title_index.get_index() is not index
+
+
+class TestNormalisedTitles(TestYoutube):
+
+    def setUp(self):
+        super(TestNormalisedTitles, self).setUp()
+        self.index = TitleIndex()
+        self.index.add({'Violet Orlandi': 'id_1', 'Halocene': 'id_2', 'Lauren Babic': 'id_3', 'Lauren Babik': 'id_4'})
+
+    def test_normalise(self):
+        assert title_index.normalise('Violet  Orlandi!') == 'violet orlandi'
+        assert title_index.normalise('ＶＩＯＬＥＴ ORLANDI') == 'violet orlandi'
+        assert title_index.normalise('Straße_Band') == 'strasse band'
+        assert title_index.normalise('♥ ♥') == ''
+        assert title_index.trigrams('cat') == {'  c', ' ca', 'cat', 'at '}
+
+    def test_closest_variants_and_typos(self):
+        assert self.index.closest('violet orlandi') == 'id_1'
+        assert self.index.closest('Violet-Orlandi') == 'id_1'
+        assert self.index.normalised_match('HALOCENE') == 'id_2'
+        assert self.index.closest('Violet Orlandy') == 'id_1'
+        assert self.index.closest('Halocen') == 'id_2'
+        assert self.index.normalised_match('Halocen') is None
+
+    def test_closest_rejects_distant_and_ambiguous_titles(self):
+        assert self.index.closest('Violet') is None
+        assert self.index.closest('Lauren Babi') is None  # As close to 2 different channels
+        assert self.index.closest('Lauren babic') == 'id_3'
+        assert self.index.closest('!!') is None
+
+    def test_search_results_are_only_normalised(self):
+        self.index.add_normalised({'Lollia': 'id_5'})
+        assert self.index.closest('lollia') == 'id_5'
+        assert self.index.longest_match('Lollia') is None
+
+    def test_shared_normalised_title_isnt_matched(self):
+        self.index.add_normalised({'HALOCENE': 'id_5'})
+        assert self.index.normalised_match('halocene') is None
+        assert self.index.closest('Halocene') is None
+
+
+class TestTargetChannelTitles(TestYoutube):
+
+    def setUp(self):
+        super(TestTargetChannelTitles, self).setUp()
+        self.session.add_all([Channel(id='id_1', title='Violet Orlandi'), Channel(id='id_2', title='Halocene')])
+        self.session.commit()
+        # Searches find the channel titled as searched, if there is one, and the channels indexed above
+        self.api_channels = {'id_1': 'Violet Orlandi', 'id_2': 'Halocene', 'id_5': 'Violeta Orlandi'}
+
+        def api(endpoint, params):
+            if endpoint == 'search':
+                ids = [i for i, title in self.api_channels.items() if title == params['q'] or i in ('id_1', 'id_2')]
+                return [{'id': {'channelId': i}, 'snippet': {'title': self.api_channels[i]}} for i in ids], None
+            return [{'id': params['id'], 'snippet': {'title': self.api_channels[params['id']], 'thumbnails': {}},
+                     'contentDetails': {'relatedPlaylists': {'uploads': 'uploads'}}}], None
+
+        patcher = patch('src.models.youtube_object.YoutubeObject.get', side_effect=api)
+        self.api = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_spelling_variants_found_without_search(self):
+        assert get_collaborations.get_target_channel('violet orlandi').id == 'id_1'
+        assert get_collaborations.get_target_channel('HALOCENE!', cache_only=True).id == 'id_2'
+        self.api.assert_not_called()
+
+    def test_similar_channel_is_searched(self):
+        assert get_collaborations.get_target_channel('Violeta Orlandi').id == 'id_5'
+        assert [c.args[0] for c in self.api.call_args_list] == ['search', 'channels']
+
+    def test_typo_matched_after_search(self):
+        with self.assertRaises(ChannelNotFoundException):
+            get_collaborations.get_target_channel('Violet Orlandy', cache_only=True)
+        self.api.assert_not_called()
+
+        assert get_collaborations.get_target_channel('Violet Orlandy').id == 'id_1'
+        assert [c.args[0] for c in self.api.call_args_list] == ['search']
+        # The search is cached, so the typo now resolves from the cache
+        assert get_collaborations.get_target_channel('Violet Orlandy', cache_only=True).id == 'id_1'
+
+
+class TestChannelsFromTitles(TestYoutube):
+
+    def setUp(self):
+        super(TestChannelsFromTitles, self).setUp()
+        self.session.add_all([Channel(id='id_1', title='Halocene'), Channel(id='id_2', title='Violet Orlandi')])
+        self.session.commit()
+        title_index.get_index()
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: self.statements.append(args[2]))
+
+    @patch('src.controllers.get_collaborations.SearchResult.from_term')
+    def test_indexed_titles_skip_lookups(self, from_term):
+        video = MagicMock(id='video_1')
+        video.get_collaborators_from_title.return_value = {'Halocene ft.', 'Violet Orlandi'}
+
+        channels = get_collaborations.get_channels_from_titles([video])
+
+        assert {c.id for c in channels['video_1']} == {'id_1', 'id_2'}
+        # Only the matched channels are loaded. No titles or searches are looked up.
+        assert len(self.statements) == 1, self.statements
+        assert not any('channel.title IN' in s for s in self.statements)
+        from_term.assert_not_called()
+
+    @patch('src.controllers.get_collaborations.SearchResult.from_term')
+    def test_channels_cached_elsewhere_are_found_and_indexed(self, from_term):
+        # Cached by another process, after the index was loaded
+        self.session.add(Channel(id='id_3', title='Lollia'))
+        self.session.commit()
+        video = MagicMock(id='video_1')
+        video.get_collaborators_from_title.return_value = {'Lollia'}
+
+        channels = get_collaborations.get_channels_from_titles([video])
+
+        assert {c.id for c in channels['video_1']} == {'id_3'}
+        assert title_index.get_index().longest_match('Lollia') == 'id_3'
+        from_term.assert_not_called()
+
+    @patch('src.controllers.get_collaborations.SearchResult.from_term')
+    def test_case_variants_skip_search(self, from_term):
+        video = MagicMock(id='video_1')
+        video.get_collaborators_from_title.return_value = {'violet orlandi ft.', 'HALOCENE'}
+
+        channels = get_collaborations.get_channels_from_titles([video])
+
+        assert {c.id for c in channels['video_1']} == {'id_1', 'id_2'}
+        from_term.assert_not_called()
@@ -0,0 +1,57 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from requests import HTTPError
+
+from src.controllers import url_resolver
+from src.controllers.url_resolver import ResolvedUrl
+
+
+def streamed_response(chunks, url='https://www.youtube.com/c/VioletOrlandi', status_code=200):
+    response = MagicMock(url=url, status_code=status_code)
+    response.iter_content.return_value = iter(chunks)
+    return response
+
+
+class TestUrlResolver(TestCase):
+
+    def test_read_head_stops_at_head_end(self):
+        response = streamed_response([b'<html><head><title>a</title></he', b'ad><body>', b'never read'])
+        assert url_resolver.read_head(response) == b'<html><head><title>a</title></head>'
+        assert response.close.call_count == 1
+
+    def test_read_head_without_head_end(self):
+        response = streamed_response([b'<html>', b'<body>'])
+        assert url_resolver.read_head(response) == b'<html><body>'
+        assert response.close.call_count == 1
+
+    def test_find_og_url(self):
+        assert url_resolver.find_og_url(b'<meta property="og:url" content="https://www.youtube.com/channel/123">') == \
+            'https://www.youtube.com/channel/123'
+        assert url_resolver.find_og_url(b"<META content='https://www.youtube.com/channel/123' property='og:url' />") == \
+            'https://www.youtube.com/channel/123'
+        assert url_resolver.find_og_url(b'<meta property="og:title" content="Violet Orlandi">') is None
+
+    @patch('src.controllers.url_resolver.http_client.get')
+    def test_resolve_url(self, patch_get):
+        patch_get.return_value = streamed_response([b'<head><meta property="og:url" content="https://www.youtube.com/channel/123"></head>'])
+        assert url_resolver.resolve_url('VioletOrlandi') == ResolvedUrl('123', False)
+        assert patch_get.call_args.kwargs['stream'] is True
+
+    @patch('src.controllers.url_resolver.http_client.get')
+    def test_resolve_url_username(self, patch_get):
+        patch_get.return_value = streamed_response([b'<head></head>'], url='https://www.youtube.com/user/violetorlandi')
+        assert url_resolver.resolve_url('VioletOrlandi') == ResolvedUrl('violetorlandi', True)
+
+    @patch('src.controllers.url_resolver.http_client.get')
+    def test_resolve_urls_collects_failures(self, patch_get):
+        pages = {
+            url_resolver.YOUTUBE_URL + 'found': streamed_response([b'<head><meta property="og:url" content="/channel/123"></head>']),
+            url_resolver.YOUTUBE_URL + 'missing': streamed_response([], status_code=404),
+            url_resolver.YOUTUBE_URL + 'no_tag': streamed_response([b'<head></head>']),
+        }
+        patch_get.side_effect = lambda url, **kwargs: pages[url]
+        resolved, failed = url_resolver.resolve_urls({'found', 'missing', 'no_tag'})
+        assert resolved == {'found': ResolvedUrl('123', False)}
+        assert failed.keys() == {'missing', 'no_tag'}
+        assert all(isinstance(err, HTTPError) for err in failed.values())
@@ -1,9 +1,20 @@
 import datetime
+import json
 from unittest.mock import patch, call, MagicMock
 
 import responses
+from sqlalchemy import event
+from requests import HTTPError
 
+from src.controllers import link_extractor
+from src.controllers.link_extractor import Link
+from src.models import youtube_object
+from src.models.channel import Channel
+from src.models.playlist_etag import PlaylistETag
 from src.models.video import Video
+from src.models.video_link import VideoLink
+from src.models.video_processed_for import VideoProcessedFor
+from src.models.youtube_object import MAX_RESULTS
 from tests.base_testcase import TestYoutube
 
 
@@ -212,3 +223,272 @@ class TestVideo(TestYoutube):
         assert patch_commit.call_count == 1
         assert patch_logger.warning.call_args_list[0] == call('Tried to cache video id_1 when it already exists')
         assert len(uploads) == 3
+
+
+class TestVideoDescriptionLinks(TestYoutube):
+
+    def test_get_urls_from_end_of_description(self):
+        video = Video(id='id', description="Also on https://www.youtube.com/playlist?list=PL1 and https://www.youtube.com/VioletOrlandi")
+        assert video.get_urls_from_description() == {'VioletOrlandi'}
+
+    def test_get_video_ids_with_other_parameters(self):
+        video = Video(id='id', description="https://www.youtube.com/watch?feature=share&v=53XW1xxmmuM&t=10")
+        assert video.get_video_ids_from_description() == {'53XW1xxmmuM'}
+
+    def test_extract_links_single_pass(self):
+        description = """https://www.youtube.com/channel/UCo3AxjxePfj6DHn03aiIhww https://www.youtube.com/user/VioletaOrlandi
+        https://www.youtube.com/c/VioletOrlandi https://youtu.be/53XW1xxmmuM https://www.youtube.com/feed/trending"""
+        assert link_extractor.extract_links(description) == {
+            Link(link_extractor.CHANNEL_ID, 'UCo3AxjxePfj6DHn03aiIhww'), Link(link_extractor.USERNAME, 'VioletaOrlandi'),
+            Link(link_extractor.URL, 'VioletOrlandi'), Link(link_extractor.VIDEO_ID, '53XW1xxmmuM')}
+
+    def test_extract_links_skips_site_pages(self):
+        description = """https://www.youtube.com/subscription_center?add_user=VioletaOrlandi https://www.youtube.com/about/
+        https://www.youtube.com/yt/creators https://music.youtube.com/ https://www.youtube.com/Halocene"""
+        assert link_extractor.extract_links(description) == {
+            Link(link_extractor.USERNAME, 'VioletaOrlandi'), Link(link_extractor.URL, 'Halocene')}
+
+
+class TestVideoTitleTags(TestYoutube):
+
+    def test_extract_title_tags(self):
+        title = 'Somebody to love live @ Wembley (Cover with @Violet Orlandi, @Halocene ft. @Lauren Babic)'
+        assert link_extractor.extract_title_tags(title) == {'Violet Orlandi', 'Halocene ft.', 'Lauren Babic'}
+        assert link_extractor.extract_title_tags('Beat it - Micheal Jackson cover') == set()
+
+    def test_parsing_title_doesnt_modify_video(self):
+        title = 'Crocodile Rock (@Halocene, @Lollia)'
+        self.session.add(Video(id='id', channel_id='channel', title=title, description='', published_at=datetime.datetime.now()))
+        self.session.commit()
+        flushes = []
+        event.listen(self.session(), 'before_flush', lambda *args: flushes.append(args))
+
+        video = self.session.get(Video, 'id')
+        assert video.get_collaborators_from_title() == {'Halocene', 'Lollia'}
+        assert video.title == title
+        assert not self.session.dirty
+        self.session.commit()
+        assert flushes == []
+
+
+class TestVideoFromIds(TestYoutube):
+
+    def setUp(self):
+        super(TestVideoFromIds, self).setUp()
+        self.session.add(Video(id='cached_id', channel_id='channel_id', title='title', description='description',
+                               published_at=datetime.datetime(1970, 1, 1)))
+        self.session.commit()
+
+    @staticmethod
+    def api_item(video_id):
+        return {
+            "id": video_id,
+            "snippet": {
+                "channelId": "api_channel_id",
+                "title": "api_title",
+                "description": "api_description",
+                "thumbnails": {"medium": {"url": "thumb"}},
+                "publishedAt": "2020-01-01T06:30:45Z"
+            }
+        }
+
+    def test_from_cache_only(self):
+        with patch('src.models.video.Video.get') as patch_get:
+            videos = Video.from_ids({'cached_id', 'unknown_id'}, cache_only=True)
+        assert set(videos) == {'cached_id'}
+        assert patch_get.call_count == 0
+
+    def test_empty_ids(self):
+        assert Video.from_ids(set()) == {}
+
+    def test_misses_batched_from_api(self):
+        ids = {f'id_{i:03}' for i in range(120)}
+
+        def side_effect(endpoint, params):
+            return [self.api_item(i) for i in params['id'].split(',')], None
+
+        with patch('src.models.video.Video.get', side_effect=side_effect) as patch_get:
+            videos = Video.from_ids(ids | {'cached_id'})
+        assert set(videos) == ids | {'cached_id'}
+        assert patch_get.call_count == 3
+        assert [len(c.args[1]['id'].split(',')) for c in patch_get.call_args_list] == [50, 50, 20]
+        assert all('cached_id' not in c.args[1]['id'] for c in patch_get.call_args_list)
+        assert videos['id_000'].published_at == datetime.datetime(2020, 1, 1, 6, 30, 45)
+
+    @patch('src.models.video.logger')
+    def test_failed_batch_is_skipped(self, patch_logger):
+        with patch('src.models.video.Video.get', side_effect=HTTPError('API responded with no items')):
+            videos = Video.from_ids({'cached_id', 'deleted_id'})
+        assert set(videos) == {'cached_id'}
+        assert patch_logger.error.call_args_list[0] == call("Failed processing video IDs '['deleted_id']' - API responded with no items")
+
+    @patch('src.models.video.logger')
+    def test_deleted_ids_not_requested_again(self, patch_logger):
+        def side_effect(endpoint, params):
+            return [self.api_item(i) for i in params['id'].split(',') if i != 'deleted_id'], None
+
+        with patch('src.models.video.Video.get', side_effect=side_effect) as patch_get:
+            assert set(Video.from_ids({'new_id', 'deleted_id'})) == {'new_id'}
+            assert set(Video.from_ids({'new_id', 'deleted_id'})) == {'new_id'}
+        assert [c.args[1]['id'] for c in patch_get.call_args_list] == ['deleted_id,new_id', 'new_id']
+
+
+class TestVideoProcessedFor(TestYoutube):
+
+    def setUp(self):
+        super(TestVideoProcessedFor, self).setUp()
+        self.channels = [Channel(id=f'id_{i}', title=f'title_{i}', uploads_id=f'uploads_{i}', processed=True) for i in range(2)]
+        self.session.add_all(self.channels)
+        self.session.add_all([Video(id=f'video_{i}', channel_id='id_0', title='title', description='',
+                                    published_at=datetime.datetime(2020, 1, i + 1)) for i in range(3)])
+        self.session.commit()
+
+    def processed(self):
+        return {(p.video_id, p.channel_id) for p in self.session.query(VideoProcessedFor)}
+
+    def test_mark_processed(self):
+        Video.mark_processed({'video_0', 'video_1'}, self.channels[0])
+        Video.mark_processed({'video_1'}, self.channels[0])
+        self.session.commit()
+        assert self.processed() == {('video_0', 'id_0'), ('video_1', 'id_0')}
+        assert all(v.processed_for is None for v in self.session.query(Video))
+
+    @patch('src.models.video.Video.get_page', return_value=([], None, None))
+    def test_from_channel_omits_processed(self, patch_get):
+        Video.mark_processed({'video_1'}, self.channels[0])
+        Video.mark_processed({'video_2'}, self.channels[1])
+        self.session.commit()
+        videos = Video.from_channel(self.channels[0])
+        assert [v.id for v in videos] == ['video_2', 'video_0']
+
+    def test_migrate_processed_for(self):
+        self.session.get(Video, 'video_0').processed_for = '|id_0|id_1|id_0'
+        self.session.get(Video, 'video_1').processed_for = '|id_1'
+        self.session.commit()
+        Video.mark_processed({'video_1'}, self.channels[1])
+        self.session.commit()
+
+        Video.migrate_processed_for(batch_size=1)
+        assert self.processed() == {('video_0', 'id_0'), ('video_0', 'id_1'), ('video_1', 'id_1')}
+        assert all(v.processed_for is None for v in self.session.query(Video))
+
+
+class TestVideoFromChannelETag(TestYoutube):
+    playlist_url = 'https://www.googleapis.com/youtube/v3/playlistItems'
+
+    def setUp(self):
+        super(TestVideoFromChannelETag, self).setUp()
+        youtube_object.api_keys = ['KeyOne']
+        self.channel = Channel(id='channel_id', title='title', uploads_id='uploads_id')
+        self.session.add(self.channel)
+        self.session.commit()
+        self.uploads = []
+        self.if_none_match = []
+
+    def playlist_callback(self, request):
+        # Responds like the API, with 304 if the ETag sent matches the current uploads
+        etag = f'"etag-{len(self.uploads)}"'
+        self.if_none_match.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, ''
+        items = [{"snippet": {"resourceId": {"videoId": video_id}, "channelId": "channel_id", "title": "title", "description": "",
+                              "thumbnails": {}, "publishedAt": "2020-01-01T06:30:45Z"}} for video_id in reversed(self.uploads)]
+        return 200, {'ETag': etag}, json.dumps({'items': items})
+
+    @responses.activate
+    def test_unchanged_playlist_not_fetched(self):
+        responses.add_callback(responses.GET, self.playlist_url, callback=self.playlist_callback)
+        self.uploads = ['video_1', 'video_2']
+        assert {v.id for v in Video.from_channel(self.channel)} == {'video_1', 'video_2'}
+        assert PlaylistETag.for_playlist('uploads_id') == '"etag-2"'
+
+        # Unchanged, so the API responds 304 and the cached videos are used
+        assert {v.id for v in Video.from_channel(self.channel)} == {'video_1', 'video_2'}
+
+        # A new upload changes the ETag, so the page is fetched again
+        self.uploads.append('video_3')
+        assert {v.id for v in Video.from_channel(self.channel)} == {'video_1', 'video_2', 'video_3'}
+        assert PlaylistETag.for_playlist('uploads_id') == '"etag-3"'
+        assert self.if_none_match == [None, '"etag-2"', '"etag-2"']
+        assert self.session.query(Video).count() == 3
+
+    @responses.activate
+    def test_etag_not_sent_without_cached_videos(self):
+        responses.add_callback(responses.GET, self.playlist_url, callback=self.playlist_callback)
+        self.uploads = ['video_1']
+        self.session.add(PlaylistETag(playlist_id='uploads_id', etag='"etag-1"'))
+        self.session.commit()
+        assert [v.id for v in Video.from_channel(self.channel)] == ['video_1']
+        assert self.if_none_match == [None]
+
+
+class TestVideoCacheUploads(TestYoutube):
+
+    def setUp(self):
+        super(TestVideoCacheUploads, self).setUp()
+        self.channel = Channel(id='channel_id', title='title', uploads_id='uploads_id')
+        self.session.add(self.channel)
+        self.session.commit()
+
+    @staticmethod
+    def playlist_item(i):
+        return {"snippet": {"resourceId": {"videoId": f"id_{i:03}"}, "channelId": "channel_id", "title": f"title_{i}", "description": "",
+                            "thumbnails": {"medium": {"url": "thumb"}}, "publishedAt": f"2020-01-01T06:{i // 60:02}:{i % 60:02}Z"}}
+
+    def playlist(self, order):
+        # Pages of 50, like the uploads playlist
+        items = [self.playlist_item(i) for i in order]
+        pages = [items[idx:idx + MAX_RESULTS] for idx in range(0, len(items), MAX_RESULTS)]
+
+        def side_effect(endpoint, params, etag=None):
+            page = int(params.get('pageToken', 0))
+            return pages[page], str(page + 1) if page + 1 < len(pages) else None, None
+        return side_effect
+
+    def test_single_insert_per_page(self):
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        with patch('src.models.video.Video.get_page', side_effect=self.playlist(range(119, -1, -1))) as patch_get:
+            ids = Video.ids_from_channel(self.channel)
+        assert patch_get.call_count == 3
+        assert len([s for s in statements if s.startswith('INSERT INTO video ')]) == 3
+        assert ids == [f'id_{i:03}' for i in range(119, -1, -1)]
+        video = self.session.get(Video, 'id_061')
+        assert video.published_at == datetime.datetime(2020, 1, 1, 6, 1, 1)
+        assert video.thumbnail_url == 'thumb'
+
+    def test_links_stored_with_videos(self):
+        def side_effect(endpoint, params, etag=None):
+            items = [self.playlist_item(i) for i in range(2)]
+            items[0]['snippet']['description'] = "https://www.youtube.com/channel/UC1 https://youtu.be/53XW1xxmmuM"
+            return items, None, None
+
+        with patch('src.models.video.Video.get_page', side_effect=side_effect):
+            Video.cache_uploads(self.channel)
+        videos = list(Video.from_ids({'id_000', 'id_001'}, cache_only=True).values())
+        assert all(v.links_extracted for v in videos)
+        with patch('src.models.video.link_extractor.extract_links') as patch_extract:
+            links = Video.links_for(videos)
+        assert patch_extract.call_count == 0
+        assert links == {'id_000': {Link(link_extractor.CHANNEL_ID, 'UC1'), Link(link_extractor.VIDEO_ID, '53XW1xxmmuM')}, 'id_001': set()}
+
+    def test_links_extracted_for_videos_cached_before_links_were_stored(self):
+        self.session.add(Video(id='old_id', channel_id='channel_id', title='title', description='https://www.youtube.com/user/joeyizzo',
+                               published_at=datetime.datetime(2020, 1, 1)))
+        self.session.commit()
+        video = self.session.get(Video, 'old_id')
+        assert Video.links_for([video]) == {'old_id': {Link(link_extractor.USERNAME, 'joeyizzo')}}
+        self.session.commit()
+        self.session.expire_all()
+        assert self.session.get(Video, 'old_id').links_extracted
+        assert VideoLink.for_videos({'old_id'}) == {'old_id': {Link(link_extractor.USERNAME, 'joeyizzo')}}
+
+    def test_stops_at_latest_cached_video(self):
+        with patch('src.models.video.Video.get_page', side_effect=self.playlist(range(99, -1, -1))):
+            Video.cache_uploads(self.channel)
+        # The newest cached video is on the second page, and an older cached video is out of order on the first
+        order = [150, 98] + list(range(149, -1, -1))
+        with patch('src.models.video.Video.get_page', side_effect=self.playlist(order)) as patch_get:
+            ids = Video.ids_from_channel(self.channel)
+        assert patch_get.call_count == 2
+        assert ids == [f'id_{i:03}' for i in range(150, -1, -1)]
@@ -1,4 +1,3 @@
-from unittest import TestCase
 from unittest.mock import patch, call
 
 import responses
@@ -6,15 +5,18 @@ from requests import HTTPError
 
 from src.controllers.exceptions import YoutubeAuthenticationException
 from src.models import youtube_object
+from src.models.api_key_quota import ApiKeyQuota
 from src.models.youtube_object import YoutubeObject
+from tests.base_testcase import TestYoutube
 
 
-class TestYoutubeObject(TestCase):
+class TestYoutubeObject(TestYoutube):
     response_items = [
         {"name": "mock-name_1"},
         {"name": "mock-name_2"},
         {"name": "mock-name_3"},
     ]
+    quota_error = {"error": {"code": 403, "errors": [{"reason": "quotaExceeded", "domain": "youtube.quota"}]}}
 
     @responses.activate
     @patch('src.models.youtube_object.logger')
@@ -27,7 +29,7 @@ class TestYoutubeObject(TestCase):
         items, next_page = YoutubeObject.get('mock-endpoint', {"mock_attribute": "mock_value"})
         assert items == self.response_items
         assert next_page is None
-        assert logger.debug.call_args_list[0] == call("Querying API with: 'mock-endpoint' - '{'mock_attribute': 'mock_value'}")
+        assert logger.debug.call_args_list[0] == call("Querying API with: '%s' - '%s'", 'mock-endpoint', {"mock_attribute": "mock_value"})
 
     @responses.activate
     def test_successful_call_with_pagination(self):
@@ -47,12 +49,12 @@ class TestYoutubeObject(TestCase):
     def test_failed_authentication_without_recovery(self):
         youtube_object.api_keys = ['KeyOne']
         responses.add(responses.GET, 'https://www.googleapis.com/youtube/v3/mock-endpoint',
-                      json={"err": "mock-authentication-error"},
+                      json=self.quota_error,
                       status=403)
 
         with self.assertRaises(YoutubeAuthenticationException) as err:
             YoutubeObject.get('mock-endpoint', {"mock_attribute": "mock_value"})
-        assert err.exception.args[0] == {"err": "mock-authentication-error"}
+        assert err.exception.args[0] == self.quota_error
 
     @responses.activate
     @patch('src.models.youtube_object.logger')
@@ -60,7 +62,7 @@ class TestYoutubeObject(TestCase):
         youtube_object.api_keys = ['KeyOne', 'KeyTwo']
         responses.add(responses.GET, 'https://www.googleapis.com/youtube/v3/mock-endpoint?mock_attribute=mock_value&key=KeyOne',
                       match_querystring=True,
-                      json={"err": "mock-authentication-error"},
+                      json=self.quota_error,
                       status=403)
         responses.add(responses.GET, 'https://www.googleapis.com/youtube/v3/mock-endpoint?mock_attribute=mock_value&key=KeyTwo',
                       match_querystring=True,
@@ -92,3 +94,58 @@ class TestYoutubeObject(TestCase):
         with self.assertRaises(HTTPError) as err:
             YoutubeObject.get('mock-endpoint', {"mock_attribute": "mock_value"})
         assert err.exception.args[0] == 'API responded with no items'
+
+    @responses.activate
+    def test_partial_response_fields(self):
+        youtube_object.api_keys = ['KeyOne']
+        responses.add(responses.GET, 'https://www.googleapis.com/youtube/v3/videos',
+                      json={'items': self.response_items},
+                      status=200)
+
+        YoutubeObject.get('videos', {'part': 'snippet', 'id': 'mock-id'})
+        YoutubeObject.get('videos', {'part': 'snippet', 'id': 'mock-id', 'fields': 'items/id'})
+        assert responses.calls[0].request.params['fields'] == youtube_object.FIELDS['videos']
+        assert responses.calls[1].request.params['fields'] == 'items/id'
+
+    @responses.activate
+    def test_exhausted_keys_not_reused(self):
+        youtube_object.api_keys = ['KeyOne', 'KeyTwo']
+        responses.add(responses.GET, 'https://www.googleapis.com/youtube/v3/mock-endpoint?mock_attribute=mock_value&key=KeyOne',
+                      match_querystring=True,
+                      json=self.quota_error,
+                      status=403)
+        responses.add(responses.GET, 'https://www.googleapis.com/youtube/v3/mock-endpoint?mock_attribute=mock_value&key=KeyTwo',
+                      match_querystring=True,
+                      json={"items": self.response_items},
+                      status=200)
+
+        for _ in range(3):
+            YoutubeObject.get('mock-endpoint', {"mock_attribute": "mock_value"})
+        assert [c.request.params['key'] for c in responses.calls] == ['KeyOne', 'KeyTwo', 'KeyTwo', 'KeyTwo']
+
+    @responses.activate
+    def test_all_keys_exhausted(self):
+        youtube_object.api_keys = ['KeyOne']
+        responses.add(responses.GET, 'https://www.googleapis.com/youtube/v3/mock-endpoint',
+                      json=self.quota_error,
+                      status=403)
+
+        with self.assertRaises(YoutubeAuthenticationException):
+            YoutubeObject.get('mock-endpoint', {"mock_attribute": "mock_value"})
+        with self.assertRaises(YoutubeAuthenticationException) as err:
+            YoutubeObject.get('mock-endpoint', {"mock_attribute": "mock_value"})
+        assert err.exception.args[0] == "All API keys have exhausted their quota until the next reset"
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_forbidden_without_quota_error(self):
+        youtube_object.api_keys = ['KeyOne', 'KeyTwo']
+        forbidden = {"error": {"code": 403, "errors": [{"reason": "playlistItemsNotAccessible"}]}}
+        responses.add(responses.GET, 'https://www.googleapis.com/youtube/v3/mock-endpoint', json=forbidden, status=403)
+
+        with self.assertRaises(HTTPError) as err:
+            YoutubeObject.get('mock-endpoint', {"mock_attribute": "mock_value"})
+        assert err.exception.args[0] == forbidden
+        # The key isn't rested, so it's used for the next call
+        assert ApiKeyQuota.acquire(youtube_object.api_keys, 'mock-endpoint') == 'KeyOne'
+        assert len(responses.calls) == 1